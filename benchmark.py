@@ -0,0 +1,322 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+from haversine import haversine_vector
+
+from data_postprocess import DataPostprocess
+from data_preprocesser import DataPreprocess, CONFLICT_RADIUS_KM, HISTORY_SEASON_WEIGHTS
+from main import build_model, load_warm_start
+from model.mip import BUILDER_MODES, Model
+from model.solver import SolverConfig
+from pipeline_metrics import PipelineMetrics
+
+# league sizes that reach the target gap within the default time limit, larger ones (e.g. --teams 28 34 40) only
+# measure the limit
+BENCHMARK_TEAMS = [10, 16, 22]
+RESULTS_FILE = "output/benchmark_results.json"
+BASELINE_FILE = "data/benchmark_baseline.json"
+# a timing regresses when it is this much slower than the baseline ...
+REGRESSION_THRESHOLD = 0.2
+# ... and slower by at least this many seconds, shorter differences are noise
+REGRESSION_MIN_SECONDS = 0.05
+# rough bounding box of Germany, (lat, lon)
+COORDS_LOW, COORDS_HIGH = (47.5, 6.0), (54.5, 15.0)
+# standard deviation in degrees of stadiums around the centre of their cluster
+CLUSTER_SPREAD = 0.3
+# largest offset in degrees of the second stadium of a conflict pair from the first, about 3 km
+CONFLICT_PAIR_OFFSET = 0.02
+# home advantage and share of draws of the simulated results
+HOME_ADVANTAGE = 0.3
+DRAW_SHARE = 0.25
+# timings of a benchmark record compared against the baseline
+TIMED_METRICS = ["preprocess", "build", "warm_start", "solve", "postprocess", "time_to_first_feasible",
+                 "time_to_gap"]
+# statuses of a solve that ran out of time, its solve time measures the limit rather than the solver
+TIME_LIMIT_STATUSES = ("maxTimeLimit",)
+
+
+class SyntheticLeague():
+    """
+    Synthetic league of n_teams in data_dir, written in the formats DataPreprocess reads: a stadium coordinates
+    file, the results file of the season to schedule and the results of the past seasons of HISTORY_SEASON_WEIGHTS.
+
+    Stadiums are spread uniformly ("random") or around n_clusters cities ("clustered"). Like two clubs of one city,
+    the teams of each of the n_conflict_pairs disjoint conflict pairs share a site, all other stadiums are further
+    than CONFLICT_RADIUS_KM apart. Results are drawn from a latent strength per team, so teams keep their level
+    across seasons and the rank history is consistent
+    """
+
+    def __init__(self, n_teams, data_dir, layout="random", n_conflict_pairs=1, n_clusters=3, seed=0):
+        if n_teams < 3:
+            raise ValueError("A synthetic league needs at least 3 teams")
+        if layout not in ("random", "clustered"):
+            raise ValueError(f"Unknown layout '{layout}', expected 'random' or 'clustered'")
+        if not 0 <= n_conflict_pairs <= n_teams // 2:
+            raise ValueError(f"{n_teams} teams allow between 0 and {n_teams // 2} disjoint conflict pairs")
+        self.n_teams = n_teams
+        self.data_dir = data_dir
+        self.layout = layout
+        self.n_conflict_pairs = n_conflict_pairs
+        self.n_clusters = n_clusters
+        self.random = np.random.default_rng(seed)
+        self.teams_list = [f"Team {team:02d}" for team in range(1, n_teams + 1)]
+        self.coords = self.build_coords()
+        self.strength = self.random.normal(size=n_teams)
+        self.stadium_coords_file = os.path.join(data_dir, "stadiums.csv")
+        self.history_file_pattern = os.path.join(data_dir, "S_{}-{}.csv")
+        self.league_file = self.history_file_pattern.format(21, 22)
+        self.write_files()
+
+    def draw_sites(self, n_sites):
+        low, high = np.array(COORDS_LOW), np.array(COORDS_HIGH)
+        if self.layout == "random":
+            return self.random.uniform(low, high, size=(n_sites, 2))
+        centres = self.random.uniform(low, high, size=(self.n_clusters, 2))
+        cluster = self.random.integers(self.n_clusters, size=n_sites)
+        return np.clip(centres[cluster] + self.random.normal(scale=CLUSTER_SPREAD, size=(n_sites, 2)), low, high)
+
+    def build_coords(self):
+        """
+        (lat, lon) of every stadium. The first teams of the league form the conflict pairs, team 2p and 2p + 1
+        """
+        sites = self.draw_sites(self.n_teams - self.n_conflict_pairs)
+        # redraw sites closer than the conflict radius (plus a margin for the pair offset) until none are left
+        for _ in range(1000):
+            distances = haversine_vector(sites, sites, comb=True)
+            np.fill_diagonal(distances, np.inf)
+            too_close = np.nonzero((distances < 2 * CONFLICT_RADIUS_KM).any(axis=1))[0]
+            if len(too_close) == 0:
+                break
+            # distances are symmetric, so at least two sites are too close, keep one of them
+            sites[too_close[1:]] = self.draw_sites(len(too_close) - 1)
+        else:
+            raise ValueError(f"Could not place {self.n_teams} stadiums apart, use fewer teams or another layout")
+        paired = sites[:self.n_conflict_pairs]
+        partners = paired + self.random.uniform(-CONFLICT_PAIR_OFFSET, CONFLICT_PAIR_OFFSET, size=paired.shape)
+        coords = np.empty((self.n_teams, 2))
+        coords[0:2 * self.n_conflict_pairs:2] = paired
+        coords[1:2 * self.n_conflict_pairs:2] = partners
+        coords[2 * self.n_conflict_pairs:] = sites[self.n_conflict_pairs:]
+        return coords
+
+    def season_results(self):
+        """
+        Double round robin results with a home win probability growing with the strength difference
+        """
+        home, away = np.nonzero(~np.eye(self.n_teams, dtype=bool))
+        home_win = (1 - DRAW_SHARE) / (1 + np.exp(self.strength[away] - self.strength[home] - HOME_ADVANTAGE))
+        draw = self.random.random(len(home))
+        result = np.where(draw < home_win, "H", np.where(draw < home_win + DRAW_SHARE, "D", "A"))
+        teams = np.array(self.teams_list)
+        return pd.DataFrame({"HomeTeam": teams[home], "AwayTeam": teams[away], "FTR": result})
+
+    def write_files(self):
+        os.makedirs(self.data_dir, exist_ok=True)
+        pd.DataFrame({
+            "Team": self.teams_list,
+            "FDCOUK": self.teams_list,
+            "City": self.teams_list,
+            "Stadium": self.teams_list,
+            "Capacity": 30000,
+            "Latitude": self.coords[:, 0],
+            "Longitude": self.coords[:, 1],
+            "Country": "Germany",
+        }).to_csv(self.stadium_coords_file, index=False)
+        for year in sorted(set(HISTORY_SEASON_WEIGHTS) | {21}):
+            self.season_results().to_csv(self.history_file_pattern.format(year, year + 1), index=False)
+
+    def preprocess_kwargs(self):
+        """
+        Keyword arguments of DataPreprocess for this league
+        """
+        return {"league_file": self.league_file, "history_file_pattern": self.history_file_pattern,
+                "stadium_coords_file": self.stadium_coords_file, "cache_dir": None}
+
+
+def benchmark_league(league, solver_config, target_gap, warm_start=True, builder_mode="rule", track_memory=False):
+    """
+    Time every phase of the pipeline on a synthetic league, with track_memory also its peak memory (see
+    PipelineMetrics). Returns one benchmark record
+    """
+    metrics = PipelineMetrics(track_memory)
+    with metrics.phase("preprocess"):
+        dp = DataPreprocess(**league.preprocess_kwargs())
+    with metrics.phase("build"):
+        model = build_model(dp, builder_mode=builder_mode)
+    if warm_start:
+        with metrics.phase("warm_start"):
+            solver_config = replace(solver_config, warm_start=load_warm_start(dp, model))
+    with metrics.phase("solve"):
+        solve_result = Model.solve_model(model.m, solver_config)
+    if solve_result.has_solution:
+        with metrics.phase("postprocess"):
+            DataPostprocess(solve_result.model, dp.teams_name_index_map, dp.all_teams_coords_df,
+                            schedule_file=os.path.join(league.data_dir, "schedule.xlsx"))
+
+    phases = metrics.record["phases"]
+    timings = {name: phases[name]["wall_time"] if name in phases else None
+               for name in ["preprocess", "build", "warm_start", "solve", "postprocess"]}
+    # the solver's own wall time, without loading the solution back into the model
+    timings["solve"] = solve_result.wall_time
+    record = {
+        "n_teams": league.n_teams,
+        "layout": league.layout,
+        "n_conflict_pairs": len(dp.conflict_home_match_list) // 2,
+        "variables": model.m.nvariables(),
+        "constraints": model.m.nconstraints(),
+        "status": solve_result.status,
+        "objective": solve_result.objective,
+        "gap": solve_result.gap,
+        **timings,
+        "time_to_first_feasible": solve_result.time_to_first_feasible,
+        "time_to_gap": solve_result.time_to_gap(target_gap),
+    }
+    if track_memory:
+        record["peak_memory_mb"] = {name: phase["peak_memory_mb"] for name, phase in phases.items()}
+    return record
+
+
+def run_benchmark(teams=None, layout="random", n_conflict_pairs=1, solver_config=None, target_gap=0.05,
+                  warm_start=True, builder_mode="rule", repeats=1, seed=0, track_memory=False):
+    """
+    Benchmark the pipeline for every league size in teams. With repeats > 1 every size is run again on the same
+    league and the median of each timing is kept. Solves stop at target_gap unless solver_config sets its own mip_gap
+    """
+    solver_config = solver_config if solver_config is not None else \
+        SolverConfig(name="highs", time_limit=120, threads=1, tee=False, logfile=None)
+    if solver_config.mip_gap is None:
+        solver_config = replace(solver_config, mip_gap=target_gap)
+    records = []
+    with tempfile.TemporaryDirectory() as data_dir:
+        for n_teams in teams or BENCHMARK_TEAMS:
+            league = SyntheticLeague(n_teams, os.path.join(data_dir, str(n_teams)), layout, n_conflict_pairs,
+                                     seed=seed)
+            runs = [benchmark_league(league, solver_config, target_gap, warm_start, builder_mode, track_memory)
+                    for _ in range(repeats)]
+            record = runs[-1]
+            for metric in TIMED_METRICS:
+                values = [run[metric] for run in runs if run[metric] is not None]
+                record[metric] = statistics.median(values) if len(values) == len(runs) else None
+            records.append(record)
+            print(f"{n_teams} teams: " + ", ".join(f"{metric} {format_seconds(record[metric])}"
+                                                  for metric in TIMED_METRICS), file=sys.stderr)
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "settings": {"layout": layout, "n_conflict_pairs": n_conflict_pairs, "solver": solver_config.name,
+                     "time_limit": solver_config.time_limit, "threads": solver_config.threads,
+                     "target_gap": target_gap, "warm_start": warm_start, "builder_mode": builder_mode,
+                     "repeats": repeats, "seed": seed, "track_memory": track_memory},
+        "records": records,
+    }
+
+
+def format_seconds(value):
+    return f"{value:.2f}s" if value is not None else "-"
+
+
+def compare_with_baseline(results, baseline, threshold=REGRESSION_THRESHOLD, min_seconds=REGRESSION_MIN_SECONDS):
+    """
+    Timings of results that are more than threshold (relative) and min_seconds slower than the baseline record of
+    the same league size, as a list of (n_teams, metric, baseline, current). A timing the baseline reached but the
+    current run did not, e.g. the target gap, is a regression as well. The solve time is not compared if either run
+    hit the time limit
+    """
+    baseline_records = {record["n_teams"]: record for record in baseline["records"]}
+    regressions = []
+    for record in results["records"]:
+        baseline_record = baseline_records.get(record["n_teams"])
+        if baseline_record is None:
+            continue
+        time_limited = is_time_limited(record) or is_time_limited(baseline_record)
+        for metric in TIMED_METRICS:
+            before, after = baseline_record.get(metric), record.get(metric)
+            if before is None or (metric == "solve" and time_limited):
+                continue
+            if after is None or (after > before * (1 + threshold) and after - before > min_seconds):
+                regressions.append((record["n_teams"], metric, before, after))
+    return regressions
+
+
+def is_time_limited(record):
+    return record.get("status") in TIME_LIMIT_STATUSES
+
+
+def report_regressions(results, baseline_file, threshold):
+    if not os.path.exists(baseline_file):
+        print(f"No baseline in {baseline_file}, store one with --update-baseline")
+        return 0
+    with open(baseline_file) as baseline_json:
+        baseline = json.load(baseline_json)
+    if results["settings"] != baseline["settings"]:
+        print(f"Warning: benchmark settings differ from the baseline {baseline['settings']}")
+    regressions = compare_with_baseline(results, baseline, threshold)
+    for n_teams, metric, before, after in regressions:
+        print(f"Regression at {n_teams} teams: {metric} {format_seconds(before)} -> {format_seconds(after)}")
+    print(f"{len(regressions)} regressions against {baseline_file} (threshold {threshold:.0%})")
+    return 1 if regressions else 0
+
+
+def write_json(data, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as json_file:
+        json.dump(data, json_file, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scaling benchmark of the pipeline on synthetic leagues")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser("run", help="run the benchmark and compare it with the baseline")
+    run_parser.add_argument("--teams", type=int, nargs="+", default=BENCHMARK_TEAMS)
+    run_parser.add_argument("--layout", choices=["random", "clustered"], default="random")
+    run_parser.add_argument("--conflict-pairs", type=int, default=1)
+    run_parser.add_argument("--solver", default="highs")
+    run_parser.add_argument("--time-limit", type=float, default=120)
+    run_parser.add_argument("--target-gap", type=float, default=0.05)
+    run_parser.add_argument("--no-warm-start", action="store_true")
+    run_parser.add_argument("--builder-mode", choices=list(BUILDER_MODES), default="rule")
+    run_parser.add_argument("--repeats", type=int, default=1)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--track-memory", action="store_true",
+                            help="record the peak memory of every phase, tracing slows the timed phases down")
+    run_parser.add_argument("--output", default=RESULTS_FILE)
+    run_parser.add_argument("--baseline", default=BASELINE_FILE)
+    run_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    run_parser.add_argument("--update-baseline", action="store_true", help="store the results as the new baseline")
+    compare_parser = subparsers.add_parser("compare", help="compare stored results with the baseline")
+    compare_parser.add_argument("results", nargs="?", default=RESULTS_FILE)
+    compare_parser.add_argument("--baseline", default=BASELINE_FILE)
+    compare_parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args()
+
+    if args.command == "run":
+        config = SolverConfig(name=args.solver, time_limit=args.time_limit, threads=1, seed=args.seed, tee=False,
+                              logfile=None)
+        results = run_benchmark(args.teams, args.layout, args.conflict_pairs, config, args.target_gap,
+                                not args.no_warm_start, args.builder_mode, args.repeats, args.seed, args.track_memory)
+        write_json(results, args.output)
+        print(f"Results written to {args.output}")
+        if args.update_baseline:
+            time_limited = [record["n_teams"] for record in results["records"] if is_time_limited(record)]
+            if time_limited:
+                # their solve times would only repeat the limit, raise it or leave these sizes out
+                print(f"Not updating the baseline, the solves of {time_limited} teams hit the time limit")
+                sys.exit(1)
+            write_json(results, args.baseline)
+            print(f"Baseline updated in {args.baseline}")
+            sys.exit(0)
+        sys.exit(report_regressions(results, args.baseline, args.threshold))
+    else:
+        with open(args.results) as results_json:
+            results = json.load(results_json)
+        sys.exit(report_regressions(results, args.baseline, args.threshold))
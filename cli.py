@@ -0,0 +1,242 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+# dependencies that take a noticeable part of a second to import, the commands import them only when they need them
+HEAVY_MODULES = ["numpy", "pandas", "pyomo", "plotly", "openpyxl", "haversine", "highspy"]
+# seconds `import cli` may take in a fresh interpreter, checked by the startup command
+IMPORT_TIME_BUDGET = 0.05
+# runs of the startup measurement, the fastest one counts
+STARTUP_REPEATS = 5
+
+
+def preprocess_kwargs(args):
+    kwargs = {"league_file": args.league_file, "stadium_coords_file": args.stadium_coords_file,
+              "n_weeks": args.n_weeks, "conflict_radius_km": args.conflict_radius_km}
+    return {key: value for key, value in kwargs.items() if value is not None}
+
+
+def model_kwargs(args):
+    return {"builder_mode": args.builder_mode, "scheme": args.scheme}
+
+
+def print_json(data):
+    print(json.dumps(data, indent=2, default=str))
+
+
+def command_preprocess(args):
+    """
+    Read and check the input data and print a summary of the league
+    """
+    from data_preprocesser import DataPreprocess
+
+    dp = DataPreprocess(**preprocess_kwargs(args))
+    teams = dict(zip(dp.teams_range, dp.teams_list))
+    print_json({
+        "teams": len(dp.teams_list),
+        "weeks": len(dp.weeks_range),
+        "team_names": teams,
+        "conflict_pairs": [[teams[team_i], teams[team_j]] for team_i, team_j in dp.conflict_home_match_list
+                           if team_i < team_j],
+        "input_files": dp.input_files(),
+    })
+
+
+def command_build(args):
+    """
+    Build the model and print its size per constraint family, optionally write it to a file (.lp, .mps, ...)
+    """
+    from data_preprocesser import DataPreprocess
+    from main import build_model
+    from pipeline_metrics import PipelineMetrics
+
+    start = time.perf_counter()
+    dp = DataPreprocess(**preprocess_kwargs(args))
+    model = build_model(dp, **model_kwargs(args))
+    build_time = time.perf_counter() - start
+    metrics = PipelineMetrics()
+    metrics.add_model_size(model.m)
+    if args.write:
+        model.m.write(args.write, io_options={"symbolic_solver_labels": True})
+    print_json({"build_time": build_time, "model_file": args.write, **metrics.record["model_size"]})
+
+
+def command_solve(args):
+    """
+    Run the whole pipeline and print the solver outcome, the schedule is written to SCHEDULE_FILE
+    """
+    from data_postprocess import SCHEDULE_FILE
+    from main import run_pipeline
+    from model.solver import SolverConfig
+    from pipeline_metrics import METRICS_FILE
+    from schedule_cache import CACHE_DIR, ScheduleCache
+
+    solver_config = SolverConfig(name=args.solver, time_limit=args.time_limit, mip_gap=args.mip_gap,
+                                 threads=args.threads, seed=args.seed, warm_start=args.warm_start, tee=args.tee,
+                                 logfile=None)
+    rolling_horizon = {"window_size": args.window_size, "overlap": args.overlap} if args.window_size else None
+    metrics_file = None if args.no_metrics else args.metrics_file or METRICS_FILE
+    output = run_pipeline(solver_config=solver_config, preprocess_kwargs=preprocess_kwargs(args),
+                          cache=ScheduleCache(args.cache_dir or CACHE_DIR) if args.cache else None,
+                          render_map=args.map, metrics_file=metrics_file, track_memory=args.track_memory,
+                          rolling_horizon=rolling_horizon, **model_kwargs(args))
+    solver = output.metrics.get("solver") or {}
+    print_json({"cached": output.metrics["settings"]["cached"], "status": solver.get("status"),
+                "objective": solver.get("objective"), "gap": solver.get("gap"),
+                "wall_time": solver.get("wall_time"), "schedule_file": SCHEDULE_FILE})
+
+
+def cached_entry(args):
+    """
+    Cache entry of args.key, which may be a prefix, or the most recently used one. Exits if there is none
+    """
+    from schedule_cache import CACHE_DIR, ScheduleCache
+
+    cache_dir = args.cache_dir or CACHE_DIR
+    cache = ScheduleCache(cache_dir)
+    entries = sorted(cache.entries(), key=lambda entry: entry[2], reverse=True)
+    keys = [key for key, _, _ in entries if args.key is None or key.startswith(args.key)]
+    if not keys:
+        sys.exit(f"No cached schedule{' with key ' + args.key if args.key else ''} in {cache_dir}")
+    if args.key is not None and len(keys) > 1:
+        sys.exit(f"Key {args.key} matches {len(keys)} cached schedules")
+    return keys[0], cache.get(keys[0])
+
+
+def command_export(args):
+    """
+    Write a cached schedule (or the matches of a JSON file) as home x away table to an .xlsx or .csv file
+    """
+    from data_postprocess import SCHEDULE_FILE, DataPostprocess
+    from data_preprocesser import DataPreprocess
+
+    if args.matches:
+        with open(args.matches) as matches_file:
+            chosen_matches = json.load(matches_file)
+    else:
+        chosen_matches = cached_entry(args)[1]["chosen_matches"]
+    dp = DataPreprocess(**preprocess_kwargs(args))
+    table = DataPostprocess.build_schedule_table(chosen_matches, dp.teams_name_index_map)
+    output_file = args.output or SCHEDULE_FILE
+    if output_file.endswith(".csv"):
+        table.to_csv(output_file)
+    else:
+        table.to_excel(output_file)
+    print(f"Wrote {len(chosen_matches)} matches to {output_file}")
+
+
+def command_show(args):
+    """
+    Print a cached schedule week by week, team names need --names as they come from the input data
+    """
+    key, entry = cached_entry(args)
+    names = {}
+    if args.names:
+        from data_preprocesser import DataPreprocess
+
+        dp = DataPreprocess(**preprocess_kwargs(args))
+        names = dict(zip(dp.teams_range, dp.teams_list))
+    print(f"Schedule {key}: status {entry['status']}, objective {entry['objective']}, gap {entry['gap']}")
+    weeks = {}
+    for home, away, week in entry["chosen_matches"]:
+        weeks.setdefault(week, []).append(f"{names.get(home, home)} - {names.get(away, away)}")
+    for week in sorted(weeks):
+        print(f"Week {week}: " + ", ".join(weeks[week]))
+
+
+def measure_startup(module="cli", repeats=STARTUP_REPEATS):
+    """
+    Seconds to import module in a fresh interpreter (the fastest of repeats runs) and the heavy modules it loads
+    """
+    code = ("import sys, time, json\n"
+            "start = time.perf_counter()\n"
+            f"import {module}\n"
+            "print(json.dumps([time.perf_counter() - start, sorted(name for name in sys.modules "
+            f"if name.split('.')[0] in {HEAVY_MODULES!r})]))")
+    runs = [json.loads(subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                      check=True).stdout) for _ in range(repeats)]
+    return min(import_time for import_time, _ in runs), runs[0][1]
+
+
+def command_startup(args):
+    """
+    Check that importing the CLI stays within IMPORT_TIME_BUDGET and loads none of HEAVY_MODULES
+    """
+    import_time, heavy_modules = measure_startup()
+    print(f"import cli: {import_time * 1000:.1f} ms (budget {args.budget * 1000:.0f} ms), heavy modules: "
+          f"{heavy_modules or 'none'}")
+    if import_time > args.budget or heavy_modules:
+        sys.exit(1)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Headless entry point of the scheduling pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    data_parser = argparse.ArgumentParser(add_help=False)
+    data_parser.add_argument("--league-file", help="results of the season to schedule")
+    data_parser.add_argument("--stadium-coords-file")
+    data_parser.add_argument("--n-weeks", type=int)
+    data_parser.add_argument("--conflict-radius-km", type=float)
+    model_parser = argparse.ArgumentParser(add_help=False)
+    model_parser.add_argument("--builder-mode", default="rule", help="rule, matrix or compact")
+    model_parser.add_argument("--scheme", choices=["standard", "mirrored"], default="standard")
+    cache_parser = argparse.ArgumentParser(add_help=False)
+    cache_parser.add_argument("--cache-dir", help="CACHE_DIR of schedule_cache.py by default")
+    cache_parser.add_argument("--key", help="cache key or a prefix of it, the most recently used entry by default")
+
+    preprocess_parser = subparsers.add_parser("preprocess", parents=[data_parser],
+                                              help="check the input data and summarize the league")
+    preprocess_parser.set_defaults(handler=command_preprocess)
+
+    build_command_parser = subparsers.add_parser("build", parents=[data_parser, model_parser],
+                                                 help="build the model and report its size")
+    build_command_parser.add_argument("--write", help="write the model to this file, the format follows the extension")
+    build_command_parser.set_defaults(handler=command_build)
+
+    solve_parser = subparsers.add_parser("solve", parents=[data_parser, model_parser],
+                                         help="run the whole pipeline and write the schedule")
+    solve_parser.add_argument("--solver", default="highs")
+    solve_parser.add_argument("--time-limit", type=float)
+    solve_parser.add_argument("--mip-gap", type=float)
+    solve_parser.add_argument("--threads", type=int)
+    solve_parser.add_argument("--seed", type=int)
+    solve_parser.add_argument("--warm-start", action="store_true")
+    solve_parser.add_argument("--tee", action="store_true", help="show the solver log")
+    solve_parser.add_argument("--window-size", type=int, help="solve with rolling horizon windows of this many weeks")
+    solve_parser.add_argument("--overlap", type=int, default=2)
+    solve_parser.add_argument("--cache", action="store_true", help="reuse and store schedules in the cache")
+    solve_parser.add_argument("--cache-dir", help="CACHE_DIR of schedule_cache.py by default")
+    solve_parser.add_argument("--map", action="store_true", help="render the teams map")
+    solve_parser.add_argument("--metrics-file", help="METRICS_FILE of pipeline_metrics.py by default")
+    solve_parser.add_argument("--no-metrics", action="store_true", help="do not append the run to the metrics file")
+    solve_parser.add_argument("--track-memory", action="store_true",
+                              help="record the peak memory of every phase, slows the model build down")
+    solve_parser.set_defaults(handler=command_solve)
+
+    export_parser = subparsers.add_parser("export", parents=[data_parser, cache_parser],
+                                          help="write a cached schedule as a table")
+    export_parser.add_argument("--matches", help="JSON file of [home, away, week] matches instead of the cache")
+    export_parser.add_argument("--output", help="output .xlsx or .csv file, the schedule file by default")
+    export_parser.set_defaults(handler=command_export)
+
+    show_parser = subparsers.add_parser("show", parents=[data_parser, cache_parser],
+                                        help="print a cached schedule")
+    show_parser.add_argument("--names", action="store_true", help="show team names instead of team indexes")
+    show_parser.set_defaults(handler=command_show)
+
+    startup_parser = subparsers.add_parser("startup", help="check the import time of the CLI")
+    startup_parser.add_argument("--budget", type=float, default=IMPORT_TIME_BUDGET)
+    startup_parser.set_defaults(handler=command_startup)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,75 @@
-import pyomo.environ as pe
+import hashlib
+import logging
+import shutil
+import numpy as np
 import pandas as pd
-import openpyxl
-import plotly.graph_objects as go
 import os
 
 MAPBOX_TOKEN = os.getenv("MAPBOX_TOKEN")
+SCHEDULE_FILE = "output/bundesliga_schedule.xlsx"
+TEAMS_MAP_IMAGE = "output/bundesliga_teams_coords.png"
+# rendered map images, named by the hash of the coordinates they show
+TEAMS_MAP_CACHE_DIR = "output/cache/maps"
+
+# built figures by coordinate hash and token, the stadiums do not move between runs
+_teams_maps = {}
 
 
 class DataPostprocess:
-    def __init__(self, solved_model, teams_name_index_map, all_teams_coords_df):
+    def __init__(self, solved_model, teams_name_index_map, all_teams_coords_df, chosen_matches=None,
+                 schedule_file=SCHEDULE_FILE):
+        # chosen_matches, (home, away, week) matches e.g. from the schedule cache, replace reading the solved model
         self.solved_model = solved_model
-        self.fig = DataPostprocess.build_teams_map(all_teams_coords_df, MAPBOX_TOKEN)
+        self.all_teams_coords_df = all_teams_coords_df
+        # excel file the league schedule is written to, None to skip it
+        self.schedule_file = schedule_file
         self.chosen_matches, self.league_schedule_table, self.filtered_schedule_per_team_dict = \
-            self.prepare_schedule_table(teams_name_index_map)
+            self.prepare_schedule_table(teams_name_index_map, chosen_matches)
+
+    @property
+    def fig(self):
+        # the map is only built when someone looks at it
+        return DataPostprocess.teams_map(self.all_teams_coords_df)
+
+    @staticmethod
+    def coords_hash(all_teams_coords_df):
+        coords = all_teams_coords_df[["team", "lat", "lon"]].to_csv(index=False)
+        return hashlib.sha256(coords.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def teams_map(all_teams_coords_df, mapbox_token=MAPBOX_TOKEN):
+        """
+        Map of the team locations, built once per set of coordinates and reused afterwards
+        """
+        key = (DataPostprocess.coords_hash(all_teams_coords_df), mapbox_token)
+        if key not in _teams_maps:
+            _teams_maps[key] = DataPostprocess.build_teams_map(all_teams_coords_df, mapbox_token)
+        return _teams_maps[key]
+
+    @staticmethod
+    def export_teams_map(all_teams_coords_df, image_path=TEAMS_MAP_IMAGE, cache_dir=TEAMS_MAP_CACHE_DIR):
+        """
+        Write the map as a static image to image_path. The image is rendered only if no image of the same
+        coordinates is cached yet. Static export needs the kaleido package, without it the export is skipped with a
+        warning. Returns the written path or None
+        """
+        cached_image = os.path.join(cache_dir, f"teams_map_{DataPostprocess.coords_hash(all_teams_coords_df)}.png")
+        if not os.path.exists(cached_image):
+            try:
+                os.makedirs(cache_dir, exist_ok=True)
+                DataPostprocess.teams_map(all_teams_coords_df).write_image(cached_image)
+            except (ImportError, ValueError) as error:
+                logging.getLogger(__name__).warning(f"Teams map not exported: {error}")
+                return None
+        shutil.copyfile(cached_image, image_path)
+        return image_path
 
     @staticmethod
     def build_teams_map(all_teams_coords_df,
                         MAPBOX_TOKEN):
+        # plotly is only needed for the map, headless runs never import it
+        import plotly.graph_objects as go
+
         # quick plot of teams location on map
         fig = go.Figure()
         fig.add_trace(
@@ -39,40 +92,71 @@ class DataPostprocess:
             margin=dict(l=0, r=0, t=0, b=0),
             showlegend=False,
         )
-
-        fig.write_image("output/bundesliga_teams_coords.png")
         return fig
 
-    def prepare_schedule_table(self, teams_name_index_map):
-        teams_index_name_map = {index: name for name, index in teams_name_index_map.items()}
-        chosen_is_match_this_week = {
-            index: pe.value(self.solved_model.is_match_this_week_var[index])
-            for index in self.solved_model.is_match_this_week_var
-            if self.solved_model.is_match_this_week_var[index].value != 0
-        }
-        chosen_matches = list(chosen_is_match_this_week.keys())
-
-        league_schedule_table = pd.DataFrame(columns=teams_name_index_map.keys(), index=teams_name_index_map.keys())
-        for match in chosen_matches:
-            team1_idx, team2_idx, result = match[0], match[1], match[2]
-            league_schedule_table.at[
-                teams_index_name_map[team1_idx], teams_index_name_map[team2_idx]] = f'Week {result}'
-        league_schedule_table.to_excel("output/bundesliga_schedule.xlsx")
-
-        filtered_schedule_per_team_dict = {}
-        # Iterate through the list of tuples and collect data
-        for team1_idx, team2_idx, week in chosen_matches:
-            if teams_index_name_map[team1_idx] in filtered_schedule_per_team_dict:
-                filtered_schedule_per_team_dict[teams_index_name_map[team1_idx]]['Team'].append(
-                    teams_index_name_map[team2_idx])
-                filtered_schedule_per_team_dict[teams_index_name_map[team1_idx]]['Week'].append(week)
-            else:
-                filtered_schedule_per_team_dict[teams_index_name_map[team1_idx]] = {
-                    'Team': [teams_index_name_map[team2_idx]], 'Week': [week]}
-
-        filtered_schedule_per_team_dict = {team: pd.DataFrame(data) for team, data in
-                                           filtered_schedule_per_team_dict.items()}
-        for team, schedule_df in filtered_schedule_per_team_dict.items():
-            filtered_schedule_per_team_dict[team] = schedule_df.sort_values(by='Week')
-
-        return chosen_matches, league_schedule_table, filtered_schedule_per_team_dict
+    @staticmethod
+    def extract_chosen_matches(solved_model):
+        """
+        Played (home team, away team, week) matches of a solved model as an int array of shape (matches, 3). The
+        variable values are read in one pass and filtered with NumPy; in the mirrored scheme every chosen slot also
+        yields its second-half leg
+        """
+        var = solved_model.is_match_this_week_var
+        slots = np.array(list(solved_model.match_index_set), dtype=np.int64).reshape(-1, 3)
+        values = np.fromiter((value if value is not None else 0.0 for value in var.extract_values().values()),
+                             dtype=float, count=len(slots))
+        chosen = slots[values > 0.5]
+        offset = solved_model.mirror_offset_param.value
+        if offset:
+            chosen = np.concatenate([chosen, chosen[:, [1, 0, 2]] + np.array([0, 0, offset])])
+        return chosen
+
+    @staticmethod
+    def team_positions(chosen_matches, teams_name_index_map):
+        # rows of chosen_matches as positions of home and away team in teams_name_index_map
+        team_indices = np.array(list(teams_name_index_map.values()), dtype=np.int64)
+        position = np.zeros(team_indices.max() + 1, dtype=np.int64)
+        position[team_indices] = np.arange(len(team_indices))
+        return position[chosen_matches[:, 0]], position[chosen_matches[:, 1]]
+
+    @staticmethod
+    def build_schedule_table(chosen_matches, teams_name_index_map):
+        """
+        Home team x away team table of the match weeks, e.g. to show an incumbent schedule without writing files
+        """
+        chosen_matches = np.asarray(chosen_matches, dtype=np.int64).reshape(-1, 3)
+        team_names = list(teams_name_index_map.keys())
+        home, away = DataPostprocess.team_positions(chosen_matches, teams_name_index_map)
+        cells = np.full((len(team_names), len(team_names)), np.nan, dtype=object)
+        cells[home, away] = np.char.add("Week ", chosen_matches[:, 2].astype(str)).astype(object)
+        return pd.DataFrame(cells, index=team_names, columns=team_names)
+
+    @staticmethod
+    def build_team_schedules(chosen_matches, teams_name_index_map):
+        """
+        Per team table of its home opponents by week
+        """
+        chosen_matches = np.asarray(chosen_matches, dtype=np.int64).reshape(-1, 3)
+        team_names = np.array(list(teams_name_index_map.keys()), dtype=object)
+        home, away = DataPostprocess.team_positions(chosen_matches, teams_name_index_map)
+        # one sort by home team and week, then every team is a contiguous block
+        order = np.lexsort((chosen_matches[:, 2], home))
+        home, away, weeks = home[order], away[order], chosen_matches[order, 2]
+        teams, starts = np.unique(home, return_index=True)
+        ends = np.append(starts[1:], len(home))
+        return {team_names[team]: pd.DataFrame({'Team': team_names[away[start:end]], 'Week': weeks[start:end]})
+                for team, start, end in zip(teams, starts, ends)}
+
+    def prepare_schedule_table(self, teams_name_index_map, chosen_matches=None):
+        if chosen_matches is None:
+            chosen_matches = DataPostprocess.extract_chosen_matches(self.solved_model)
+        chosen_matches = np.asarray(chosen_matches, dtype=np.int64).reshape(-1, 3)
+
+        league_schedule_table = DataPostprocess.build_schedule_table(chosen_matches, teams_name_index_map)
+        if self.schedule_file is not None:
+            league_schedule_table.to_excel(self.schedule_file)
+
+        filtered_schedule_per_team_dict = DataPostprocess.build_team_schedules(chosen_matches, teams_name_index_map)
+
+        return [tuple(match) for match in chosen_matches.tolist()], league_schedule_table, \
+            filtered_schedule_per_team_dict
@@ -1,7 +1,8 @@
+import numpy as np
 import pandas as pd
 from haversine import haversine_vector
-from collections import defaultdict
-import itertools
+import hashlib
+import os
 
 TABLE_COORDS_COLUMNS = {
     "FDCOUK": "team",
@@ -9,42 +10,159 @@ TABLE_COORDS_COLUMNS = {
     "Longitude": "lon"
 }
 
+# the only columns of the football-data.co.uk result files the preprocessing uses
+RESULT_COLUMNS = ["HomeTeam", "AwayTeam", "FTR"]
+# the season to schedule: its teams are taken from this results file
+LEAGUE_FILE = "data/D1_21-22.csv"
+# past seasons of the league, formatted with the start and end year
+SEASON_RESULTS_PATH = "data/D1_{}-{}.csv"
+STADIUM_COORDS_FILE = "data/stadiums-with-GPS-coordinates.csv"
+# parsed result files, keyed by the hash of the csv content
+SEASON_CACHE_DIR = "data/cache"
+# weight of the points of each past season (by start year) in the team rank
+HISTORY_SEASON_WEIGHTS = {20: 0.5, 19: 0.3, 18: 0.2}
+# teams with stadiums closer than this should not play at home in the same week
+CONFLICT_RADIUS_KM = 15
+
+
+def rank_attractiveness(team_ranks, weeks):
+    """
+    Default attractiveness formula, returns the (home, away) pair matrix and the week factors for an array of team
+    ranks and an array of weeks. Formula encourages match between top ranked teams in later stage of the season. With
+    less priority matches of teams with similar ranks are favoured
+    """
+    rank_i, rank_j = team_ranks[:, None], team_ranks[None, :]
+    return (rank_i + rank_j) * (1 - 1 / (1 + np.abs(rank_i - rank_j))), 1 + weeks / 10
+
+
+class MatchAttractiveness():
+    """
+    Attractiveness of (home team, away team, week) matches as a pair matrix times a week factor: the value of
+    match (team_i, team_j, week_k) is pair_matrix[i, j] * week_factors[k] with i, j, k the positions of the teams in
+    teams_range and of the week in weeks_range. Indexing with (team_i, team_j, week_k) works like the former dict
+    """
+
+    def __init__(self, teams_range, weeks_range, pair_matrix, week_factors):
+        self.teams_range = list(teams_range)
+        self.weeks_range = list(weeks_range)
+        self.team_position = {team: position for position, team in enumerate(teams_range)}
+        self.week_position = {week: position for position, week in enumerate(weeks_range)}
+        self.pair_matrix = np.asarray(pair_matrix, dtype=float)
+        self.week_factors = np.asarray(week_factors, dtype=float)
+
+    def __getitem__(self, match):
+        team_i, team_j, week_k = match
+        return float(self.pair_matrix[self.team_position[team_i], self.team_position[team_j]] *
+                     self.week_factors[self.week_position[week_k]])
+
+    def coefficients(self, home, away, week):
+        """
+        Attractiveness of many matches at once, home, away and week are arrays of positions
+        """
+        return self.pair_matrix[home, away] * self.week_factors[week]
+
+    def to_array(self):
+        """
+        Dense (home, away, week) array of all values
+        """
+        return self.pair_matrix[:, :, None] * self.week_factors[None, None, :]
+
+    def with_pair_boost(self, pairs, factor):
+        """
+        Copy with the attractiveness of the given (team_i, team_j) pairs, e.g. derbies or matches in big TV markets,
+        multiplied by factor in both home/away orders
+        """
+        pair_matrix = self.pair_matrix.copy()
+        for team_i, team_j in pairs:
+            position_i, position_j = self.team_position[team_i], self.team_position[team_j]
+            pair_matrix[position_i, position_j] *= factor
+            pair_matrix[position_j, position_i] *= factor
+        return MatchAttractiveness(self.teams_range, self.weeks_range, pair_matrix, self.week_factors)
+
 
 class DataPreprocess():
-    def __init__(self):
+    def __init__(self, league_file=LEAGUE_FILE, history_file_pattern=SEASON_RESULTS_PATH, n_weeks=None,
+                 season_weights=None, cache_dir=SEASON_CACHE_DIR, conflict_radius_km=CONFLICT_RADIUS_KM,
+                 attractiveness_formula=rank_attractiveness, stadium_coords_file=STADIUM_COORDS_FILE):
+        self.league_file = league_file
+        self.stadium_coords_file = stadium_coords_file
+        self.history_file_pattern = history_file_pattern
+        # season length, a double round robin by default: 2 * (teams - 1) weeks, or 2 * teams weeks with byes for an
+        # odd number of teams
+        self.n_weeks = n_weeks
+        self.season_weights = season_weights if season_weights is not None else HISTORY_SEASON_WEIGHTS
+        self.cache_dir = cache_dir
+        self.conflict_radius_km = conflict_radius_km
+        # callable (team ranks array, weeks array) -> (pair matrix, week factors), see rank_attractiveness
+        self.attractiveness_formula = attractiveness_formula
         self.team_ranks_dict = None
-        self.match_attractiveness_dict = None
+        self.match_attractiveness = None
         self.last_season_results_df = None
         self.stadium_coords_df = None
         self.teams_list = None
         self.teams_range = None
         self.weeks_range = None
         self.teams_name_index_map = None
-        self.team_distance_matrix_dict = None
+        self.team_distance_matrix = None
         self.team_season_points = None
         self.conflict_home_match_list = None
-        self.all_teams_coords_df = self.preprocess_data()
+        self.all_teams_coords_df = self.preprocess_data(league_file, cache_dir, stadium_coords_file)
         self.construct_model_input(all_teams_coords_df=self.all_teams_coords_df)
 
     def construct_model_input(self, all_teams_coords_df):
         self.teams_list = list(all_teams_coords_df['team'])
         self.teams_range = list(range(1, len(self.teams_list) + 1))
         self.teams_name_index_map = dict(zip(self.teams_list, self.teams_range))
-        self.weeks_range = range(1, 35)  # assuming 34 matches weeks in the season
-        self.team_distance_matrix_dict = DataPreprocess.construct_distance_matrix(all_teams_coords_df,
-                                                                                  self.teams_name_index_map)
-        self.team_ranks_dict = DataPreprocess.build_team_rank(self.teams_list, self.teams_name_index_map)
-        self.match_attractiveness_dict = DataPreprocess.build_match_attractiveness(self)
+        n_teams = len(self.teams_list)
+        n_weeks = self.n_weeks if self.n_weeks is not None else 2 * (n_teams - 1 if n_teams % 2 == 0 else n_teams)
+        self.weeks_range = range(1, n_weeks + 1)
+        self.team_distance_matrix = DataPreprocess.construct_distance_matrix(all_teams_coords_df)
+        self.team_season_points = DataPreprocess.build_team_performance(self.teams_list, self.season_weights,
+                                                                        self.cache_dir, self.history_file_pattern)
+        self.team_ranks_dict = DataPreprocess.build_team_rank(self.teams_list, self.teams_name_index_map,
+                                                              self.season_weights, self.team_season_points)
+        self.match_attractiveness = DataPreprocess.build_match_attractiveness(self)
         self.conflict_home_match_list = DataPreprocess.build_conflict_home_match_list(
-            self.team_distance_matrix_dict)
+            self.team_distance_matrix, self.teams_range, self.conflict_radius_km)
+
+    def input_files(self):
+        """
+        Data files the preprocessing reads
+        """
+        return [self.league_file, self.stadium_coords_file] + \
+            [self.history_file_pattern.format(year, year + 1) for year in self.season_weights]
+
+    @staticmethod
+    def read_season_results(path, cache_dir=SEASON_CACHE_DIR):
+        """
+        HomeTeam, AwayTeam and FTR columns of a season results file. Parsed seasons are stored as feather files named
+        after the hash of the csv content, so an edited file is parsed again. cache_dir=None disables the cache
+        """
+        if cache_dir is None:
+            return pd.read_csv(path, usecols=RESULT_COLUMNS, dtype="category")
+        with open(path, "rb") as results_file:
+            content_hash = hashlib.sha256(results_file.read()).hexdigest()[:16]
+        file_stem = os.path.splitext(os.path.basename(path))[0]
+        cache_path = os.path.join(cache_dir, f"{file_stem}_{content_hash}.feather")
+        if os.path.exists(cache_path):
+            return pd.read_feather(cache_path)
+        season_results_df = pd.read_csv(path, usecols=RESULT_COLUMNS, dtype="category")
+        os.makedirs(cache_dir, exist_ok=True)
+        season_results_df.to_feather(cache_path)
+        return season_results_df
 
     @staticmethod
-    def preprocess_data():
-        last_season_results_df = pd.read_csv("data/D1_21-22.csv")
-        stadium_coords_df = pd.read_csv("data/stadiums-with-GPS-coordinates.csv")
-        teams_coords_df = stadium_coords_df.loc[stadium_coords_df["FDCOUK"].isin(last_season_results_df["HomeTeam"])]
-        # add missing team information
-        all_teams_coords_df = DataPreprocess.add_missing_data(teams_coords_df)
+    def preprocess_data(league_file=LEAGUE_FILE, cache_dir=SEASON_CACHE_DIR, stadium_coords_file=STADIUM_COORDS_FILE):
+        last_season_results_df = DataPreprocess.read_season_results(league_file, cache_dir)
+        league_teams = last_season_results_df["HomeTeam"].astype(str).unique()
+        stadium_coords_df = pd.read_csv(stadium_coords_file)
+        # add missing team information, then keep the teams of the league
+        all_teams_coords_df = DataPreprocess.add_missing_data(stadium_coords_df)
+        all_teams_coords_df = all_teams_coords_df.loc[all_teams_coords_df["FDCOUK"].isin(league_teams)]
+        all_teams_coords_df = all_teams_coords_df.drop_duplicates(subset="FDCOUK")
+        teams_without_coords = sorted(set(league_teams) - set(all_teams_coords_df["FDCOUK"]))
+        if teams_without_coords:
+            raise ValueError(f"No stadium coordinates for teams {teams_without_coords} of {league_file}")
         all_teams_coords_df = \
             all_teams_coords_df[["FDCOUK", "Latitude", "Longitude"]].rename(columns=TABLE_COORDS_COLUMNS)[
                 TABLE_COORDS_COLUMNS.values()]
@@ -68,71 +186,68 @@ class DataPreprocess():
         return all_teams_coords_df
 
     @staticmethod
-    def construct_distance_matrix(all_teams_coords_df, team_name_index_map):
-        # compute matrix of haversine distances among teams
-        teams_distance_matrix_df = pd.DataFrame(
-            [haversine_vector([[row.lat, row.lon]] * len(all_teams_coords_df), all_teams_coords_df[["lat", "lon"]]) for
-             index, row in all_teams_coords_df.iterrows()], columns=all_teams_coords_df.team,
-            index=all_teams_coords_df.team
-        )
-        teams_distance_matrix_dict = {
-            (team_name_index_map[team_i], team_name_index_map[team_j]): teams_distance_matrix_df.loc[team_i, team_j]
-            for team_i in teams_distance_matrix_df.index for team_j in teams_distance_matrix_df.columns}
-        return teams_distance_matrix_dict
-
-    # store team results (sum of points) over last 3 seasons
+    def construct_distance_matrix(all_teams_coords_df):
+        """
+        Haversine distances (km) among teams as a (team, team) array, rows and columns in the order of
+        all_teams_coords_df, i.e. team index - 1
+        """
+        coords = all_teams_coords_df[["lat", "lon"]].to_numpy()
+        # comb=True broadcasts all pairs in one call
+        return haversine_vector(coords, coords, comb=True)
+
     @staticmethod
-    def build_team_performance(teams_list):
-        team_season_points_dict = defaultdict(lambda: dict(zip(range(18, 21), [0] * 3)))
-        # consider last 3 seasons
-        for year in range(18, 21):
-            season_data = pd.read_csv(f"data/D1_{year}-{year + 1}.csv")
-            for index, row in season_data.iterrows():
-                if row['FTR'] == 'H' and row['HomeTeam'] in teams_list:
-                    team_season_points_dict[row['HomeTeam']][year] += 3
-                elif row['FTR'] == 'A' and row['AwayTeam'] in teams_list:
-                    team_season_points_dict[row['AwayTeam']][year] += 3
-                elif row['HomeTeam'] in teams_list and row['AwayTeam'] in teams_list:
-                    team_season_points_dict[row['HomeTeam']][year] += 1
-                    team_season_points_dict[row['AwayTeam']][year] += 1
-        return team_season_points_dict
+    def build_season_points(season_results_df, teams_list):
+        """
+        Points of every team of teams_list in one season: 3 for a win, 1 for a draw. Draws only count when both
+        teams are in teams_list
+        """
+        result = season_results_df["FTR"].astype(str).to_numpy()
+        home_teams = season_results_df["HomeTeam"].astype(str).to_numpy()
+        away_teams = season_results_df["AwayTeam"].astype(str).to_numpy()
+        draw = (result != "H") & (result != "A") & np.isin(home_teams, teams_list) & np.isin(away_teams, teams_list)
+        home_points = np.where(result == "H", 3, np.where(draw, 1, 0))
+        away_points = np.where(result == "A", 3, np.where(draw, 1, 0))
+        points = pd.concat([pd.Series(home_points, index=home_teams), pd.Series(away_points, index=away_teams)])
+        return points.groupby(level=0).sum().reindex(teams_list, fill_value=0)
 
     @staticmethod
-    def build_team_rank(teams_list, team_name_index_map):
+    def build_team_performance(teams_list, season_weights=HISTORY_SEASON_WEIGHTS, cache_dir=SEASON_CACHE_DIR,
+                               history_file_pattern=SEASON_RESULTS_PATH):
         """
-        Team rank is a weighted sum of points over last 3 seasons
+        Points of every team (rows) in every season of season_weights (columns, by start year)
         """
-        team_season_points_dict = DataPreprocess.build_team_performance(teams_list)
-        team_ranks_dict = {}
-        for team in teams_list:
-            team_ranks_dict.setdefault(team_name_index_map[team],
-                                       round(0.5 * team_season_points_dict[team].get(20, 0) + 0.3 *
-                                             team_season_points_dict[
+        return pd.DataFrame({
+            year: DataPreprocess.build_season_points(
+                DataPreprocess.read_season_results(history_file_pattern.format(year, year + 1), cache_dir), teams_list)
+            for year in season_weights
+        }, index=teams_list)
 
-                                                 team].get(19, 0) + 0.2 * team_season_points_dict[team].get(18, 0)))
-        return team_ranks_dict
+    @staticmethod
+    def build_team_rank(teams_list, team_name_index_map, season_weights=HISTORY_SEASON_WEIGHTS,
+                        team_season_points=None):
+        """
+        Team rank is a weighted sum of points over the seasons of season_weights
+        """
+        if team_season_points is None:
+            team_season_points = DataPreprocess.build_team_performance(teams_list, season_weights)
+        weighted_points = sum(weight * team_season_points[year] for year, weight in season_weights.items())
+        return {team_name_index_map[team]: round(float(points)) for team, points in weighted_points.items()}
 
     def build_match_attractiveness(self):
         """
-        Calculate match attractiveness ranking
-        Formula encourages match between top ranked teams in later stage of the season. With less priority matches of
-        teams with similar ranks are favoured
+        Calculate match attractiveness ranking with attractiveness_formula, by default rank_attractiveness
         """
-        match_attractiveness_dict = {
-            (team_i, team_j, week_k): (rank_i + rank_j) * (1 + week_k / 10) * (1 - 1 / (1 + abs(rank_i - rank_j)))
-            for team_i in self.teams_range
-            for team_j in self.teams_range
-            for week_k in self.weeks_range
-            for rank_i, rank_j in [(self.team_ranks_dict[team_i], self.team_ranks_dict[team_j])]
-        }
-        return match_attractiveness_dict
+        team_ranks = np.array([self.team_ranks_dict[team] for team in self.teams_range], dtype=float)
+        pair_matrix, week_factors = self.attractiveness_formula(team_ranks, np.array(self.weeks_range, dtype=float))
+        return MatchAttractiveness(self.teams_range, self.weeks_range, pair_matrix, week_factors)
 
     @staticmethod
-    def build_conflict_home_match_list(team_distance_matrix_dict):
+    def build_conflict_home_match_list(team_distance_matrix, teams_range, conflict_radius_km=CONFLICT_RADIUS_KM):
         """
-        Prepare list of team pairs that have stadiums close enough to avoid schedule with 
+        Prepare list of team pairs that have stadiums close enough (within conflict_radius_km) to avoid schedule with
         home matches for both on the same week
         """
-        conflict_home_match_list = [(team_i, team_j) for (team_i, team_j) in team_distance_matrix_dict.keys()
-                                    if team_distance_matrix_dict[(team_i, team_j)] < 15 and team_i != team_j]
-        return conflict_home_match_list
+        close = team_distance_matrix < conflict_radius_km
+        np.fill_diagonal(close, False)
+        rows, cols = np.nonzero(close)
+        return [(teams_range[row], teams_range[col]) for row, col in zip(rows.tolist(), cols.tolist())]
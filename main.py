@@ -1,33 +1,330 @@
 from data_preprocesser import DataPreprocess
 from data_postprocess import DataPostprocess
 from model.mip import Model
+from model.rolling_horizon import RollingHorizonSolver
+from model.solver import SolverConfig
+from model.warm_start import WarmStartBuilder
+from pipeline_metrics import METRICS_FILE, PipelineMetrics
+from schedule_cache import ScheduleCache
+from schedule_validator import ScheduleValidator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+import pyomo.environ as pe
 import logging
+import os
 import sys
+import time
 
-def run_pipeline():
+# preprocessed data, model options and solver config shared by the scenarios of a weight sweep worker process
+_sweep_state = None
+# handler of the pipeline log, on stderr so that stdout stays free for results such as the JSON of the CLI
+LOG_HANDLER = logging.StreamHandler(stream=sys.stderr)
+LOG_HANDLER.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s"))
+
+
+def build_model(dp, **model_kwargs):
+    return Model(dp.teams_list,
+                 dp.teams_range,
+                 dp.weeks_range,
+                 dp.team_distance_matrix,
+                 dp.team_ranks_dict,
+                 dp.match_attractiveness,
+                 dp.conflict_home_match_list,
+                 **model_kwargs)
+
+
+def configure_logging():
+    """
+    Log INFO records to stderr through LOG_HANDLER, which is added to the root logger only once
+    """
     logger = logging.getLogger()
     logger.setLevel(logging.INFO)
-    handler = logging.StreamHandler(stream=sys.stdout)
-    formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    if LOG_HANDLER not in logger.handlers:
+        logger.addHandler(LOG_HANDLER)
+    return logger
+
+
+def extract_schedule(m):
+    """
+    Season matches of a solved model as (home team, away team, week)
+    """
+    return [tuple(match) for match in DataPostprocess.extract_chosen_matches(m).tolist()]
+
+
+def load_warm_start(dp, model):
+    """
+    Load the constructive warm start into the model. Returns False, leaving the model alone, for leagues the warm
+    start does not cover (an odd number of teams or a season other than a double round robin)
+    """
+    logger = logging.getLogger()
+    if not WarmStartBuilder.supports(len(dp.teams_range), len(dp.weeks_range)):
+        logger.info(f'No warm start for {len(dp.teams_range)} teams over {len(dp.weeks_range)} weeks, solving cold')
+        return False
+    warm_start = WarmStartBuilder(dp.teams_range, dp.weeks_range, dp.conflict_home_match_list)
+    missing_matches = WarmStartBuilder.load_into_model(model.m, warm_start.schedule)
+    logger.info(f'Warm start built with {warm_start.violations} remaining rule violations, '
+                f'{missing_matches} matches fall on forbidden slots')
+    return True
 
+
+def run_pipeline(builder_mode="rule", solver_config=None, forbidden_slots=None, scheme="standard",
+                 preprocess_kwargs=None, cache=None, render_map=True, metrics_file=METRICS_FILE, track_memory=False,
+                 profile_build=None, rolling_horizon=None):
+    """
+    Preprocess, build, solve and postprocess. With a ScheduleCache an unchanged data and configuration returns the
+    cached schedule without building and solving the model. render_map=False skips the teams map image, e.g. for
+    headless or batch runs.
+
+    Every run appends one JSON record of PipelineMetrics (phase timings, model size, solver outcome and with
+    track_memory the peak memory of each phase) to metrics_file (None to skip the record and the model size count)
+    and attaches it to the output as .metrics. profile_build is an optional path for cProfile stats of the model build.
+
+    rolling_horizon, a dict of RollingHorizonSolver options such as {"window_size": 6, "overlap": 2}, solves the
+    season window by window instead of in one piece
+    """
+    logger = configure_logging()
+
+    metrics = PipelineMetrics(track_memory, profile_build)
+    metrics.add_settings(builder_mode=builder_mode, forbidden_slots=forbidden_slots, scheme=scheme,
+                         preprocess_kwargs=preprocess_kwargs, rolling_horizon=rolling_horizon, cached=False)
     logger.info('Start of Data Preprocessing')
-    dp = DataPreprocess()
+    with metrics.phase('preprocess'):
+        dp = DataPreprocess(**(preprocess_kwargs or {}))
+    if cache is not None:
+        model_kwargs = {'builder_mode': builder_mode, 'forbidden_slots': forbidden_slots, 'scheme': scheme}
+        if rolling_horizon is not None:
+            model_kwargs['rolling_horizon'] = rolling_horizon
+        cache_key = ScheduleCache.cache_key(dp.input_files(), preprocess_kwargs, model_kwargs,
+                                            solver_config if solver_config is not None else SolverConfig())
+        entry = cache.get(cache_key)
+        if entry is not None:
+            logger.info(f'Loaded cached schedule {cache_key[:12]}, objective {entry["objective"]}')
+            metrics.record['settings']['cached'] = True
+            if render_map:
+                with metrics.phase('map'):
+                    DataPostprocess.export_teams_map(dp.all_teams_coords_df)
+            with metrics.phase('postprocess'):
+                output = DataPostprocess(None, dp.teams_name_index_map, dp.all_teams_coords_df,
+                                         chosen_matches=entry['chosen_matches'])
+            emit_metrics(metrics, metrics_file)
+            output.metrics = metrics.record
+            return output
+    if render_map:
+        with metrics.phase('map'):
+            DataPostprocess.export_teams_map(dp.all_teams_coords_df)
     logger.info('Start of building model')
-    model = Model(dp.teams_list,
-                  dp.teams_range,
-                  dp.weeks_range,
-                  dp.team_distance_matrix_dict,
-                  dp.team_ranks_dict,
-                  dp.match_attractiveness_dict,
-                  dp.conflict_home_match_list)
+    with metrics.phase('build', profile=True):
+        model = build_model(dp, builder_mode=builder_mode, forbidden_slots=forbidden_slots, scheme=scheme,
+                            phase=metrics.phase)
+    if metrics_file is not None:
+        # counting nonzeros walks every row, about as long as the matrix build, so it is timed and skipped with
+        # the metrics
+        with metrics.phase('model_size'):
+            metrics.add_model_size(model.m)
+    if solver_config is not None and solver_config.warm_start and rolling_horizon is None:
+        logger.info('Start of building warm start')
+        with metrics.phase('warm_start'):
+            solver_config = replace(solver_config, warm_start=load_warm_start(dp, model))
     logger.info('Start of solving model')
-    solution = Model.solve_model(model.m)
+    with metrics.phase('solve'):
+        if rolling_horizon is not None:
+            solver = RollingHorizonSolver(model, solver_config, **rolling_horizon)
+            solve_result = solver.solve()
+            for sweep, weeks, status, objective, wall_time in solver.window_log:
+                logger.info(f'Window of weeks {weeks[0]}-{weeks[-1]} (sweep {sweep + 1}): {status}, '
+                            f'objective {objective}, {wall_time:.1f}s')
+        else:
+            solve_result = Model.solve_model(model.m, solver_config)
+    metrics.add_solve_result(solve_result, solver_config)
+    logger.info(f'Solver finished with status {solve_result.status}, objective {solve_result.objective}, '
+                f'gap {solve_result.gap}, {solve_result.wall_time:.1f}s')
+    if not solve_result.has_solution:
+        emit_metrics(metrics, metrics_file)
+        raise RuntimeError(f'No feasible schedule found, solver status: {solve_result.status}')
     logger.info('Start of postprocessing model')
-    output = DataPostprocess(solution, dp.teams_name_index_map, dp.all_teams_coords_df)
+    with metrics.phase('postprocess'):
+        output = DataPostprocess(solve_result.model, dp.teams_name_index_map, dp.all_teams_coords_df)
+    if cache is not None:
+        cache.put(cache_key, output.chosen_matches, solve_result, model.m)
+    emit_metrics(metrics, metrics_file)
+    output.metrics = metrics.record
     return output
 
 
+def emit_metrics(metrics, metrics_file):
+    logging.getLogger().info(f'Pipeline metrics: {metrics.to_json()}')
+    if metrics_file is not None:
+        metrics.write(metrics_file)
+
+
+def compare_warm_start(target_gap=0.01, solver_config=None, **model_kwargs):
+    """
+    Solve the same model cold and warm-started and report time to first feasible and time to target gap of both runs
+    """
+    logger = logging.getLogger()
+    solver_config = solver_config if solver_config is not None else SolverConfig(name="highs", time_limit=600)
+    dp = DataPreprocess()
+    report = {}
+    for warm_start in (False, True):
+        model = build_model(dp, **model_kwargs)
+        if warm_start:
+            load_warm_start(dp, model)
+        solve_result = Model.solve_model(model.m, replace(solver_config, warm_start=warm_start))
+        run = 'warm' if warm_start else 'cold'
+        report[run] = {
+            'status': solve_result.status,
+            'objective': solve_result.objective,
+            'gap': solve_result.gap,
+            'wall_time': solve_result.wall_time,
+            'time_to_first_feasible': solve_result.time_to_first_feasible,
+            'time_to_target_gap': solve_result.time_to_gap(target_gap),
+        }
+        logger.info(f'{run} start: {report[run]}')
+    return report
+
+
+def _init_sweep_worker(dp, model_kwargs, solver_config):
+    global _sweep_state
+    _sweep_state = (dp, model_kwargs, solver_config)
+
+
+def solve_weighted_scenario(weights):
+    """
+    Build and solve the model for one (away trip weight, attractiveness weight) pair in a sweep worker. Returns the
+    unweighted value of the objective terms, the solve stats and the schedule as (home, away, week) matches
+    """
+    dp, model_kwargs, solver_config = _sweep_state
+    away_trip_weight, attractiveness_weight = weights
+    model = build_model(dp, away_trip_weight=away_trip_weight, attractiveness_weight=attractiveness_weight,
+                        **model_kwargs)
+    if solver_config.warm_start:
+        solver_config = replace(solver_config, warm_start=load_warm_start(dp, model))
+    solve_result = Model.solve_model(model.m, solver_config)
+    scenario = {
+        'away_trip_weight': away_trip_weight,
+        'attractiveness_weight': attractiveness_weight,
+        'status': solve_result.status,
+        'objective': solve_result.objective,
+        'gap': solve_result.gap,
+        'wall_time': solve_result.wall_time,
+        'travel': None,
+        'away_trip_travel': None,
+        'attractiveness': None,
+        'schedule': None,
+    }
+    if solve_result.has_solution:
+        m = solve_result.model
+        scenario['schedule'] = extract_schedule(m)
+        scenario['travel'] = pe.value(m.travel_distance_expr)
+        # scored on the schedule, the model only carries the term if its weight is nonzero
+        validator = ScheduleValidator.from_preprocess(dp)
+        scenario['away_trip_travel'] = float(validator.away_trip_travel(validator.to_array(scenario['schedule'])))
+        scenario['attractiveness'] = pe.value(m.attractiveness_expr)
+    return scenario
+
+
+def pareto_front(scenarios):
+    """
+    Scenarios with a schedule that no other scenario beats in both back-to-back away travel and attractiveness (both
+    minimized, as in the objective). Scenarios with identical term values are reported once. The season travel is
+    the same for every complete schedule and plays no part
+    """
+    solved = sorted((scenario for scenario in scenarios if scenario['schedule'] is not None),
+                    key=lambda scenario: (scenario['away_trip_travel'], scenario['attractiveness']))
+    front = []
+    for scenario in solved:
+        if not front or scenario['attractiveness'] < front[-1]['attractiveness']:
+            front.append(scenario)
+    return front
+
+
+def run_weight_sweep(weight_grid, solver_config=None, max_workers=None, preprocess_kwargs=None, **model_kwargs):
+    """
+    Solve one scenario per (away trip weight, attractiveness weight) pair of weight_grid in a process pool. The data
+    is preprocessed once and handed to every worker when it starts. Returns all scenarios in grid order and their
+    Pareto front. In the compact mode, scenarios with an away trip weight are built without the home/away symmetry
+    breaking row, which the term does not allow
+    """
+    logger = logging.getLogger()
+    solver_config = solver_config if solver_config is not None else \
+        SolverConfig(name="highs", time_limit=600, threads=1, tee=False, logfile=None, warm_start=True)
+    if max_workers is None:
+        max_workers = max(1, (os.cpu_count() or 1) // (solver_config.threads or 1))
+    dp = DataPreprocess(**(preprocess_kwargs or {}))
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_sweep_worker,
+                             initargs=(dp, model_kwargs, solver_config)) as executor:
+        scenarios = list(executor.map(solve_weighted_scenario, weight_grid))
+    for scenario in scenarios:
+        logger.info(f"weights ({scenario['away_trip_weight']}, {scenario['attractiveness_weight']}): "
+                    f"status {scenario['status']}, away trip travel {scenario['away_trip_travel']}, "
+                    f"attractiveness {scenario['attractiveness']}, {scenario['wall_time']:.1f}s")
+    return scenarios, pareto_front(scenarios)
+
+
+def schedule_league(league, preprocess_kwargs, solver_config, model_kwargs):
+    """
+    Preprocess, build and solve one league in a batch worker. Returns the solve stats, the wall time of every phase
+    and the schedule as (home team name, away team name, week)
+    """
+    timing = {}
+    start = time.perf_counter()
+    dp = DataPreprocess(**preprocess_kwargs)
+    timing['preprocess'] = time.perf_counter() - start
+    start = time.perf_counter()
+    model = build_model(dp, **model_kwargs)
+    if solver_config.warm_start:
+        solver_config = replace(solver_config, warm_start=load_warm_start(dp, model))
+    timing['build'] = time.perf_counter() - start
+    solve_result = Model.solve_model(model.m, solver_config)
+    timing['solve'] = solve_result.wall_time
+    schedule = None
+    if solve_result.has_solution:
+        schedule = [(dp.teams_list[team_i - 1], dp.teams_list[team_j - 1], week_k)
+                    for team_i, team_j, week_k in extract_schedule(solve_result.model)]
+    return {
+        'league': league,
+        'teams': len(dp.teams_list),
+        'weeks': len(dp.weeks_range),
+        'status': solve_result.status,
+        'objective': solve_result.objective,
+        'gap': solve_result.gap,
+        'timing': timing,
+        'schedule': schedule,
+    }
+
+
+def run_league_batch(leagues, core_budget=None, solver_threads=None, solver_config=None, **model_kwargs):
+    """
+    Schedule several leagues in parallel worker processes. leagues maps a league name to its DataPreprocess
+    arguments, e.g. {"D1": {"league_file": "data/D1_21-22.csv", "history_file_pattern": "data/D1_{}-{}.csv"}}.
+    core_budget (all cores by default) is split between concurrent leagues and solver threads per league;
+    solver_threads defaults to an even share of the budget. Returns the per league results keyed by league name
+    """
+    logger = logging.getLogger()
+    core_budget = core_budget if core_budget is not None else (os.cpu_count() or 1)
+    if solver_threads is None:
+        solver_threads = max(1, core_budget // len(leagues))
+    max_workers = max(1, min(len(leagues), core_budget // solver_threads))
+    solver_config = solver_config if solver_config is not None else \
+        SolverConfig(name="highs", time_limit=600, tee=False, logfile=None, warm_start=True)
+    solver_config = replace(solver_config, threads=solver_threads)
+    logger.info(f'Scheduling {len(leagues)} leagues, {max_workers} at a time with {solver_threads} solver threads each')
+    results = {}
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {league: executor.submit(schedule_league, league, preprocess_kwargs, solver_config, model_kwargs)
+                   for league, preprocess_kwargs in leagues.items()}
+        for league, future in futures.items():
+            try:
+                results[league] = future.result()
+            except Exception as error:
+                # a league with broken input should not take down the rest of the batch
+                logger.error(f'League {league} failed: {error!r}')
+                results[league] = {'league': league, 'status': 'error', 'error': repr(error)}
+                continue
+            logger.info(f"League {league}: status {results[league]['status']}, "
+                        f"objective {results[league]['objective']}, timing {results[league]['timing']}")
+    return results
+
+
 if __name__ == "__main__":
     run_pipeline()
@@ -0,0 +1,287 @@
+import math
+import random
+import time
+
+import pyomo.environ as pe
+from pyomo.repn import generate_standard_repn
+
+from model.objective import ObjectiveBuilder
+from model.sets import SetsBuilder
+from model.warm_start import WarmStartBuilder
+
+
+class AnnealingScheduler():
+    """
+    Simulated annealing over complete season schedules of a built model.
+
+    The schedule is kept as two (team, week) arrays: the opponent of every team and whether it plays at home. The
+    search starts from the WarmStartBuilder schedule and only uses moves that keep every pairing once per half, one
+    match per team per week and the home/away balance: swapping two rounds of the same half, flipping home and away
+    of both legs of a pairing and swapping two teams. Three home or away matches in a row, parallel home matches of
+    conflict pairs, matches on slots missing from the model and schedules disagreeing with fixed variables are
+    penalized, so the search also respects fixings made for re-planning.
+
+    Match costs are the objective coefficients of the model, so the search optimizes the same objective as the MIP.
+    Every move is scored by re-evaluating only the (team, week) cells it changes and the objective and violation
+    totals are updated by the resulting deltas. The work per move is linear in the changed cells: constant for a
+    home/away flip, O(teams) for a round swap and O(weeks) for a team swap, against O(teams * weeks) for scoring the
+    whole schedule. An optional SolveListener gets every improving schedule and can stop the search
+    """
+
+    def __init__(self, m, seed=0, penalty_weight=None, initial_schedule=None, listener=None):
+        self.m = m
+        self.listener = listener
+        self.random = random.Random(seed)
+        self.teams = list(m.teams_range_set)
+        self.weeks = list(m.weeks_range_set)
+        self.n_teams = len(self.teams)
+        self.n_weeks = len(self.weeks)
+        self.offset = m.mirror_offset_param.value
+        self.half = self.n_weeks // 2
+        team_position = {team: position for position, team in enumerate(self.teams)}
+        week_position = {week: position for position, week in enumerate(self.weeks)}
+        self.conflict_pairs = [(team_position[team_i], team_position[team_j])
+                               for team_i, team_j in m.conflict_home_match_set]
+        self.team_conflicts = [[] for _ in self.teams]
+        for pair_position, (team_i, team_j) in enumerate(self.conflict_pairs):
+            self.team_conflicts[team_i].append(pair_position)
+            self.team_conflicts[team_j].append(pair_position)
+
+        # flat (home, away, week) cubes: cost of the slot deciding the match, whether the model has such a slot and
+        # the value of the slot if it is fixed. A mirrored slot carries its cost on the first-half leg only.
+        # Fixed variables are part of the objective constant, so their slots are costed explicitly
+        repn = generate_standard_repn(m.OBJ.expr, compute_values=True)
+        slot_cost = {var.index(): coef for var, coef in zip(repn.linear_vars, repn.linear_coefs)}
+        fixed_slots = [slot for slot in m.match_index_set if m.is_match_this_week_var[slot].fixed]
+        if fixed_slots:
+            for slot in fixed_slots:
+                m.is_match_this_week_var[slot].unfix()
+            repn = generate_standard_repn(m.OBJ.expr, compute_values=True)
+            slot_cost = {var.index(): coef for var, coef in zip(repn.linear_vars, repn.linear_coefs)}
+            for slot in fixed_slots:
+                m.is_match_this_week_var[slot].fix()
+        self.objective_constant = repn.constant
+        # back-to-back away travel (ObjectiveBuilder.build_away_trip_travel) is scored directly from the schedule,
+        # its variables only take the smallest value their rows allow
+        self.away_trip_weight = 0.0
+        if hasattr(m, "away_trip_travel_var"):
+            self.away_trip_weight = next((coef for var, coef in zip(repn.linear_vars, repn.linear_coefs)
+                                          if var.parent_component() is m.away_trip_travel_var), 0.0)
+        self.trip_travel = [[pe.value(m.distance_between_teams_param[host, team]) ** 2 if host != team else 0.0
+                             for host in self.teams] for team in self.teams]
+        n_cells = self.n_teams * self.n_teams * self.n_weeks
+        self.cost = [0.0] * n_cells
+        self.allowed = [False] * n_cells
+        self.fixed_value = [None] * n_cells
+        for team_i, team_j, week_k, slot in SetsBuilder.season_matches(m):
+            key = self.cell_key(team_position[team_i], team_position[team_j], week_position[week_k])
+            self.allowed[key] = True
+            if m.is_match_this_week_var[slot].fixed:
+                self.fixed_value[key] = round(m.is_match_this_week_var[slot].value)
+            if slot == (team_i, team_j, week_k):
+                self.cost[key] = slot_cost.get(slot, 0.0)
+        # every match fixed to 1 counts as a violation until it is played
+        self.fixed_matches = sum(1 for value in self.fixed_value if value == 1)
+
+        initial = initial_schedule if initial_schedule is not None else \
+            WarmStartBuilder(self.teams, self.weeks, list(m.conflict_home_match_set), seed=seed).schedule
+        self.opponent = [[0] * self.n_weeks for _ in self.teams]
+        self.home = [[0] * self.n_weeks for _ in self.teams]
+        for team_i, team_j, week_k in initial:
+            home, away, week = team_position[team_i], team_position[team_j], week_position[week_k]
+            self.opponent[home][week], self.home[home][week] = away, 1
+            self.opponent[away][week], self.home[away][week] = home, 0
+
+        self.total_cost, self.total_violations = self.evaluate(
+            (team, week) for team in range(self.n_teams) for week in range(self.n_weeks))
+        self.total_violations += self.fixed_matches
+        self.penalty_weight = penalty_weight
+
+    def cell_key(self, home, away, week):
+        return (home * self.n_teams + away) * self.n_weeks + week
+
+    def evaluate(self, cells):
+        """
+        Cost and violation count of everything touching the given (team, week) cells: the matches played in them,
+        the three-week windows and back-to-back away trips containing them and the conflict pairs of their teams in
+        those weeks. Played matches fixed to 1 count -1, they offset the fixed_matches added to the total
+        """
+        home, opponent, n_weeks = self.home, self.opponent, self.n_weeks
+        windows, conflicts, matches, trips = set(), set(), set(), set()
+        for team, week in cells:
+            for start in range(max(0, week - 2), min(week, n_weeks - 3) + 1):
+                windows.add((team, start))
+            for pair_position in self.team_conflicts[team]:
+                conflicts.add((pair_position, week))
+            matches.add((team if home[team][week] else opponent[team][week], week))
+            if self.away_trip_weight:
+                for start in range(max(0, week - 1), min(week, n_weeks - 2) + 1):
+                    trips.add((team, start))
+
+        cost, violations = 0.0, 0
+        for team, week in matches:
+            key = self.cell_key(team, opponent[team][week], week)
+            cost += self.cost[key]
+            violations += not self.allowed[key]
+            if self.fixed_value[key] is not None:
+                violations += 1 if self.fixed_value[key] == 0 else -1
+        for team, start in windows:
+            home_count = home[team][start] + home[team][start + 1] + home[team][start + 2]
+            violations += home_count == 0 or home_count == 3
+        for pair_position, week in conflicts:
+            team_i, team_j = self.conflict_pairs[pair_position]
+            violations += home[team_i][week] and home[team_j][week]
+        for team, start in trips:
+            if not home[team][start] and not home[team][start + 1]:
+                trip_travel = self.trip_travel[team]
+                cost += self.away_trip_weight * (trip_travel[opponent[team][start]] +
+                                                 trip_travel[opponent[team][start + 1]])
+        return cost, violations
+
+    def apply(self, changes):
+        """
+        Set (team, week, opponent, home) changes and return the changes that undo them
+        """
+        undo = [(team, week, self.opponent[team][week], self.home[team][week]) for team, week, _, _ in changes]
+        for team, week, opponent, home in changes:
+            self.opponent[team][week], self.home[team][week] = opponent, home
+        return undo
+
+    def round_swap_changes(self):
+        if self.offset:
+            # mirrored rounds move together with their first-half round
+            week_a, week_b = self.random.sample(range(self.half), 2)
+            week_pairs = [(week_a, week_b), (week_a + self.offset, week_b + self.offset)]
+        else:
+            first_week = self.half * self.random.randrange(2)
+            week_a, week_b = self.random.sample(range(first_week, first_week + self.half), 2)
+            week_pairs = [(week_a, week_b)]
+        changes = []
+        for week_a, week_b in week_pairs:
+            for team in range(self.n_teams):
+                changes.append((team, week_a, self.opponent[team][week_b], self.home[team][week_b]))
+                changes.append((team, week_b, self.opponent[team][week_a], self.home[team][week_a]))
+        return changes
+
+    def home_away_flip_changes(self):
+        team_i, week_a = self.random.randrange(self.n_teams), self.random.randrange(self.n_weeks)
+        team_j = self.opponent[team_i][week_a]
+        week_b = next(week for week in range(self.n_weeks)
+                      if week != week_a and self.opponent[team_i][week] == team_j)
+        home_i = self.home[team_i][week_a]
+        return [(team_i, week_a, team_j, 1 - home_i), (team_j, week_a, team_i, home_i),
+                (team_i, week_b, team_j, home_i), (team_j, week_b, team_i, 1 - home_i)]
+
+    def team_swap_changes(self):
+        team_a, team_b = self.random.sample(range(self.n_teams), 2)
+        relabel = {team_a: team_b, team_b: team_a}
+        changes = []
+        for week in range(self.n_weeks):
+            opponent_a, opponent_b = self.opponent[team_a][week], self.opponent[team_b][week]
+            changes.append((team_a, week, relabel.get(opponent_b, opponent_b), self.home[team_b][week]))
+            changes.append((team_b, week, relabel.get(opponent_a, opponent_a), self.home[team_a][week]))
+            if opponent_a != team_b:
+                changes.append((opponent_a, week, team_b, self.home[opponent_a][week]))
+                changes.append((opponent_b, week, team_a, self.home[opponent_b][week]))
+        return changes
+
+    def random_changes(self):
+        move = self.random.randrange(3)
+        if move == 0:
+            return self.round_swap_changes()
+        if move == 1:
+            return self.home_away_flip_changes()
+        return self.team_swap_changes()
+
+    def try_move(self, changes):
+        """
+        Apply changes and return (cost delta, violation delta, undo changes)
+        """
+        cells = [(team, week) for team, week, _, _ in changes]
+        cost_before, violations_before = self.evaluate(cells)
+        undo = self.apply(changes)
+        cost_after, violations_after = self.evaluate(cells)
+        return cost_after - cost_before, violations_after - violations_before, undo
+
+    def calibrate(self, n_samples=200):
+        """
+        Initial temperature from the mean cost change of random moves; unless given, the penalty per violation is
+        set above the largest sampled cost change so that trading a violation for cost never pays off
+        """
+        cost_deltas = []
+        for _ in range(n_samples):
+            cost_delta, _, undo = self.try_move(self.random_changes())
+            self.apply(undo)
+            if cost_delta:
+                cost_deltas.append(abs(cost_delta))
+        if not cost_deltas:
+            cost_deltas = [1.0]
+        if self.penalty_weight is None:
+            self.penalty_weight = 2 * max(cost_deltas)
+        return sum(cost_deltas) / len(cost_deltas)
+
+    def snapshot(self):
+        return [row[:] for row in self.opponent], [row[:] for row in self.home]
+
+    def schedule(self, state):
+        opponent, home = state
+        return [(self.teams[team], self.teams[opponent[team][week]], self.weeks[week])
+                for team in range(self.n_teams) for week in range(self.n_weeks) if home[team][week]]
+
+    def report_incumbent(self, trace_entry, state, min_interval=0.5):
+        # improvements come in bursts early on, the listener gets at most one schedule per min_interval seconds
+        if self.listener is None or trace_entry[0] - self.last_report < min_interval:
+            return
+        self.last_report = trace_entry[0]
+        self.listener.on_incumbent(trace_entry[0], trace_entry[1], self.schedule(state))
+
+    def solve(self, time_limit=10.0, final_temperature_ratio=1e-3, stop_at_first_feasible=False):
+        """
+        Anneal for time_limit seconds, or until the first schedule without violations if stop_at_first_feasible, and
+        load the best schedule into the model variables. Returns (status, objective, wall time, incumbent trace); if
+        no schedule without violations was found the status is infeasible, the objective None and the model
+        variables are left as they were
+        """
+        start = time.perf_counter()
+        initial_temperature = self.calibrate()
+        temperature = initial_temperature
+        best_state, best_cost = None, math.inf
+        incumbent_trace = []
+        self.last_report = -math.inf
+        if self.total_violations == 0:
+            best_state, best_cost = self.snapshot(), self.total_cost
+            incumbent_trace.append((time.perf_counter() - start, best_cost + self.objective_constant, None, None))
+            self.report_incumbent(incumbent_trace[-1], best_state)
+
+        iteration = 0
+        while True:
+            if iteration % 100 == 0:
+                elapsed = time.perf_counter() - start
+                if elapsed >= time_limit or (stop_at_first_feasible and best_state is not None):
+                    break
+                if self.listener is not None and iteration % 10000 == 0 and self.listener.on_progress(
+                        elapsed, best_cost + self.objective_constant if best_state is not None else None, None, None):
+                    break
+                temperature = initial_temperature * final_temperature_ratio ** (elapsed / time_limit)
+            iteration += 1
+
+            cost_delta, violations_delta, undo = self.try_move(self.random_changes())
+            delta = cost_delta + self.penalty_weight * violations_delta
+            if delta <= 0 or self.random.random() < math.exp(-delta / temperature):
+                self.total_cost += cost_delta
+                self.total_violations += violations_delta
+                if self.total_violations == 0 and self.total_cost < best_cost - 1e-9:
+                    best_state, best_cost = self.snapshot(), self.total_cost
+                    incumbent_trace.append((time.perf_counter() - start, best_cost + self.objective_constant,
+                                            None, None))
+                    self.report_incumbent(incumbent_trace[-1], best_state)
+            else:
+                self.apply(undo)
+
+        if self.listener is not None and best_state is not None and incumbent_trace[-1][0] > self.last_report:
+            self.listener.on_incumbent(incumbent_trace[-1][0], incumbent_trace[-1][1], self.schedule(best_state))
+        if best_state is None:
+            return "infeasible", None, time.perf_counter() - start, incumbent_trace
+        WarmStartBuilder.load_into_model(self.m, self.schedule(best_state))
+        ObjectiveBuilder.prepare_mip_start(self.m)
+        return "feasible", pe.value(self.m.OBJ), time.perf_counter() - start, incumbent_trace
@@ -0,0 +1,178 @@
+import numpy as np
+import pyomo.environ as pe
+from model.constraints import ConstraintsBuilder
+from model.sets import SetsBuilder
+
+
+class CompactConstraintsBuilder(ConstraintsBuilder):
+    """
+    Constraints over home/away indicators per team and week instead of repeated sums over all opponents.
+
+    is_home_var[team, week] and is_away_var[team, week] are linked once to the slots of is_match_this_week_var,
+    afterwards the weekly, three consecutive rounds and conflict rows only touch two or three indicators. The
+    home/away balance is dropped as it follows from every ordered pairing being played once, as is the second
+    orientation of every conflict pair. When the season is a double round robin (2 * (teams - 1) weeks) every team
+    plays every week, so the weekly rows and, as the home weeks of a conflict pair can not overlap, the conflict rows
+    hold with equality.
+
+    Swapping home and away of every match maps a schedule onto one with the same objective if distances and
+    attractiveness are symmetric in the two teams and back-to-back away travel (away_trip_weight, which the swap
+    turns into home stands) is not part of the objective; then the first team is fixed to play at home in the first
+    week.
+    Rows are skipped like in ConstraintsBuilder and the mirrored scheme is handled the same way.
+
+    The formulation gives a smaller model, not a faster solve: its LP relaxation has the same bound as the one of
+    ConstraintsBuilder and HiGHS needs longer for it, also with the balance rows kept or without symmetry breaking
+    """
+
+    def __init__(self, m, conflict_home_match_list, match_attractiveness=None, away_trip_weight=0.0):
+        self.match_attractiveness = match_attractiveness
+        self.away_trip_weight = away_trip_weight
+        super().__init__(m, conflict_home_match_list)
+
+    def build_all_constraints(self):
+        self.build_indicator_variables(self.m)
+        self.build_each_match_is_played_once_constr(self.m)
+        self.build_max_one_match_per_team_per_week_constr(self.m)
+        if not SetsBuilder.is_mirrored(self.m):
+            self.home_away_matches_same_teams(self.m)
+        self.build_three_consecutive_rounds_constr(self.m)
+        self.build_conflict_home_match_constr(self.m)
+        self.build_symmetry_breaking_constr(self.m)
+
+    @staticmethod
+    def is_double_round_robin(m):
+        return len(m.weeks_range_set) == 2 * (len(m.teams_range_set) - 1)
+
+    def build_indicator_variables(self, m):
+        """
+        Home and away indicator of every team and week, integral through the linking rows
+        """
+        m.is_home_var = pe.Var(m.teams_range_set, m.weeks_range_set, domain=pe.UnitInterval, initialize=0)
+        m.is_away_var = pe.Var(m.teams_range_set, m.weeks_range_set, domain=pe.UnitInterval, initialize=0)
+
+        def _home_indicator_link_rule(m, team_i, week_k):
+            return m.is_home_var[team_i, week_k] == \
+                sum(m.is_match_this_week_var[match] for match in m.home_matches_set[team_i, week_k])
+
+        def _away_indicator_link_rule(m, team_i, week_k):
+            return m.is_away_var[team_i, week_k] == \
+                sum(m.is_match_this_week_var[match] for match in m.away_matches_set[team_i, week_k])
+
+        m.home_indicator_link_constr = pe.Constraint(m.teams_range_set, m.weeks_range_set,
+                                                     rule=_home_indicator_link_rule)
+        m.away_indicator_link_constr = pe.Constraint(m.teams_range_set, m.weeks_range_set,
+                                                     rule=_away_indicator_link_rule)
+        return m
+
+    def build_max_one_match_per_team_per_week_constr(self, m):
+        """
+         Maximum one match for each team per week (home or away), exactly one in a double round robin
+        """
+        plays_every_week = CompactConstraintsBuilder.is_double_round_robin(m)
+
+        def _max_one_match_per_team_per_week_rule(m, team_i, week_k):
+            if week_k in m.weeks_mirrored_set:
+                return pe.Constraint.Skip
+            plays = m.is_home_var[team_i, week_k] + m.is_away_var[team_i, week_k]
+            return plays == 1 if plays_every_week else plays <= 1
+
+        m.max_one_match_per_team_per_week_constr = pe.Constraint(m.teams_range_set, m.weeks_range_set,
+                                                                 rule=_max_one_match_per_team_per_week_rule)
+        return m
+
+    def build_three_consecutive_rounds_constr(self, m):
+        """
+        No team can play more than two away matches in any three consecutive rounds.
+        No team can play more than two home matches in any three consecutive rounds.
+        """
+
+        def _three_consecutive_rounds_rule(indicator_var, team_i, week_k):
+            if (week_k + 2) not in m.weeks_range_set or week_k in m.weeks_mirrored_set:
+                return pe.Constraint.Skip
+            return sum(indicator_var[team_i, week] for week in range(week_k, week_k + 3)) <= 2
+
+        def three_consecutive_rounds_rule1(m, team_i, week_k):
+            return _three_consecutive_rounds_rule(m.is_home_var, team_i, week_k)
+
+        def three_consecutive_rounds_rule2(m, team_i, week_k):
+            return _three_consecutive_rounds_rule(m.is_away_var, team_i, week_k)
+
+        m.three_consecutive_rounds_constr1 = pe.Constraint(m.teams_range_set, m.weeks_range_set,
+                                                           rule=three_consecutive_rounds_rule1)
+        m.three_consecutive_rounds_constr2 = pe.Constraint(m.teams_range_set, m.weeks_range_set,
+                                                           rule=three_consecutive_rounds_rule2)
+
+    def build_conflict_home_match_constr(self, m):
+        """
+        Avoid regional doubles (e.g. no home game for two teams based in Berlin). List of conflict teams in that sense
+        is prepared in the preprocessing part.
+
+        Formulation: maximum one team from conflict pair has a home match each week, exactly one in a double round
+        robin where both teams play at home in half of the weeks
+        """
+        complementary = CompactConstraintsBuilder.is_double_round_robin(m)
+        conflict_pairs = sorted(set((min(team_i, team_j), max(team_i, team_j))
+                                    for team_i, team_j in self.conflict_home_match_list))
+
+        def _no_parallel_home_match_for_conflict_teams(m, team_conflict_i, team_conflict_j, week_k):
+            home_teams = m.is_home_var[team_conflict_i, week_k] + m.is_home_var[team_conflict_j, week_k]
+            return home_teams == 1 if complementary else home_teams <= 1
+
+        m.conflict_home_match_set = pe.Set(initialize=conflict_pairs, dimen=2)
+        m.conflict_home_match_constr = pe.Constraint(m.conflict_home_match_set, m.weeks_range_set,
+                                                     rule=_no_parallel_home_match_for_conflict_teams)
+
+    def is_flip_symmetric(self, m):
+        """
+        True if swapping home and away of all matches keeps every schedule feasible and its objective unchanged
+        """
+        if self.match_attractiveness is None or not CompactConstraintsBuilder.is_double_round_robin(m):
+            return False
+        # consecutive away matches become consecutive home matches, their travel changes
+        if self.away_trip_weight:
+            return False
+        n_teams = len(m.teams_range_set)
+        n_slot_weeks = len(m.weeks_range_set) - len(m.weeks_mirrored_set)
+        # forbidden slots are not symmetric in general
+        if len(m.match_index_set) != n_teams * (n_teams - 1) * n_slot_weeks:
+            return False
+        distance = np.fromiter(m.distance_between_teams_param.values(), dtype=float,
+                               count=n_teams ** 2).reshape(n_teams, n_teams)
+        pair_matrix = self.match_attractiveness.pair_matrix
+        return np.allclose(distance, distance.T) and np.allclose(pair_matrix, pair_matrix.T)
+
+    def build_symmetry_breaking_constr(self, m):
+        """
+        Of a schedule and its home/away swap only the one with the first team at home in the first week is kept
+        """
+        if not self.is_flip_symmetric(m):
+            return m
+        m.symmetry_breaking_constr = pe.Constraint(
+            expr=m.is_home_var[m.teams_range_set.first(), m.weeks_range_set.first()] == 1)
+        return m
+
+    @staticmethod
+    def prepare_mip_start(m):
+        """
+        Complete the current values of is_match_this_week_var to a start of the compact model: a schedule excluded
+        by the symmetry breaking row is swapped to home/away mirror, then the indicators are set from the slots.
+        Models without indicators are left alone
+        """
+        if not hasattr(m, "is_home_var"):
+            return
+        var = m.is_match_this_week_var
+        first_team, first_week = m.teams_range_set.first(), m.weeks_range_set.first()
+        if hasattr(m, "symmetry_breaking_constr") and m.symmetry_breaking_constr.active and \
+                not any(var[slot].value for slot in m.home_matches_set[first_team, first_week]):
+            values = {slot: var[slot].value for slot in m.match_index_set}
+            for team_i, team_j, week_k in m.match_index_set:
+                var[team_i, team_j, week_k].set_value(values[team_j, team_i, week_k])
+        home, away = {}, {}
+        for team_i, team_j, week_k, slot in SetsBuilder.season_matches(m):
+            value = var[slot].value or 0
+            home[team_i, week_k] = home.get((team_i, week_k), 0) + value
+            away[team_j, week_k] = away.get((team_j, week_k), 0) + value
+        for index in m.is_home_var:
+            m.is_home_var[index].set_value(home.get(index, 0))
+            m.is_away_var[index].set_value(away.get(index, 0))
@@ -1,7 +1,19 @@
 import pyomo.environ as pe
+from model.sets import SetsBuilder
 
 
 class ConstraintsBuilder():
+    """
+    Constraints over the sparse slots of is_match_this_week_var. Inequality rows whose number of binaries can not
+    exceed the right-hand side (e.g. after forbidden slots were removed) are skipped.
+
+    In the mirrored scheme rows of mirrored weeks repeat rows of modelled weeks and are skipped; half separation and
+    home/away balance hold by construction and are not built
+    """
+
+    # rows are summed over m.home_matches_set, m.away_matches_set and m.pair_matches_set
+    uses_incidence_sets = True
+
     def __init__(self, m, conflict_home_match_list):
         self.m = m
         self.conflict_home_match_list = conflict_home_match_list
@@ -10,9 +22,9 @@ class ConstraintsBuilder():
     def build_all_constraints(self):
         self.build_each_match_is_played_once_constr(self.m)
         self.build_max_one_match_per_team_per_week_constr(self.m)
-        self.build_no_match_with_itself_constr(self.m)
-        self.home_away_matches_same_teams(self.m)
-        self.build_balance_home_away_matches_constr(self.m)
+        if not SetsBuilder.is_mirrored(self.m):
+            self.home_away_matches_same_teams(self.m)
+            self.build_balance_home_away_matches_constr(self.m)
         self.build_three_consecutive_rounds_constr(self.m)
         self.build_conflict_home_match_constr(self.m)
 
@@ -23,10 +35,9 @@ class ConstraintsBuilder():
         """
 
         def _each_match_is_played_once_rule(m, team_i, team_j):
-            if team_i == team_j:
+            if team_i == team_j or (SetsBuilder.is_mirrored(m) and team_i > team_j):
                 return pe.Constraint.Skip
-            return sum(m.is_match_this_week_var[team_i, team_j, week_k]
-                       for week_k in m.weeks_range_set) == 1
+            return sum(m.is_match_this_week_var[match] for match in m.pair_matches_set[team_i, team_j]) == 1
 
         m.each_match_is_played_once_constr = pe.Constraint(m.teams_range_set, m.teams_range_set,
                                                            rule=_each_match_is_played_once_rule)
@@ -38,10 +49,12 @@ class ConstraintsBuilder():
         """
 
         def _max_one_match_per_team_per_week_rule(m, team_i, week_k):
-            return sum(m.is_match_this_week_var[team_i, team_j, week_k]
-                       for team_j in m.teams_range_set) + \
-                sum(m.is_match_this_week_var[team_j, team_i, week_k]
-                    for team_j in m.teams_range_set) <= 1
+            if week_k in m.weeks_mirrored_set:
+                return pe.Constraint.Skip
+            matches = list(m.home_matches_set[team_i, week_k]) + list(m.away_matches_set[team_i, week_k])
+            if len(matches) <= 1:
+                return pe.Constraint.Skip
+            return sum(m.is_match_this_week_var[match] for match in matches) <= 1
 
         m.max_one_match_per_team_per_week_constr = pe.Constraint(m.teams_range_set, m.weeks_range_set,
                                                                  rule=_max_one_match_per_team_per_week_rule)
@@ -53,47 +66,36 @@ class ConstraintsBuilder():
         Each team has equal number of home and away matches in the season
         """
         def _balance_home_away_matches_rule(m, team_i):
-            return (sum(m.is_match_this_week_var[team_i, team_j, week_k]
-                        for team_j in m.teams_range_set
-                        for week_k in m.weeks_range_set) ==
-                    sum(m.is_match_this_week_var[team_j, team_i, week_k]
-                        for team_j in m.teams_range_set
-                        for week_k in m.weeks_range_set))
+            return (sum(m.is_match_this_week_var[match]
+                        for week_k in m.weeks_range_set
+                        for match in m.home_matches_set[team_i, week_k]) ==
+                    sum(m.is_match_this_week_var[match]
+                        for week_k in m.weeks_range_set
+                        for match in m.away_matches_set[team_i, week_k]))
 
         m.balance_home_away_matches_constr = pe.Constraint(m.teams_range_set, rule=_balance_home_away_matches_rule)
 
         return m
 
-    # matches team_a vs team_a are excluded
-    def build_no_match_with_itself_constr(self, m):
-        def _no_match_with_itself_rule(m, team_i, week_k):
-            return m.is_match_this_week_var[team_i, team_i, week_k] == 0
-
-        m.no_match_with_itself_constr = pe.Constraint(m.teams_range_set, m.weeks_range_set,
-                                                      rule=_no_match_with_itself_rule)
-        return m
-
     def build_three_consecutive_rounds_constr(self, m):
         """
         No team can play more than two away matches in any three consecutive rounds.
         No team can play more than two home matches in any three consecutive rounds.
         """
 
-        def three_consecutive_rounds_rule1(m, team_i, week_k):
-            if (week_k + 2) not in m.weeks_range_set:
+        def _three_consecutive_rounds_rule(matches_set, team_i, week_k):
+            if (week_k + 2) not in m.weeks_range_set or week_k in m.weeks_mirrored_set:
                 return pe.Constraint.Skip
-            else:
-                return sum(m.is_match_this_week_var[team_i, team_j, week]
-                           for team_j in m.teams_range_set
-                           for week in range(week_k, week_k + 3)) <= 2
+            matches = [match for week in range(week_k, week_k + 3) for match in matches_set[team_i, week]]
+            if len(matches) <= 2:
+                return pe.Constraint.Skip
+            return sum(m.is_match_this_week_var[match] for match in matches) <= 2
+
+        def three_consecutive_rounds_rule1(m, team_i, week_k):
+            return _three_consecutive_rounds_rule(m.home_matches_set, team_i, week_k)
 
         def three_consecutive_rounds_rule2(m, team_i, week_k):
-            if (week_k + 2) not in m.weeks_range_set:
-                return pe.Constraint.Skip
-            else:
-                return sum(m.is_match_this_week_var[team_j, team_i, week]
-                           for team_j in m.teams_range_set
-                           for week in range(week_k, week_k + 3)) <= 2
+            return _three_consecutive_rounds_rule(m.away_matches_set, team_i, week_k)
 
         m.three_consecutive_rounds_constr1 = pe.Constraint(m.teams_range_set, m.weeks_range_set,
                                                            rule=three_consecutive_rounds_rule1)
@@ -104,15 +106,20 @@ class ConstraintsBuilder():
         """
         Home and away matches of the same pair of teams should be in different half of the season
         """
+        def _no_both_matches_weeks_half_rule(half_set, team_i, team_j):
+            if team_i == team_j:
+                return pe.Constraint.Skip
+            matches = [match for match in list(m.pair_matches_set[team_i, team_j]) +
+                       list(m.pair_matches_set[team_j, team_i]) if match[2] in half_set]
+            if len(matches) <= 1:
+                return pe.Constraint.Skip
+            return sum(m.is_match_this_week_var[match] for match in matches) <= 1
+
         def _no_both_matches_weeks_first_half_rule(m, team_i, team_j):
-            return sum(m.is_match_this_week_var[team_i, team_j, week_k] +
-                       m.is_match_this_week_var[team_j, team_i, week_k]
-                       for week_k in m.weeks_first_half_set) <= 1
+            return _no_both_matches_weeks_half_rule(m.weeks_first_half_set, team_i, team_j)
 
         def _no_both_matches_weeks_second_half_rule(m, team_i, team_j):
-            return sum(m.is_match_this_week_var[team_i, team_j, week_k] +
-                       m.is_match_this_week_var[team_j, team_i, week_k]
-                       for week_k in m.weeks_second_half_set) <= 1
+            return _no_both_matches_weeks_half_rule(m.weeks_second_half_set, team_i, team_j)
 
         m.no_both_matches_weeks_first_half_constr = pe.Constraint(m.teams_range_set, m.teams_range_set,
                                                                   rule=_no_both_matches_weeks_first_half_rule)
@@ -129,9 +136,12 @@ class ConstraintsBuilder():
         """
 
         def _no_parallel_home_match_for_conflict_teams(m, team_conflict_i, team_conflict_j, week_k):
-            return sum(m.is_match_this_week_var[team_conflict_i, team_j, week_k]
-                       for team_j in m.teams_range_set) + sum(m.is_match_this_week_var[team_conflict_j, team_j, week_k]
-                                                              for team_j in m.teams_range_set) <= 1
+            matches = list(m.home_matches_set[team_conflict_i, week_k]) + \
+                list(m.home_matches_set[team_conflict_j, week_k])
+            if len(matches) <= 1:
+                return pe.Constraint.Skip
+            return sum(m.is_match_this_week_var[match] for match in matches) <= 1
 
-        m.conflict_home_match_constr = pe.Constraint(self.conflict_home_match_list, m.weeks_range_set,
+        m.conflict_home_match_set = pe.Set(initialize=self.conflict_home_match_list, dimen=2)
+        m.conflict_home_match_constr = pe.Constraint(m.conflict_home_match_set, m.weeks_range_set,
                                                      rule=_no_parallel_home_match_for_conflict_teams)
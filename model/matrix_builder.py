@@ -0,0 +1,262 @@
+import numpy as np
+import pyomo.environ as pe
+from pyomo.common.gc_manager import PauseGC
+from pyomo.core.expr.numeric_expr import LinearExpression
+from model.objective import ObjectiveBuilder
+from model.sets import SetsBuilder
+
+
+def coo_to_csr(rows, cols, coefs, n_rows, n_cols):
+    """
+    Convert COO triplets to CSR arrays (indptr, indices, data). Duplicate entries are summed and explicit zeros
+    dropped, which mirrors how the LP writers collapse repeated variables of a rule-built expression
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    cols = np.asarray(cols, dtype=np.int64)
+    coefs = np.asarray(coefs, dtype=float)
+    keys = rows * n_cols + cols
+    order = np.argsort(keys, kind="stable")
+    keys, coefs = keys[order], coefs[order]
+    unique_keys, starts = np.unique(keys, return_index=True)
+    data = np.add.reduceat(coefs, starts) if len(coefs) else coefs
+    non_zero = data != 0
+    unique_keys, data = unique_keys[non_zero], data[non_zero]
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(unique_keys // n_cols, minlength=n_rows), out=indptr[1:])
+    return indptr, unique_keys % n_cols, data
+
+
+class MatrixModelData():
+    """
+    Season matches as flat NumPy arrays: for every match the positions of home team, away team and week in
+    m.teams_range_set / m.weeks_range_set, and the column of is_match_this_week_var deciding it. In the mirrored
+    scheme every column appears twice
+    """
+
+    def __init__(self, m):
+        self.teams = list(m.teams_range_set)
+        self.weeks = list(m.weeks_range_set)
+        self.n_teams = len(self.teams)
+        self.n_weeks = len(self.weeks)
+        team_position = {team: position for position, team in enumerate(self.teams)}
+        week_position = {week: position for position, week in enumerate(self.weeks)}
+        keys = list(m.is_match_this_week_var.keys())
+        self.var_list = list(m.is_match_this_week_var.values())
+        self.n_cols = len(keys)
+        self.home = np.fromiter((team_position[key[0]] for key in keys), dtype=np.int64, count=self.n_cols)
+        self.away = np.fromiter((team_position[key[1]] for key in keys), dtype=np.int64, count=self.n_cols)
+        self.week = np.fromiter((week_position[key[2]] for key in keys), dtype=np.int64, count=self.n_cols)
+        self.cols = np.arange(self.n_cols, dtype=np.int64)
+        self.mirrored = SetsBuilder.is_mirrored(m)
+        self.mirrored_weeks = set(m.weeks_mirrored_set)
+        if self.mirrored:
+            # week positions shift by the same offset as the consecutive week numbers
+            offset = m.mirror_offset_param.value
+            self.home, self.away = np.concatenate((self.home, self.away)), np.concatenate((self.away, self.home))
+            self.week = np.concatenate((self.week, self.week + offset))
+            self.cols = np.concatenate((self.cols, self.cols))
+
+
+class MatrixConstraintsBuilder():
+    """
+    Vectorized counterpart of ConstraintsBuilder. Each constraint family is assembled in bulk as a sparse
+    coefficient matrix and registered under the same name and index as the rule-based version, so both builders
+    produce the same model. Rows come straight from the matrix, the incidence sets of SetsBuilder are not built
+    """
+
+    uses_incidence_sets = False
+
+    def __init__(self, m, conflict_home_match_list):
+        self.m = m
+        self.conflict_home_match_list = conflict_home_match_list
+        # the cyclic garbage collector would otherwise rescan the whole model every few hundred new expressions
+        with PauseGC():
+            self.data = MatrixModelData(m)
+            self.build_all_constraints()
+
+    def build_all_constraints(self):
+        self.build_each_match_is_played_once_constr(self.m)
+        self.build_max_one_match_per_team_per_week_constr(self.m)
+        if not self.data.mirrored:
+            self.home_away_matches_same_teams(self.m)
+            self.build_balance_home_away_matches_constr(self.m)
+        self.build_three_consecutive_rounds_constr(self.m)
+        self.build_conflict_home_match_constr(self.m)
+
+    def add_matrix_constraint(self, m, name, index_sets, row_keys, rows, cols, coefs, sense, rhs):
+        """
+        Register constraint family `name` over `index_sets` from COO triplets. Row r of the matrix is the constraint
+        with index row_keys[r]; indices not listed in row_keys are skipped, as are inequality rows with no more
+        binaries than the right-hand side. All rows are created from the CSR arrays up front and handed to Pyomo as
+        one dict of (lower, body, upper) tuples, so no rule is called per index
+        """
+        indptr, indices, data = coo_to_csr(rows, cols, coefs, len(row_keys), self.data.n_cols)
+        row_nonzeros = np.diff(indptr)
+        keep = np.array([key is not None for key in row_keys], dtype=bool)
+        if sense == "<=":
+            keep &= row_nonzeros > rhs
+        indptr, indices, data = indptr.tolist(), indices.tolist(), data.tolist()
+        var_list = self.data.var_list
+        lower = rhs if sense == "==" else None
+        rows = {}
+        for position in np.flatnonzero(keep).tolist():
+            start, end = indptr[position], indptr[position + 1]
+            rows[row_keys[position]] = (lower,
+                                        LinearExpression(constant=0, linear_coefs=data[start:end],
+                                                         linear_vars=[var_list[col] for col in indices[start:end]]),
+                                        rhs)
+        setattr(m, name, pe.Constraint(*index_sets, rule=rows))
+        return m
+
+    def build_each_match_is_played_once_constr(self, m):
+        """
+        Each unique match is played once throughout the season
+        """
+        d = self.data
+        row_keys = [(team_i, team_j) if team_i != team_j and not (d.mirrored and team_i > team_j) else None
+                    for team_i in d.teams for team_j in d.teams]
+        rows = d.home * d.n_teams + d.away
+        return self.add_matrix_constraint(m, "each_match_is_played_once_constr",
+                                          (m.teams_range_set, m.teams_range_set), row_keys,
+                                          rows, d.cols, np.ones(len(rows)), "==", 1)
+
+    def build_max_one_match_per_team_per_week_constr(self, m):
+        """
+         Maximum one match for each team per week (home or away)
+        """
+        d = self.data
+        row_keys = [(team_i, week_k) if week_k not in d.mirrored_weeks else None
+                    for team_i in d.teams for week_k in d.weeks]
+        rows = np.concatenate((d.home * d.n_weeks + d.week, d.away * d.n_weeks + d.week))
+        cols = np.concatenate((d.cols, d.cols))
+        return self.add_matrix_constraint(m, "max_one_match_per_team_per_week_constr",
+                                          (m.teams_range_set, m.weeks_range_set), row_keys,
+                                          rows, cols, np.ones(len(rows)), "<=", 1)
+
+    def build_balance_home_away_matches_constr(self, m):
+        """
+        Each team has equal number of home and away matches in the season
+        """
+        d = self.data
+        row_keys = [(team_i,) for team_i in d.teams]
+        rows = np.concatenate((d.home, d.away))
+        cols = np.concatenate((d.cols, d.cols))
+        coefs = np.concatenate((np.ones(d.n_cols), -np.ones(d.n_cols)))
+        return self.add_matrix_constraint(m, "balance_home_away_matches_constr", (m.teams_range_set,), row_keys,
+                                          rows, cols, coefs, "==", 0)
+
+    def build_three_consecutive_rounds_constr(self, m):
+        """
+        No team can play more than two away matches in any three consecutive rounds.
+        No team can play more than two home matches in any three consecutive rounds.
+        """
+        d = self.data
+        weeks_set = set(d.weeks)
+        row_keys = [(team_i, week_k) if (week_k + 2) in weeks_set and week_k not in d.mirrored_weeks else None
+                    for team_i in d.teams for week_k in d.weeks]
+        # a match in week position q belongs to the windows starting at q - 2, q - 1 and q
+        shifts = np.arange(3)
+        window_start = (d.week[:, None] - shifts[None, :]).ravel()
+        entries = np.repeat(np.arange(len(d.cols)), 3)
+        in_range = window_start >= 0
+        window_start, entries = window_start[in_range], entries[in_range]
+        cols = d.cols[entries]
+        for name, team in (("three_consecutive_rounds_constr1", d.home),
+                           ("three_consecutive_rounds_constr2", d.away)):
+            rows = team[entries] * d.n_weeks + window_start
+            self.add_matrix_constraint(m, name, (m.teams_range_set, m.weeks_range_set), row_keys,
+                                       rows, cols, np.ones(len(rows)), "<=", 2)
+        return m
+
+    def home_away_matches_same_teams(self, m):
+        """
+        Home and away matches of the same pair of teams should be in different half of the season
+        """
+        d = self.data
+        row_keys = [(team_i, team_j) if team_i != team_j else None for team_i in d.teams for team_j in d.teams]
+        for name, half_set in (("no_both_matches_weeks_first_half_constr", m.weeks_first_half_set),
+                               ("no_both_matches_weeks_second_half_constr", m.weeks_second_half_set)):
+            half_weeks = np.array([d.weeks.index(week) for week in half_set], dtype=np.int64)
+            in_half = np.isin(d.week, half_weeks)
+            home, away, cols = d.home[in_half], d.away[in_half], d.cols[in_half]
+            rows = np.concatenate((home * d.n_teams + away, away * d.n_teams + home))
+            cols = np.concatenate((cols, cols))
+            self.add_matrix_constraint(m, name, (m.teams_range_set, m.teams_range_set), row_keys,
+                                       rows, cols, np.ones(len(rows)), "<=", 1)
+        return m
+
+    def build_conflict_home_match_constr(self, m):
+        """
+        Avoid regional doubles (e.g. no home game for two teams based in Berlin). List of conflict teams in that sense
+        is prepared in the preprocessing part.
+
+        Formulation: maximum one team from conflict pair has a home match each week
+        """
+        d = self.data
+        row_keys = [(team_conflict_i, team_conflict_j, week_k)
+                    for team_conflict_i, team_conflict_j in self.conflict_home_match_list
+                    for week_k in d.weeks]
+        team_position = {team: position for position, team in enumerate(d.teams)}
+        pairs = np.array([[team_position[team_conflict_i], team_position[team_conflict_j]]
+                          for team_conflict_i, team_conflict_j in self.conflict_home_match_list],
+                         dtype=np.int64).reshape(-1, 2)
+        rows, cols = [], []
+        for side in range(2):
+            pair_position, entry = np.nonzero(pairs[:, side][:, None] == d.home[None, :])
+            rows.append(pair_position * d.n_weeks + d.week[entry])
+            cols.append(d.cols[entry])
+        rows, cols = np.concatenate(rows), np.concatenate(cols)
+        m.conflict_home_match_set = pe.Set(initialize=self.conflict_home_match_list, dimen=2)
+        return self.add_matrix_constraint(m, "conflict_home_match_constr",
+                                          (m.conflict_home_match_set, m.weeks_range_set), row_keys,
+                                          rows, cols, np.ones(len(rows)), "<=", 1)
+
+
+class MatrixObjectiveBuilder():
+    """
+    Vectorized counterpart of ObjectiveBuilder: the cost vector is computed in one pass over the columns and the
+    objective is created as a single linear expression
+    """
+
+    def __init__(self, m, team_rank_dict, match_attractiveness, travel_weight=1.0, attractiveness_weight=1.0,
+                 away_trip_weight=0.0):
+        self.team_rank_dict = team_rank_dict
+        self.match_attractiveness = match_attractiveness
+        self.travel_weight = travel_weight
+        self.attractiveness_weight = attractiveness_weight
+        self.away_trip_weight = away_trip_weight
+        with PauseGC():
+            self.data = MatrixModelData(m)
+            self.build_objective(m)
+
+    def travel_distance_over_season(self, m):
+        d = self.data
+        # the param is indexed by teams x teams, so its values come in row-major (team, team) order
+        distance = np.fromiter(m.distance_between_teams_param.values(), dtype=float,
+                               count=len(d.teams) ** 2).reshape(len(d.teams), len(d.teams))
+        return distance[d.home, d.away] ** 2
+
+    def season_attractiveness_score(self, m):
+        d = self.data
+        attractiveness = self.match_attractiveness
+        team_positions = np.array([attractiveness.team_position[team] for team in d.teams])
+        week_positions = np.array([attractiveness.week_position[week] for week in d.weeks])
+        return attractiveness.coefficients(team_positions[d.home], team_positions[d.away], week_positions[d.week])
+
+    def linear_expression(self, match_coefs):
+        # per season match coefficients, summed into the column deciding the match
+        cost = np.bincount(self.data.cols, weights=match_coefs, minlength=self.data.n_cols)
+        return LinearExpression(constant=0, linear_coefs=cost.tolist(), linear_vars=self.data.var_list)
+
+    def build_objective(self, m):
+        travel = self.travel_distance_over_season(m)
+        attractiveness = self.season_attractiveness_score(m)
+        m.travel_distance_expr = pe.Expression(expr=self.linear_expression(travel))
+        m.attractiveness_expr = pe.Expression(expr=self.linear_expression(attractiveness))
+        objective = self.linear_expression(self.travel_weight * travel + self.attractiveness_weight * attractiveness)
+        if self.away_trip_weight:
+            # one row per team and week, small enough to be built by rule
+            ObjectiveBuilder.build_away_trip_travel(m)
+            objective = objective + self.away_trip_weight * m.away_trip_travel_expr
+        m.OBJ = pe.Objective(expr=objective)
+        ObjectiveBuilder.build_objective_offset_param(m, self.travel_weight)
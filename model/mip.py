@@ -1,12 +1,22 @@
+from contextlib import nullcontext
 import pyomo.environ as pe
-import pyomo.opt as popt
 from model.sets import SetsBuilder
 from model.variables import VariablesBuilder
 from model.parameters import ParametersBuilder
 from model.constraints import ConstraintsBuilder
 from model.objective import ObjectiveBuilder
-from pyomo.contrib.appsi.solvers import Highs 
+from model.matrix_builder import MatrixConstraintsBuilder, MatrixObjectiveBuilder
+from model.compact import CompactConstraintsBuilder
+from model.solver import SolverConfig, get_solver_backend
 
+# "rule" builds constraints and objective with per-index Pyomo rules, "matrix" assembles them in bulk with NumPy,
+# "compact" formulates the team-week rules over home/away indicators, a smaller model that does not solve faster
+# (see CompactConstraintsBuilder)
+BUILDER_MODES = {
+    "rule": (ConstraintsBuilder, ObjectiveBuilder),
+    "matrix": (MatrixConstraintsBuilder, MatrixObjectiveBuilder),
+    "compact": (CompactConstraintsBuilder, MatrixObjectiveBuilder),
+}
 
 
 class Model():
@@ -14,50 +24,74 @@ class Model():
                  teams_list,
                  teams_range,
                  weeks_range,
-                 team_distance_matrix_dict,
+                 team_distance_matrix,
                  team_ranks_dict,
-                 match_attractiveness_dict,
-                 conflict_home_match_list):
+                 match_attractiveness,
+                 conflict_home_match_list,
+                 builder_mode="rule",
+                 forbidden_slots=None,
+                 scheme="standard",
+                 travel_weight=1.0,
+                 attractiveness_weight=1.0,
+                 away_trip_weight=0.0,
+                 phase=None):
+        if builder_mode not in BUILDER_MODES:
+            raise ValueError(f"Unknown builder mode '{builder_mode}', expected one of {list(BUILDER_MODES)}")
         self.teams_list = teams_list
         self.teams_range = teams_range
         self.weeks_range = weeks_range
         self.team_ranks_dict = team_ranks_dict
-        self.match_attractiveness_dict = match_attractiveness_dict
+        self.match_attractiveness = match_attractiveness
         self.conflict_home_match_list = conflict_home_match_list
+        self.builder_mode = builder_mode
+        self.forbidden_slots = forbidden_slots
+        self.scheme = scheme
+        # weights of the squared travel distance, attractiveness and back-to-back away travel terms in the objective
+        self.travel_weight = travel_weight
+        self.attractiveness_weight = attractiveness_weight
+        self.away_trip_weight = away_trip_weight
+        # optional callable name -> context manager wrapped around every builder, e.g. PipelineMetrics.phase
+        self.phase = phase if phase is not None else (lambda name: nullcontext())
         self.m = None
         self.build_model(teams_range,
                          weeks_range,
-                         team_distance_matrix_dict,
+                         team_distance_matrix,
                          team_ranks_dict,
-                         match_attractiveness_dict,
+                         match_attractiveness,
                          conflict_home_match_list)
 
     def build_model(self,
                     teams_range,
                     weeks_range,
-                    team_distance_matrix_dict,
+                    team_distance_matrix,
                     team_rank_dict,
-                    match_attractiveness_dict,
+                    match_attractiveness,
                     conflict_home_match_list):
 
+        constraints_builder, objective_builder = BUILDER_MODES[self.builder_mode]
         self.m = pe.ConcreteModel()
-        SetsBuilder(self.m, teams_range, weeks_range)
-        VariablesBuilder(self.m)
-        ParametersBuilder(self.m, team_distance_matrix_dict)
-        ConstraintsBuilder(self.m, conflict_home_match_list)
-        ObjectiveBuilder(self.m, team_rank_dict, match_attractiveness_dict)
+        with self.phase("sets"):
+            SetsBuilder(self.m, teams_range, weeks_range, self.forbidden_slots, self.scheme,
+                        incidence_sets=constraints_builder.uses_incidence_sets)
+        with self.phase("variables"):
+            VariablesBuilder(self.m)
+        with self.phase("parameters"):
+            ParametersBuilder(self.m, team_distance_matrix)
+        with self.phase("constraints"):
+            if constraints_builder is CompactConstraintsBuilder:
+                # symmetry breaking depends on the objective being symmetric in home and away team
+                constraints_builder(self.m, conflict_home_match_list, match_attractiveness, self.away_trip_weight)
+            else:
+                constraints_builder(self.m, conflict_home_match_list)
+        with self.phase("objective"):
+            objective_builder(self.m, team_rank_dict, match_attractiveness, self.travel_weight,
+                              self.attractiveness_weight, self.away_trip_weight)
 
     @staticmethod
-    def solve_model(m):
-        # Solve model
-        solver = popt.SolverFactory("gurobi")
-        model_instance = m.create_instance()
-        solver.solve(
-            model_instance,
-            tee=True,
-            keepfiles=True,
-            logfile="model_logfile",
-            report_timing=True,
-            symbolic_solver_labels=True
-        )
-        return model_instance
+    def solve_model(m, solver_config=None, listener=None):
+        """
+        Solve model with the backend selected in solver_config (Gurobi by default) and return a SolveResult.
+        An optional SolveListener follows the progress of the solve
+        """
+        solver_config = solver_config if solver_config is not None else SolverConfig()
+        return get_solver_backend(solver_config, listener).solve(m)
@@ -1,27 +1,96 @@
+from collections import defaultdict
+
 import pyomo.environ as pe
+from model.sets import SetsBuilder
 
 
 class ObjectiveBuilder():
-    def __init__(self, m, team_rank_dict, match_attractiveness_dict):
+    """
+    Weighted sum of the squared travel distance and the attractiveness score over the season. Both terms are kept
+    on the model as named expressions (m.travel_distance_expr, m.attractiveness_expr) to report them separately.
+    With a nonzero away_trip_weight the squared travel of back-to-back away matches (m.away_trip_travel_expr, see
+    build_away_trip_travel) is added as a third term
+    """
+
+    def __init__(self, m, team_rank_dict, match_attractiveness, travel_weight=1.0, attractiveness_weight=1.0,
+                 away_trip_weight=0.0):
         self.team_rank_dict = team_rank_dict
-        self.match_attractiveness_dict = match_attractiveness_dict
+        self.match_attractiveness = match_attractiveness
+        self.travel_weight = travel_weight
+        self.attractiveness_weight = attractiveness_weight
+        self.away_trip_weight = away_trip_weight
         self.build_objective(m)
 
     def travel_distance_over_season(self, m):
-        return sum((m.distance_between_teams_param[team_i, team_j] ** 2) * m.is_match_this_week_var[team_i, team_j, week_k]
-                   for team_i in m.teams_range_set
-                   for team_j in m.teams_range_set
-                   for week_k in m.weeks_range_set)
+        return sum((m.distance_between_teams_param[team_i, team_j] ** 2) * m.is_match_this_week_var[slot]
+                   for team_i, team_j, week_k, slot in SetsBuilder.season_matches(m))
 
     def season_attractiveness_score(self, m):
         return sum(
-            self.match_attractiveness_dict[team_i, team_j, week_k] * m.is_match_this_week_var[team_i, team_j, week_k]
-            for team_i in m.teams_range_set
-            for team_j in m.teams_range_set
-            for week_k in m.weeks_range_set)
+            self.match_attractiveness[team_i, team_j, week_k] * m.is_match_this_week_var[slot]
+            for team_i, team_j, week_k, slot in SetsBuilder.season_matches(m))
 
     def build_obj_rule(self, m):
-        return self.travel_distance_over_season(m) + self.season_attractiveness_score(m)
+        objective = self.travel_weight * m.travel_distance_expr + self.attractiveness_weight * m.attractiveness_expr
+        if self.away_trip_weight:
+            objective += self.away_trip_weight * m.away_trip_travel_expr
+        return objective
+
+    @staticmethod
+    def build_away_trip_travel(m):
+        """
+        Squared travel of the away matches a team plays in two consecutive weeks. Unlike the season travel it depends
+        on the schedule. away_trip_travel_var[team, week] covers the trip starting in week: each away match of the two
+        weeks adds its travel plus the team's longest trip to the row, which is relaxed by twice the longest trip, so
+        the variable is bound by the travel of both matches when the team is away in both weeks and free otherwise
+        """
+        weeks = list(m.weeks_range_set)
+        next_week = dict(zip(weeks[:-1], weeks[1:]))
+        away_legs = defaultdict(list)
+        for team_i, team_j, week_k, slot in SetsBuilder.season_matches(m):
+            travel = pe.value(m.distance_between_teams_param[team_i, team_j]) ** 2
+            away_legs[team_j, week_k].append((travel, m.is_match_this_week_var[slot]))
+        longest_trip = {team: max(pe.value(m.distance_between_teams_param[other, team]) ** 2
+                                  for other in m.teams_range_set if other != team) for team in m.teams_range_set}
+
+        m.away_trip_weeks_set = pe.Set(initialize=weeks[:-1], dimen=1)
+        m.away_trip_travel_var = pe.Var(m.teams_range_set, m.away_trip_weeks_set, domain=pe.NonNegativeReals)
+
+        def away_trip_rule(m, team, week_k):
+            legs = away_legs[team, week_k] + away_legs[team, next_week[week_k]]
+            return m.away_trip_travel_var[team, week_k] >= \
+                sum((travel + longest_trip[team]) * var for travel, var in legs) - 2 * longest_trip[team]
+
+        m.away_trip_travel_constr = pe.Constraint(m.teams_range_set, m.away_trip_weeks_set, rule=away_trip_rule)
+        m.away_trip_travel_expr = pe.Expression(expr=pe.quicksum(m.away_trip_travel_var.values()))
+
+    @staticmethod
+    def build_objective_offset_param(m, travel_weight):
+        """
+        Weighted travel term of every complete schedule: each ordered pairing is played exactly once, so the sum of
+        squared distances over the season is the same for all of them. Gaps are taken relative to the objective
+        without it, see model.solver.relative_gap
+        """
+        m.objective_offset_param = pe.Param(initialize=travel_weight * sum(
+            pe.value(m.distance_between_teams_param[team_i, team_j]) ** 2
+            for team_i in m.teams_range_set for team_j in m.teams_range_set if team_i != team_j))
+
+    @staticmethod
+    def prepare_mip_start(m):
+        """
+        Set away_trip_travel_var to the smallest value its row allows with the current values of the match
+        variables, e.g. to complete a MIP start. Models without the term are left alone
+        """
+        if not hasattr(m, "away_trip_travel_var"):
+            return
+        for index, constraint in m.away_trip_travel_constr.items():
+            m.away_trip_travel_var[index].set_value(0.0)
+            m.away_trip_travel_var[index].set_value(max(0.0, -pe.value(constraint.slack())))
 
     def build_objective(self, m):
+        m.travel_distance_expr = pe.Expression(expr=self.travel_distance_over_season(m))
+        m.attractiveness_expr = pe.Expression(expr=self.season_attractiveness_score(m))
+        if self.away_trip_weight:
+            ObjectiveBuilder.build_away_trip_travel(m)
         m.OBJ = pe.Objective(rule=self.build_obj_rule)
+        ObjectiveBuilder.build_objective_offset_param(m, self.travel_weight)
@@ -1,11 +1,16 @@
 import pyomo.environ as pe
 
 class ParametersBuilder:
-    def __init__(self, m, team_distance_matrix_dict):
-        self.team_distance_matrix_dict = team_distance_matrix_dict
-        self.build_team_distance_matrix_param(m, team_distance_matrix_dict)
+    def __init__(self, m, team_distance_matrix):
+        self.team_distance_matrix = team_distance_matrix
+        self.build_team_distance_matrix_param(m, team_distance_matrix)
 
     @staticmethod
-    def build_team_distance_matrix_param(m, team_distance_matrix_dict):
+    def build_team_distance_matrix_param(m, team_distance_matrix):
+        # team_distance_matrix is a (team, team) array in the order of teams_range_set
+        teams = list(m.teams_range_set)
+        distances = team_distance_matrix.tolist()
         m.distance_between_teams_param = pe.Param(m.teams_range_set, m.teams_range_set,
-                                                      initialize=team_distance_matrix_dict)
+                                                  initialize={(team_i, team_j): distances[row][col]
+                                                              for row, team_i in enumerate(teams)
+                                                              for col, team_j in enumerate(teams)})
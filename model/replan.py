@@ -0,0 +1,161 @@
+from collections import defaultdict
+
+from model.annealing import AnnealingScheduler
+from model.sets import SetsBuilder
+from model.solver import SolverConfig, get_solver_backend
+from model.warm_start import WarmStartBuilder
+
+
+class Replanner():
+    """
+    Re-optimization of an already built model after part of the schedule got fixed, e.g. mid-season after
+    postponements or when TV partners pin fixtures to rounds.
+
+    The solver backend is kept between calls, so with HiGHS the model stays loaded in the solver and a re-plan only
+    pushes the changed variable bounds. Every re-plan is warm-started from the given schedule, after a short annealing
+    pass has repaired the rule violations that forcing pinned matches into it may cause. If the repair does not reach
+    a schedule without violations, the violations left are kept in residual_violations
+    """
+
+    def __init__(self, model, solver_config=None, repair_time_limit=5.0):
+        solver_config = solver_config if solver_config is not None else SolverConfig(name="highs")
+        if solver_config.name == "annealing":
+            raise ValueError("Re-planning needs a MIP backend, annealing is only used to repair the warm start")
+        self.m = model.m
+        self.solver_config = solver_config
+        self.repair_time_limit = repair_time_limit
+        # rule violations of the warm start of the last re-plan, None if it was repaired or not checked
+        self.residual_violations = None
+        self.backend = get_solver_backend(SolverConfig(**{**vars(solver_config), "warm_start": True}))
+
+    def season_match_slot(self, team_i, team_j, week_k):
+        """
+        Slot of m.match_index_set deciding the season match (team_i hosts team_j in week_k)
+        """
+        if (team_i, team_j, week_k) in self.m.match_index_set:
+            return team_i, team_j, week_k
+        offset = self.m.mirror_offset_param.value
+        if offset and (team_j, team_i, week_k - offset) in self.m.match_index_set:
+            return team_j, team_i, week_k - offset
+        raise ValueError(f"Match {(team_i, team_j, week_k)} has no slot in the model")
+
+    def fix_variables(self, frozen_weeks, pinned_matches):
+        """
+        Fix every slot deciding a match in a frozen week to its current value and every pinned match to 1.
+        Returns the number of fixed slots
+        """
+        frozen_weeks = set(frozen_weeks)
+        offset = self.m.mirror_offset_param.value
+        var = self.m.is_match_this_week_var
+        for slot in self.m.match_index_set:
+            if slot[2] in frozen_weeks or (offset and slot[2] + offset in frozen_weeks):
+                var[slot].fix()
+        for team_i, team_j, week_k in pinned_matches:
+            var[self.season_match_slot(team_i, team_j, week_k)].fix(1)
+        return sum(1 for slot in self.m.match_index_set if var[slot].fixed)
+
+    def fixed_season_matches(self, schedule, frozen_weeks, pinned_matches):
+        """
+        Season matches (home, away, week) the re-plan fixes: the matches of schedule in frozen weeks and the pinned
+        matches, with their mirrored matches in the mirrored scheme
+        """
+        frozen_weeks = set(frozen_weeks)
+        offset = self.m.mirror_offset_param.value
+        matches = set(match for match in schedule if match[2] in frozen_weeks
+                      or (offset and {match[2] + offset, match[2] - offset} & frozen_weeks))
+        pinned_slots = [self.season_match_slot(*match) for match in pinned_matches]
+        matches |= set(match[:3] for match in SetsBuilder.season_matches(self.m, pinned_slots))
+        return matches
+
+    def check_fixed_matches(self, schedule, frozen_weeks, pinned_matches):
+        """
+        Raise a ValueError naming the conflicts if the frozen and pinned matches contradict each other: a pairing
+        in two weeks, a team with two matches in a week or both legs of a pairing in the same half
+        """
+        matches = self.fixed_season_matches(schedule, frozen_weeks, pinned_matches)
+        first_half = set(self.m.weeks_first_half_set)
+        pair_weeks, team_weeks = defaultdict(set), defaultdict(list)
+        for team_i, team_j, week_k in matches:
+            pair_weeks[team_i, team_j].add(week_k)
+            team_weeks[team_i, week_k].append((team_i, team_j, week_k))
+            team_weeks[team_j, week_k].append((team_i, team_j, week_k))
+        conflicts = [f"{team_i} hosts {team_j} in weeks {sorted(weeks)}"
+                     for (team_i, team_j), weeks in sorted(pair_weeks.items()) if len(weeks) > 1]
+        conflicts += [f"team {team} plays {sorted(week_matches)} in week {week_k}"
+                      for (team, week_k), week_matches in sorted(team_weeks.items()) if len(week_matches) > 1]
+        conflicts += [f"both legs of {team_i} - {team_j} in the {'first' if first_leg in first_half else 'second'} half"
+                      for (team_i, team_j), weeks in sorted(pair_weeks.items()) if team_i < team_j
+                      for first_leg in weeks for second_leg in pair_weeks.get((team_j, team_i), ())
+                      if (first_leg in first_half) == (second_leg in first_half)]
+        if conflicts:
+            raise ValueError(f"Frozen weeks and pinned matches admit no schedule: {'; '.join(conflicts)}")
+
+    def align_with_pins(self, schedule, frozen_weeks, pinned_matches):
+        """
+        Move pinned matches of the schedule into their pinned week with structure-preserving edits, so that the
+        schedule stays a usable warm start: a home/away flip of both legs if the match sits in the other half, then a
+        swap of the two rounds (together with their mirrored rounds in the mirrored scheme). Edits that would touch a
+        frozen week are left out
+        """
+        schedule = set(schedule)
+        frozen_weeks = set(frozen_weeks)
+        first_half = set(self.m.weeks_first_half_set)
+        offset = self.m.mirror_offset_param.value
+        for team_i, team_j, week_k in pinned_matches:
+            week_of = {(home, away): week for home, away, week in schedule}
+            current_week, return_week = week_of[team_i, team_j], week_of[team_j, team_i]
+            if current_week == week_k:
+                continue
+            if (current_week in first_half) != (week_k in first_half):
+                if {current_week, return_week} & frozen_weeks:
+                    continue
+                schedule -= {(team_i, team_j, current_week), (team_j, team_i, return_week)}
+                schedule |= {(team_i, team_j, return_week), (team_j, team_i, current_week)}
+                current_week = return_week
+            swapped_weeks = {current_week: week_k, week_k: current_week}
+            if offset:
+                mirror = (lambda week: week + offset) if week_k in first_half else (lambda week: week - offset)
+                swapped_weeks.update({mirror(current_week): mirror(week_k), mirror(week_k): mirror(current_week)})
+            if set(swapped_weeks) & frozen_weeks:
+                continue
+            schedule = {(home, away, swapped_weeks.get(week, week)) for home, away, week in schedule}
+        return sorted(schedule, key=lambda match: (match[2], match[0]))
+
+    def replan(self, schedule, frozen_weeks=(), pinned_matches=()):
+        """
+        Re-solve with the matches of frozen_weeks kept as in schedule (a list of (home, away, week) such as
+        DataPostprocess.chosen_matches) and pinned (home, away, week) matches forced into the schedule.
+        Returns the SolveResult of the re-solve. Raises a ValueError if the frozen and pinned matches contradict
+        each other or the solver proves that no schedule keeps them
+        """
+        for slot in self.m.match_index_set:
+            self.m.is_match_this_week_var[slot].unfix()
+        self.check_fixed_matches(schedule, frozen_weeks, pinned_matches)
+        schedule = self.align_with_pins(schedule, frozen_weeks, pinned_matches)
+        missing_matches = WarmStartBuilder.load_into_model(self.m, schedule)
+        if missing_matches:
+            raise ValueError(f"{missing_matches} matches of the schedule have no slot in the model")
+        # fixed matches may only fit the home/away mirror the symmetry breaking row excludes, it is switched off
+        # for the re-solve only
+        symmetry_breaking = getattr(self.m, "symmetry_breaking_constr", None)
+        if symmetry_breaking is not None and not symmetry_breaking.active:
+            symmetry_breaking = None
+        try:
+            if symmetry_breaking is not None:
+                symmetry_breaking.deactivate()
+            self.fix_variables(frozen_weeks, pinned_matches)
+            self.residual_violations = None
+            if self.repair_time_limit:
+                # stops at the first schedule without violations, fixed slots keep their value when it is loaded
+                scheduler = AnnealingScheduler(self.m, seed=self.solver_config.seed or 0, initial_schedule=schedule)
+                status, _, _, _ = scheduler.solve(self.repair_time_limit, stop_at_first_feasible=True)
+                if status == "infeasible":
+                    self.residual_violations = scheduler.total_violations
+            solve_result = self.backend.solve(self.m)
+        finally:
+            if symmetry_breaking is not None:
+                symmetry_breaking.activate()
+        if solve_result.status in ("infeasible", "infeasibleOrUnbounded"):
+            raise ValueError(f"No schedule keeps the frozen weeks and pinned matches, the repaired warm start still "
+                             f"had {self.residual_violations} rule violations")
+        return solve_result
@@ -0,0 +1,147 @@
+import time
+from dataclasses import replace
+
+import pyomo.environ as pe
+
+from model.annealing import AnnealingScheduler
+from model.sets import SetsBuilder
+from model.solver import SolveListener, SolveResult, SolverConfig, get_solver_backend, objective_offset, \
+    relative_gap
+from model.warm_start import WarmStartBuilder
+
+
+class FirstScheduleListener(SolveListener):
+    """
+    Stops a solve at its first schedule
+    """
+
+    def on_progress(self, elapsed, objective, bound, gap):
+        return objective is not None
+
+
+class RollingHorizonSolver():
+    """
+    Decomposition of the season into overlapping windows of weeks for leagues too large to solve in one piece.
+
+    The search starts from a complete schedule: the constructive warm start, repaired by annealing if it breaks a
+    rule. Leagues the warm start does not cover (an odd number of teams or a season other than a double round
+    robin), and warm starts annealing can not repair, start from the first schedule the MIP finds instead. Windows of window_size weeks, each starting window_size - overlap weeks after the previous one, are then
+    re-optimized in season order. All slots outside the window are fixed to the current schedule, so the
+    three consecutive rounds, half-season and conflict rows crossing the window border see the decided weeks around
+    it and every window MIP only places the matches of its own weeks. Weeks after the window are fixed as well rather
+    than left out, since a double round robin whose later rounds are ignored can become impossible to complete.
+    An improved window is carried into the next one, the overlap lets matches move on between windows.
+
+    A final polishing pass solves the whole model warm-started from the result for polish_time_limit seconds (0 to
+    skip), which is also where a bound comes from. In the mirrored scheme windows cover the modelled first half
+    """
+
+    def __init__(self, model, solver_config=None, window_size=6, overlap=2, window_time_limit=30.0,
+                 polish_time_limit=60.0, initial_time_limit=10.0, sweeps=1):
+        if not 0 <= overlap < window_size:
+            raise ValueError("The overlap of windows must be at least 0 and smaller than the window size")
+        solver_config = solver_config if solver_config is not None else SolverConfig(name="highs", tee=False,
+                                                                                      logfile=None)
+        if solver_config.name == "annealing":
+            raise ValueError("Rolling horizon windows need a MIP backend")
+        self.m = model.m
+        self.solver_config = solver_config
+        self.window_size = window_size
+        self.overlap = overlap
+        self.polish_time_limit = polish_time_limit
+        self.initial_time_limit = initial_time_limit
+        self.sweeps = sweeps
+        # the window backend is kept, with HiGHS a new window only changes variable bounds of the loaded model.
+        # Windows are solved to optimality by default: the travel term is a large constant for every complete
+        # schedule, so the default relative gap of the solvers accepts the start of the window right away
+        self.mip_gap = solver_config.mip_gap if solver_config.mip_gap is not None else 0.0
+        self.backend = get_solver_backend(replace(solver_config, time_limit=window_time_limit, mip_gap=self.mip_gap,
+                                                  warm_start=True))
+        # (sweep, weeks, status, objective, wall time) of every solved window
+        self.window_log = []
+
+    def windows(self):
+        """
+        Week lists of the windows of one sweep, the last window ends with the last modelled week
+        """
+        weeks = [week for week in self.m.weeks_range_set if week not in self.m.weeks_mirrored_set]
+        if len(weeks) <= self.window_size:
+            return [weeks]
+        step = self.window_size - self.overlap
+        starts = list(range(0, len(weeks) - self.window_size, step)) + [len(weeks) - self.window_size]
+        return [weeks[start:start + self.window_size] for start in starts]
+
+    def current_schedule(self):
+        var = self.m.is_match_this_week_var
+        return [match[:3] for match in SetsBuilder.season_matches(self.m) if (var[match[3]].value or 0) > 0.5]
+
+    def load(self, schedule, free_weeks=None):
+        """
+        Load schedule into the model and fix every slot outside free_weeks, all slots are free if it is None
+        """
+        var = self.m.is_match_this_week_var
+        for slot in self.m.match_index_set:
+            var[slot].unfix()
+        WarmStartBuilder.load_into_model(self.m, schedule)
+        if free_weeks is not None:
+            free_weeks = set(free_weeks)
+            for slot in self.m.match_index_set:
+                if slot[2] not in free_weeks:
+                    var[slot].fix()
+
+    def initial_schedule(self):
+        """
+        Complete schedule to start from, or None if neither annealing nor the MIP found one within
+        initial_time_limit seconds each
+        """
+        if WarmStartBuilder.supports(len(self.m.teams_range_set), len(self.m.weeks_range_set)):
+            scheduler = AnnealingScheduler(self.m, seed=self.solver_config.seed or 0)
+            status, _, _, _ = scheduler.solve(self.initial_time_limit, stop_at_first_feasible=True)
+            if status == "feasible":
+                return self.current_schedule()
+        backend = get_solver_backend(replace(self.solver_config, time_limit=self.initial_time_limit,
+                                             warm_start=False), FirstScheduleListener())
+        return self.current_schedule() if backend.solve(self.m).has_solution else None
+
+    def solve(self):
+        """
+        Solve window by window, then polish. Returns a SolveResult whose model carries the final schedule
+        """
+        start = time.perf_counter()
+        schedule = self.initial_schedule()
+        if schedule is None:
+            return SolveResult(model=self.m, status="infeasible", wall_time=time.perf_counter() - start)
+        self.load(schedule)
+        objective = pe.value(self.m.OBJ)
+        incumbent_trace = [(time.perf_counter() - start, objective, None, None)]
+
+        for sweep in range(self.sweeps):
+            for weeks in self.windows():
+                self.load(schedule, weeks)
+                result = self.backend.solve(self.m)
+                self.window_log.append((sweep, weeks, result.status, result.objective, result.wall_time))
+                if result.has_solution and result.objective < objective - 1e-6:
+                    schedule, objective = self.current_schedule(), result.objective
+                    incumbent_trace.append((time.perf_counter() - start, objective, None, None))
+
+        status, bound = "feasible", None
+        self.load(schedule)
+        if self.polish_time_limit:
+            polish_backend = get_solver_backend(replace(self.solver_config, time_limit=self.polish_time_limit,
+                                                        mip_gap=self.mip_gap, warm_start=True))
+            result = polish_backend.solve(self.m)
+            bound = result.bound
+            if result.has_solution and result.objective <= objective + 1e-6:
+                schedule, objective, status = self.current_schedule(), result.objective, result.status
+                if result.objective < incumbent_trace[-1][1] - 1e-6:
+                    incumbent_trace.append((time.perf_counter() - start, objective, bound, None))
+            else:
+                self.load(schedule)
+        return SolveResult(model=self.m,
+                           status=status,
+                           objective=objective,
+                           bound=bound,
+                           gap=relative_gap(objective, bound, objective_offset(self.m)),
+                           wall_time=time.perf_counter() - start,
+                           incumbent_trace=incumbent_trace,
+                           objective_offset=objective_offset(self.m))
@@ -1,11 +1,24 @@
 import pyomo.environ as pe
+from collections import defaultdict
+
+# "standard": both legs of a pairing are scheduled freely in different halves of the season
+# "mirrored": only the first half is modelled, round k + half is round k with home and away swapped
+SCHEDULING_SCHEMES = ("standard", "mirrored")
 
 
 class SetsBuilder():
-    def __init__(self, m, teams_range, weeks_range):
+    def __init__(self, m, teams_range, weeks_range, forbidden_slots=None, scheme="standard", incidence_sets=True):
+        if scheme not in SCHEDULING_SCHEMES:
+            raise ValueError(f"Unknown scheduling scheme '{scheme}', expected one of {list(SCHEDULING_SCHEMES)}")
+        if scheme == "mirrored" and len(weeks_range) % 2:
+            raise ValueError("Mirrored scheme needs an even number of weeks")
         self.m = m
         self.teams_range = teams_range
         self.weeks_range = weeks_range
+        self.forbidden_slots = forbidden_slots
+        self.scheme = scheme
+        # the slot groupings of build_match_incidence_sets are only needed by rule-built constraints
+        self.incidence_sets = incidence_sets
         self.build_all_sets(teams_range, weeks_range)
 
     def build_all_sets(self, teams_range, weeks_range):
@@ -13,6 +26,11 @@ class SetsBuilder():
         self.build_weeks_range_set(self.m, weeks_range)
         self.build_weeks_first_half_set(self.m, weeks_range)
         self.build_weeks_second_half_set(self.m, weeks_range)
+        self.build_mirror_offset_param(self.m, weeks_range, self.scheme)
+        self.build_weeks_mirrored_set(self.m)
+        self.build_match_index_set(self.m, teams_range, weeks_range, self.forbidden_slots)
+        if self.incidence_sets:
+            self.build_match_incidence_sets(self.m)
         return self.m
 
     @staticmethod
@@ -30,3 +48,92 @@ class SetsBuilder():
     @staticmethod
     def build_weeks_second_half_set(m, weeks_range):
         m.weeks_second_half_set = pe.Set(initialize=list(weeks_range)[len(weeks_range) // 2:], dimen=1)
+
+    @staticmethod
+    def build_mirror_offset_param(m, weeks_range, scheme):
+        """
+        Number of weeks between a modelled round and its mirrored round, 0 when nothing is mirrored
+        """
+        m.mirror_offset_param = pe.Param(initialize=len(weeks_range) // 2 if scheme == "mirrored" else 0)
+
+    @staticmethod
+    def build_weeks_mirrored_set(m):
+        """
+        Weeks derived from the modelled ones instead of carrying their own variables
+        """
+        m.weeks_mirrored_set = pe.Set(initialize=list(m.weeks_second_half_set) if m.mirror_offset_param.value else [],
+                                      dimen=1)
+
+    @staticmethod
+    def is_mirrored(m):
+        return m.mirror_offset_param.value > 0
+
+    @staticmethod
+    def season_matches(m, slots=None):
+        """
+        Yield (home team, away team, week, slot) for every match of the season represented by the given slots of
+        m.match_index_set (all of them by default). In the mirrored scheme a slot stands for two matches
+        """
+        offset = m.mirror_offset_param.value
+        for slot in (m.match_index_set if slots is None else slots):
+            team_i, team_j, week_k = slot
+            yield team_i, team_j, week_k, slot
+            if offset:
+                yield team_j, team_i, week_k + offset, slot
+
+    @staticmethod
+    def build_match_index_set(m, teams_range, weeks_range, forbidden_slots=None):
+        """
+        Valid (home team, away team, week) slots: no team plays itself and forbidden slots are left out.
+        A forbidden slot is a (home, away, week) triple, or (home, None, week) when the home stadium is unavailable
+        in that week. In the mirrored scheme slots only cover the first half and a slot is dropped if its mirrored
+        match is forbidden
+        """
+        forbidden_matches = set()
+        forbidden_home_weeks = set()
+        for team_i, team_j, week_k in (forbidden_slots or []):
+            if team_j is None:
+                forbidden_home_weeks.add((team_i, week_k))
+            else:
+                forbidden_matches.add((team_i, team_j, week_k))
+
+        def _is_allowed(team_i, team_j, week_k):
+            return (team_i, week_k) not in forbidden_home_weeks and (team_i, team_j, week_k) not in forbidden_matches
+
+        offset = m.mirror_offset_param.value
+        slot_weeks = [week_k for week_k in weeks_range if week_k not in m.weeks_mirrored_set]
+        match_index = [(team_i, team_j, week_k)
+                       for team_i in teams_range
+                       for team_j in teams_range if team_i != team_j
+                       for week_k in slot_weeks
+                       if _is_allowed(team_i, team_j, week_k)
+                       and (not offset or _is_allowed(team_j, team_i, week_k + offset))]
+
+        scheduled_pairs = set((team_i, team_j) for team_i, team_j, _, _ in SetsBuilder.season_matches(m, match_index))
+        unschedulable_pairs = [(team_i, team_j) for team_i in teams_range for team_j in teams_range
+                               if team_i != team_j and (team_i, team_j) not in scheduled_pairs]
+        if unschedulable_pairs:
+            raise ValueError(f"Forbidden slots leave no week for matches {unschedulable_pairs}")
+
+        m.match_index_set = pe.Set(initialize=match_index, dimen=3, ordered=True)
+
+    @staticmethod
+    def build_match_incidence_sets(m):
+        """
+        Slots of m.match_index_set grouped by home team and season week, by away team and season week and by
+        (home, away) pairing
+        """
+        home_matches = defaultdict(list)
+        away_matches = defaultdict(list)
+        pair_matches = defaultdict(list)
+        for team_i, team_j, week_k, match in SetsBuilder.season_matches(m):
+            home_matches[team_i, week_k].append(match)
+            away_matches[team_j, week_k].append(match)
+            pair_matches[team_i, team_j].append(match)
+
+        m.home_matches_set = pe.Set(m.teams_range_set, m.weeks_range_set, dimen=3,
+                                    initialize=lambda m, team_i, week_k: home_matches[team_i, week_k])
+        m.away_matches_set = pe.Set(m.teams_range_set, m.weeks_range_set, dimen=3,
+                                    initialize=lambda m, team_i, week_k: away_matches[team_i, week_k])
+        m.pair_matches_set = pe.Set(m.teams_range_set, m.teams_range_set, dimen=3,
+                                    initialize=lambda m, team_i, team_j: pair_matches[team_i, team_j])
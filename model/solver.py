@@ -0,0 +1,342 @@
+import time
+from dataclasses import dataclass, field
+
+import pyomo.environ as pe
+import pyomo.opt as popt
+import pyomo.version
+from pyomo.common.dependencies import attempt_import
+from pyomo.contrib.appsi.solvers import Highs
+from model.annealing import AnnealingScheduler
+from model.compact import CompactConstraintsBuilder
+from model.objective import ObjectiveBuilder
+from model.sets import SetsBuilder
+
+highspy, highspy_available = attempt_import("highspy")
+
+
+@dataclass
+class SolverConfig:
+    """
+    Solver backend name and the limits passed to it. None leaves the solver default in place. mip_gap is taken
+    relative to the objective without its constant travel term (see relative_gap) by HiGHS; Gurobi applies it to
+    the full objective
+    """
+    name: str = "gurobi"
+    time_limit: float = None
+    mip_gap: float = None
+    threads: int = None
+    seed: int = None
+    tee: bool = True
+    # solver log file, e.g. "output/solver.log"; None writes no log file
+    logfile: str = None
+    # pass the current variable values to the solver as a MIP start
+    warm_start: bool = False
+    # further options passed to the solver as they are, e.g. {"mip_heuristic_effort": 0.3} for HiGHS
+    options: dict = None
+
+
+@dataclass
+class SolveResult:
+    """
+    Outcome of a solve: the model carrying the loaded solution plus the solver statistics
+    """
+    model: object
+    status: str
+    objective: float = None
+    bound: float = None
+    gap: float = None
+    node_count: int = None
+    wall_time: float = None
+    # (seconds since solve start, incumbent objective, bound, gap) for every improving solution, if reported
+    incumbent_trace: list = field(default_factory=list)
+    # constant part of the objective the gaps are taken without, see relative_gap
+    objective_offset: float = 0.0
+
+    @property
+    def has_solution(self):
+        return self.objective is not None
+
+    @property
+    def time_to_first_feasible(self):
+        return self.incumbent_trace[0][0] if self.incumbent_trace else None
+
+    def time_to_gap(self, target_gap):
+        """
+        Time at which the incumbent first came within target_gap of the bound known at that moment. Incumbents
+        found before any bound are skipped rather than scored against a later bound. If only the final result
+        reaches the target, that is at the end of the run. None if the target was never reached or no bound is known
+        """
+        for elapsed, objective, bound, _ in self.incumbent_trace:
+            gap = relative_gap(objective, bound, self.objective_offset)
+            if gap is not None and gap <= target_gap:
+                return elapsed
+        if self.gap is not None and self.gap <= target_gap:
+            return self.wall_time
+        return None
+
+
+class SolveListener():
+    """
+    Receives progress of a running solve. on_progress returns True to stop the solve early, the best schedule found
+    so far is kept. on_incumbent gets every improving schedule as (home, away, week) matches where the backend can
+    provide it
+    """
+
+    def on_progress(self, elapsed, objective, bound, gap):
+        return False
+
+    def on_incumbent(self, elapsed, objective, chosen_matches):
+        pass
+
+
+def objective_offset(m):
+    """
+    Part of the objective shared by every complete schedule of m (objective_offset_param), 0 if m has none
+    """
+    offset = getattr(m, "objective_offset_param", None)
+    return pe.value(offset) if offset is not None else 0.0
+
+
+def relative_gap(objective, bound, offset=0.0):
+    """
+    Gap between objective and bound relative to the objective without offset. The squared travel term is the same
+    for every complete schedule and dwarfs the attractiveness term, relative to the full objective every schedule
+    would be within a fraction of a percent of the bound
+    """
+    if objective is None or bound is None:
+        return None
+    if objective == bound:
+        return 0.0
+    return abs(objective - bound) / max(abs(objective - offset), 1e-10)
+
+
+class GurobiBackend():
+    """
+    Gurobi through the Pyomo shell interface, which writes the model to an LP file. The shell interface reports no
+    progress, a listener is not called
+    """
+
+    def __init__(self, config, listener=None):
+        self.config = config
+        self.listener = listener
+
+    def solve(self, m):
+        solver = popt.SolverFactory("gurobi")
+        options = {"TimeLimit": self.config.time_limit,
+                   "MIPGap": self.config.mip_gap,
+                   "Threads": self.config.threads,
+                   "Seed": self.config.seed}
+        options.update(self.config.options or {})
+        for key, option in options.items():
+            if option is not None:
+                solver.options[key] = option
+        if self.config.warm_start:
+            CompactConstraintsBuilder.prepare_mip_start(m)
+            ObjectiveBuilder.prepare_mip_start(m)
+        model_instance = m.create_instance()
+        start = time.perf_counter()
+        results = solver.solve(
+            model_instance,
+            tee=self.config.tee,
+            keepfiles=True,
+            logfile=self.config.logfile,
+            report_timing=True,
+            symbolic_solver_labels=True,
+            load_solutions=False,
+            warmstart=self.config.warm_start
+        )
+        wall_time = time.perf_counter() - start
+        objective = bound = None
+        if len(results.solution) > 0:
+            model_instance.solutions.load_from(results)
+            objective = pe.value(model_instance.OBJ)
+            bound = results.problem.lower_bound
+        # the shell interface does not report the node count
+        offset = objective_offset(model_instance)
+        return SolveResult(model=model_instance,
+                           status=results.solver.termination_condition.name,
+                           objective=objective,
+                           bound=bound,
+                           gap=relative_gap(objective, bound, offset),
+                           wall_time=wall_time,
+                           objective_offset=offset)
+
+
+class HighsBackend():
+    """
+    HiGHS through the persistent appsi interface: the model is passed to the solver in memory, no LP file is written.
+    A listener gets bound and gap whenever HiGHS reports progress and can interrupt the search. Improving schedules
+    are passed on only if highspy hands out the full solution vector (highspy 1.7 does not)
+
+    appsi of Pyomo 6.7 (pinned in requirements.txt) has no public accessor for the highspy instance, needed for
+    callbacks, MIP starts and the node count, nor for the column of a variable. Both are read from private appsi
+    attributes in appsi_attribute only, which fails loudly on a Pyomo release without them
+    """
+
+    def __init__(self, config, listener=None):
+        self.config = config
+        self.listener = listener
+        # model currently loaded into the solver
+        self.loaded_model = None
+        self.solver = Highs()
+        self.solver.config.stream_solver = config.tee
+        self.solver.config.load_solution = False
+        # fixed variables become bound changes instead of rebuilding every constraint that contains them
+        self.solver.update_config.treat_fixed_vars_as_params = False
+        self.solver.config.time_limit = config.time_limit
+        if config.logfile:
+            self.solver.config.logfile = config.logfile
+        if config.threads is not None:
+            self.solver.highs_options["threads"] = config.threads
+        if config.seed is not None:
+            self.solver.highs_options["random_seed"] = config.seed
+        self.solver.highs_options.update(config.options or {})
+
+    def appsi_attribute(self, name):
+        if not hasattr(self.solver, name):
+            raise RuntimeError(f"appsi Highs of Pyomo {pyomo.version.version} has no attribute {name}, "
+                               f"HighsBackend is written against Pyomo 6.7")
+        return getattr(self.solver, name)
+
+    def highs_model(self):
+        # the highspy.Highs instance appsi solves with
+        return self.appsi_attribute("_solver_model")
+
+    def var_columns(self):
+        # id of a Pyomo variable -> its column in the highspy model
+        return self.appsi_attribute("_pyomo_var_to_solver_var_map")
+
+    def set_mip_start(self, m):
+        """
+        Hand the current values of the model variables to HiGHS as a MIP start. Unset values count as 0
+        """
+        CompactConstraintsBuilder.prepare_mip_start(m)
+        ObjectiveBuilder.prepare_mip_start(m)
+        highs = self.highs_model()
+        var_columns = self.var_columns()
+        col_value = [0.0] * highs.getNumCol()
+        for var in m.component_data_objects(pe.Var, active=True):
+            column = var_columns.get(id(var))
+            if column is not None and var.value is not None:
+                col_value[column] = float(var.value)
+        solution = highspy.HighsSolution()
+        solution.col_value = col_value
+        solution.value_valid = True
+        highs.setSolution(solution)
+
+    def _solver_callback(self, callback_type, message, data_out, data_in, user_data):
+        bound = data_out.mip_dual_bound
+        bound = bound if abs(bound) < highspy.kHighsInf else None
+        objective = data_out.mip_primal_bound
+        objective = objective if abs(objective) < highspy.kHighsInf else None
+        gap = relative_gap(objective, bound, self.offset)
+        if callback_type == highspy.cb.HighsCallbackType.kCallbackMipImprovingSolution:
+            objective = data_out.objective_function_value
+            gap = relative_gap(objective, bound, self.offset)
+            self.incumbent_trace.append((data_out.running_time, objective, bound, gap))
+            if self.listener is not None:
+                solution = data_out.mip_solution
+                if len(solution) == len(self.column_slots):
+                    slots = [slot for slot, value in zip(self.column_slots, solution) if value > 0.5]
+                    self.listener.on_incumbent(data_out.running_time, objective,
+                                               [match[:3] for match in SetsBuilder.season_matches(self.m, slots)])
+        if self.stop_gap is not None and gap is not None and gap <= self.stop_gap:
+            data_in.user_interrupt = True
+        if self.listener is not None and self.listener.on_progress(data_out.running_time, objective, bound, gap):
+            data_in.user_interrupt = True
+
+    def solve(self, m):
+        start = time.perf_counter()
+        self.incumbent_trace = []
+        # a model solved before is only updated, e.g. with newly fixed variables, instead of being loaded again
+        if self.loaded_model is m:
+            self.solver.update()
+        else:
+            self.solver.set_instance(m)
+            self.loaded_model = m
+        highs = self.highs_model()
+        self.offset = objective_offset(m)
+        # HiGHS would compare mip_gap with the gap of the full objective, which the constant travel term makes
+        # tiny, so a positive mip_gap on a model with an offset is checked in the callback instead
+        self.stop_gap = self.config.mip_gap if self.config.mip_gap and self.offset else None
+        self.solver.config.mip_gap = 0.0 if self.stop_gap is not None else self.config.mip_gap
+        callback_types = [highspy.cb.HighsCallbackType.kCallbackMipImprovingSolution]
+        if self.stop_gap is not None and self.listener is None:
+            callback_types.append(highspy.cb.HighsCallbackType.kCallbackMipInterrupt)
+        if self.listener is not None:
+            self.m = m
+            # slot of every solver column, to turn an incumbent vector into a schedule
+            self.column_slots = [None] * highs.getNumCol()
+            var_columns = self.var_columns()
+            for slot in m.match_index_set:
+                column = var_columns.get(id(m.is_match_this_week_var[slot]))
+                if column is not None:
+                    self.column_slots[column] = slot
+            callback_types += [highspy.cb.HighsCallbackType.kCallbackMipInterrupt,
+                               highspy.cb.HighsCallbackType.kCallbackMipLogging]
+        highs.setCallback(self._solver_callback, None)
+        for callback_type in callback_types:
+            highs.startCallback(callback_type)
+        if self.config.warm_start:
+            self.set_mip_start(m)
+        results = self.solver.solve(m)
+        for callback_type in callback_types:
+            highs.stopCallback(callback_type)
+        wall_time = time.perf_counter() - start
+        status, objective, bound = results.termination_condition.name, results.best_feasible_objective, \
+            results.best_objective_bound
+        info = highs.getInfo()
+        # appsi reports a run interrupted from the callback as unknown and drops its incumbent
+        if highs.getModelStatus() == highspy.HighsModelStatus.kInterrupt:
+            status, bound = "interrupted", info.mip_dual_bound
+            objective = info.objective_function_value if highs.getSolution().value_valid else None
+        if objective is not None:
+            results.solution_loader.load_vars()
+        # appsi does not expose the node count, read it from the underlying highspy instance
+        node_count = info.mip_node_count
+        return SolveResult(model=m,
+                           status=status,
+                           objective=objective,
+                           bound=bound,
+                           gap=relative_gap(objective, bound, self.offset),
+                           node_count=node_count if node_count >= 0 else None,
+                           wall_time=wall_time,
+                           incumbent_trace=self.incumbent_trace,
+                           objective_offset=self.offset)
+
+
+class AnnealingBackend():
+    """
+    Simulated annealing over complete schedules (see AnnealingScheduler) for answers within seconds. time_limit is the
+    wall-clock budget (10 s by default) and seed fixes the random sequence; mip_gap and threads do not apply and no
+    bound is reported
+    """
+
+    def __init__(self, config, listener=None):
+        self.config = config
+        self.listener = listener
+
+    def solve(self, m):
+        scheduler = AnnealingScheduler(m, seed=self.config.seed if self.config.seed is not None else 0,
+                                       listener=self.listener)
+        time_limit = self.config.time_limit if self.config.time_limit is not None else 10.0
+        status, objective, wall_time, incumbent_trace = scheduler.solve(time_limit)
+        return SolveResult(model=m,
+                           status=status,
+                           objective=objective,
+                           wall_time=wall_time,
+                           incumbent_trace=incumbent_trace,
+                           objective_offset=objective_offset(m))
+
+
+SOLVER_BACKENDS = {
+    "gurobi": GurobiBackend,
+    "highs": HighsBackend,
+    "annealing": AnnealingBackend,
+}
+
+
+def get_solver_backend(config, listener=None):
+    if config.name not in SOLVER_BACKENDS:
+        raise ValueError(f"Unknown solver '{config.name}', expected one of {list(SOLVER_BACKENDS)}")
+    return SOLVER_BACKENDS[config.name](config, listener)
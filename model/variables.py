@@ -11,5 +11,6 @@ class VariablesBuilder:
 
     @staticmethod
     def build_is_match_this_week_var(m):
-        m.is_match_this_week_var = pe.Var(m.teams_range_set, m.teams_range_set, m.weeks_range_set, domain=pe.Boolean, initialize=0)
+        # defined only over valid (home, away, week) slots, see SetsBuilder.build_match_index_set
+        m.is_match_this_week_var = pe.Var(m.match_index_set, domain=pe.Boolean, initialize=0)
         return m
@@ -0,0 +1,136 @@
+import random
+import numpy as np
+
+
+class WarmStartBuilder():
+    """
+    Constructive initial schedule used as a MIP start.
+
+    The first half of the season is a single round robin from the circle (Berger) method, the second half mirrors it
+    with home and away swapped, so every pairing meets once per half, every team plays every week and home/away
+    matches are balanced. A repair pass then swaps rounds, flips home/away of pairings and swaps team labels until
+    no team plays three home or three away matches in a row and no conflict pair plays at home in the same week
+    """
+
+    def __init__(self, teams_range, weeks_range, conflict_home_match_list, seed=0, max_iterations=50000):
+        self.teams_range = list(teams_range)
+        self.weeks_range = list(weeks_range)
+        self.n_teams = len(self.teams_range)
+        if not WarmStartBuilder.supports(self.n_teams, len(self.weeks_range)):
+            raise ValueError("Warm start needs an even number of teams and 2 * (teams - 1) weeks")
+        team_position = {team: position for position, team in enumerate(self.teams_range)}
+        self.conflict_pairs = np.array([[team_position[team_i], team_position[team_j]]
+                                        for team_i, team_j in conflict_home_match_list],
+                                       dtype=np.int64).reshape(-1, 2)
+        self.random = random.Random(seed)
+        self.max_iterations = max_iterations
+        self.violations = None
+        self.schedule = self.build_schedule()
+
+    @staticmethod
+    def supports(n_teams, n_weeks):
+        """
+        Whether a league of n_teams over n_weeks has a constructive schedule: a double round robin without byes
+        """
+        return n_teams % 2 == 0 and n_weeks == 2 * (n_teams - 1)
+
+    @staticmethod
+    def circle_method(n_teams):
+        """
+        Single round robin as a list of rounds, each a list of (home, away) team positions. Team n_teams - 1 stays
+        fixed while the others rotate; home rights alternate so that breaks stay isolated
+        """
+        rounds = []
+        for round_r in range(n_teams - 1):
+            fixed_opponent = round_r
+            pairs = [(n_teams - 1, fixed_opponent) if round_r % 2 else (fixed_opponent, n_teams - 1)]
+            for k in range(1, n_teams // 2):
+                team_a = (round_r + k) % (n_teams - 1)
+                team_b = (round_r - k) % (n_teams - 1)
+                pairs.append((team_a, team_b) if k % 2 else (team_b, team_a))
+            rounds.append(pairs)
+        return rounds
+
+    def home_matrix(self, rounds):
+        """
+        Boolean (team, week) matrix of home matches over the whole season
+        """
+        n_rounds = len(rounds)
+        home = np.zeros((self.n_teams, 2 * n_rounds), dtype=np.int8)
+        for round_r, pairs in enumerate(rounds):
+            for team_home, team_away in pairs:
+                home[team_home, round_r] = 1
+                home[team_away, round_r + n_rounds] = 1
+        return home
+
+    def count_violations(self, home):
+        windows = home[:, :-2] + home[:, 1:-1] + home[:, 2:]
+        three_in_a_row = int(np.count_nonzero(windows == 3) + np.count_nonzero(windows == 0))
+        conflicts = int(np.count_nonzero(home[self.conflict_pairs[:, 0]] & home[self.conflict_pairs[:, 1]]))
+        return three_in_a_row + conflicts
+
+    def random_move(self, rounds):
+        rounds = [list(pairs) for pairs in rounds]
+        move = self.random.randrange(3)
+        if move == 0:
+            # round swap
+            round_a, round_b = self.random.sample(range(len(rounds)), 2)
+            rounds[round_a], rounds[round_b] = rounds[round_b], rounds[round_a]
+        elif move == 1:
+            # home/away flip of a pairing (both legs)
+            round_r = self.random.randrange(len(rounds))
+            pair_p = self.random.randrange(len(rounds[round_r]))
+            team_home, team_away = rounds[round_r][pair_p]
+            rounds[round_r][pair_p] = (team_away, team_home)
+        else:
+            # team swap
+            team_a, team_b = self.random.sample(range(self.n_teams), 2)
+            relabel = {team_a: team_b, team_b: team_a}
+            rounds = [[(relabel.get(team_home, team_home), relabel.get(team_away, team_away))
+                       for team_home, team_away in pairs] for pairs in rounds]
+        return rounds
+
+    def repair(self, rounds):
+        """
+        Hill climbing over random moves, sideways moves are accepted to escape plateaus
+        """
+        violations = self.count_violations(self.home_matrix(rounds))
+        for _ in range(self.max_iterations):
+            if violations == 0:
+                break
+            candidate = self.random_move(rounds)
+            candidate_violations = self.count_violations(self.home_matrix(candidate))
+            if candidate_violations <= violations:
+                rounds, violations = candidate, candidate_violations
+        return rounds, violations
+
+    def build_schedule(self):
+        """
+        Season schedule as a list of (home team, away team, week) with ids from teams_range and weeks_range
+        """
+        rounds, self.violations = self.repair(WarmStartBuilder.circle_method(self.n_teams))
+        n_rounds = len(rounds)
+        schedule = []
+        for round_r, pairs in enumerate(rounds):
+            for team_home, team_away in pairs:
+                schedule.append((self.teams_range[team_home], self.teams_range[team_away], self.weeks_range[round_r]))
+                schedule.append((self.teams_range[team_away], self.teams_range[team_home],
+                                 self.weeks_range[round_r + n_rounds]))
+        return schedule
+
+    @staticmethod
+    def load_into_model(m, schedule):
+        """
+        Set is_match_this_week_var to the schedule, fixed variables keep their value. Slots are matched by their own
+        (home, away, week) key, which in the mirrored scheme is the first-half leg. Returns the number of scheduled
+        matches without a slot in the model (e.g. forbidden ones)
+        """
+        scheduled = set(schedule)
+        for slot in m.match_index_set:
+            if not m.is_match_this_week_var[slot].fixed:
+                m.is_match_this_week_var[slot].set_value(1 if slot in scheduled else 0)
+        slots = set(m.match_index_set)
+        offset = m.mirror_offset_param.value
+        return sum(1 for team_i, team_j, week_k in schedule
+                   if (team_i, team_j, week_k) not in slots
+                   and not (offset and (team_j, team_i, week_k - offset) in slots))
@@ -0,0 +1,129 @@
+import cProfile
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict
+
+import pyomo.environ as pe
+from pyomo.core.expr.visitor import identify_variables
+
+METRICS_FILE = "output/pipeline_metrics.jsonl"
+
+
+class PipelineMetrics():
+    """
+    Structured metrics of one pipeline run: wall time and peak memory of every phase, model size per constraint
+    family and the solver outcome, written as one JSON record.
+
+    Phases nest, e.g. the builders of the model inside "build" are recorded as "build.sets", "build.variables", ...
+    With track_memory, peak memory is the largest amount of memory allocated during the phase on top of what was
+    allocated at its start, as traced by tracemalloc. That covers Python objects and NumPy arrays but not memory of
+    the solver. Tracing slows Pyomo down noticeably, so it is off by default and the timings stay clean. With
+    profile_build set to a file path the build phase runs under cProfile and its stats are dumped there, e.g. for
+    snakeviz or pstats
+    """
+
+    def __init__(self, track_memory=False, profile_build=None):
+        self.track_memory = track_memory
+        self.profile_build = profile_build
+        self.record = {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "phases": {}}
+        # name, traced memory at the start and peak memory so far of the open phases
+        self.open_phases = []
+        self.started_tracing = False
+
+    @contextmanager
+    def phase(self, name, profile=False):
+        """
+        Context manager measuring a phase, profile=True runs it under cProfile if profile_build is set
+        """
+        full_name = ".".join([open_phase[0] for open_phase in self.open_phases] + [name])
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        if self.track_memory:
+            self.close_peak()
+        start_memory = tracemalloc.get_traced_memory()[0] if self.track_memory else 0
+        self.open_phases.append((name, start_memory, start_memory))
+        profiler = cProfile.Profile() if profile and self.profile_build else None
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            wall_time = time.perf_counter() - start
+            if self.track_memory:
+                self.close_peak()
+            _, start_memory, peak = self.open_phases.pop()
+            phase = {"wall_time": wall_time}
+            if self.track_memory:
+                phase["peak_memory_mb"] = (peak - start_memory) / 1024 ** 2
+                # the peak of a phase is part of the peak of the phase around it
+                if self.open_phases:
+                    parent_name, parent_start, parent_peak = self.open_phases[-1]
+                    self.open_phases[-1] = (parent_name, parent_start, max(parent_peak, peak))
+                elif self.started_tracing:
+                    tracemalloc.stop()
+                    self.started_tracing = False
+            if profiler is not None:
+                os.makedirs(os.path.dirname(self.profile_build) or ".", exist_ok=True)
+                profiler.dump_stats(self.profile_build)
+                self.record["build_profile"] = self.profile_build
+            self.record["phases"][full_name] = phase
+
+    def close_peak(self):
+        # fold the peak since the last reset into the innermost open phase, then measure anew
+        if self.open_phases:
+            name, start_memory, peak = self.open_phases[-1]
+            self.open_phases[-1] = (name, start_memory, max(peak, tracemalloc.get_traced_memory()[1]))
+        tracemalloc.reset_peak()
+
+    def add_settings(self, **settings):
+        self.record["settings"] = settings
+
+    def add_model_size(self, m):
+        """
+        Rows, columns (distinct variables) and nonzeros of every constraint family and of the whole model
+        """
+        families = {}
+        for constraint in m.component_objects(pe.Constraint, active=True):
+            columns, nonzeros = set(), 0
+            for constraint_data in constraint.values():
+                variables = list(identify_variables(constraint_data.body, include_fixed=False))
+                nonzeros += len(variables)
+                columns.update(id(variable) for variable in variables)
+            families[constraint.name] = {"rows": len(constraint), "columns": len(columns), "nonzeros": nonzeros}
+        self.record["model_size"] = {
+            "rows": sum(family["rows"] for family in families.values()),
+            "columns": m.nvariables(),
+            "nonzeros": sum(family["nonzeros"] for family in families.values()),
+            "constraint_families": families,
+        }
+
+    def add_solve_result(self, solve_result, solver_config=None):
+        self.record["solver"] = {
+            "config": asdict(solver_config) if solver_config is not None else None,
+            "status": solve_result.status,
+            "objective": solve_result.objective,
+            "bound": solve_result.bound,
+            "gap": solve_result.gap,
+            "objective_offset": solve_result.objective_offset,
+            "nodes": solve_result.node_count,
+            "wall_time": solve_result.wall_time,
+            "time_to_first_feasible": solve_result.time_to_first_feasible,
+        }
+
+    def to_json(self):
+        return json.dumps(self.record, default=str)
+
+    def write(self, path=METRICS_FILE):
+        """
+        Append the record as one line to the JSON lines file at path
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "a") as metrics_file:
+            metrics_file.write(self.to_json() + "\n")
@@ -0,0 +1,197 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+import types
+from dataclasses import asdict
+from functools import lru_cache
+
+CACHE_DIR = "output/cache"
+# size limit of all cached entries, the least recently used ones are evicted first
+CACHE_MAX_BYTES = 512 * 1024 ** 2
+ENTRY_FILE = "schedule.json"
+MODEL_FILE = "model.mps"
+# solver settings that only affect logging and therefore not the schedule
+IGNORED_SOLVER_FIELDS = ("tee", "logfile")
+# sources the schedule depends on besides the configuration, relative to this file. Any change to them, e.g. a new
+# constraint, gives new cache keys
+SOURCE_PATTERNS = ("model/*.py", "data_preprocesser.py")
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as data_file:
+        for chunk in iter(lambda: data_file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@lru_cache(maxsize=None)
+def source_hash():
+    """
+    Hash of the files of SOURCE_PATTERNS, computed once per process
+    """
+    root = os.path.dirname(os.path.abspath(__file__))
+    digest = hashlib.sha256()
+    for path in sorted(path for pattern in SOURCE_PATTERNS for path in glob.glob(os.path.join(root, pattern))):
+        digest.update(os.path.relpath(path, root).encode())
+        digest.update(file_hash(path).encode())
+    return digest.hexdigest()
+
+
+def _code_hash(code):
+    # bytecode, constants (nested functions included) and the names the code refers to
+    digest = hashlib.sha256(code.co_code)
+    for const in code.co_consts:
+        digest.update((_code_hash(const) if isinstance(const, types.CodeType) else repr(const)).encode())
+    digest.update(repr(code.co_names).encode())
+    return digest.hexdigest()
+
+
+def _config_value(value):
+    # functions such as an attractiveness formula, lambdas included, are identified by their code, defaults and the
+    # values they close over, not by their name. Everything else by its repr
+    if hasattr(value, "dtype") and hasattr(value, "tobytes"):
+        # the repr of a large array elides most of its values
+        return {"array": hashlib.sha256(value.tobytes()).hexdigest(), "shape": list(value.shape),
+                "dtype": str(value.dtype)}
+    code = getattr(value, "__code__", None)
+    if code is None:
+        return getattr(value, "__qualname__", repr(value))
+    return {"function": value.__qualname__, "code": _code_hash(code), "defaults": value.__defaults__ or (),
+            "closure": [cell.cell_contents for cell in value.__closure__ or ()]}
+
+
+class ScheduleCache():
+    """
+    Persistent, content-addressed cache of solved schedules.
+
+    An entry is keyed by the hash of the input data files together with the preprocessing, model and solver
+    configuration and the model sources (source_hash), so the key changes whenever anything that could change the
+    schedule changes. Each entry is a
+    directory holding the chosen matches and solve stats as JSON and optionally the built model as MPS. Entries can
+    be copied between hosts as they are. When the cache grows beyond max_bytes the least recently used entries are
+    evicted
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, export_model=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.export_model = export_model
+
+    @staticmethod
+    def cache_key(data_files, preprocess_kwargs=None, model_kwargs=None, solver_config=None):
+        solver_settings = asdict(solver_config) if solver_config is not None else {}
+        for field_name in IGNORED_SOLVER_FIELDS:
+            solver_settings.pop(field_name, None)
+        key_data = {
+            "data": {path: file_hash(path) for path in sorted(set(data_files))},
+            "preprocess": preprocess_kwargs or {},
+            "model": model_kwargs or {},
+            "solver": solver_settings,
+            "source": source_hash(),
+        }
+        key_json = json.dumps(key_data, sort_keys=True, default=_config_value)
+        return hashlib.sha256(key_json.encode()).hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def get(self, key):
+        """
+        Cached entry as a dict (chosen_matches, status, objective, gap, ...) or None on a miss
+        """
+        entry_path = os.path.join(self.entry_dir(key), ENTRY_FILE)
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path) as entry_file:
+            entry = json.load(entry_file)
+        # the modification time of the entry file tracks the last use for eviction
+        os.utime(entry_path)
+        entry["chosen_matches"] = [tuple(match) for match in entry["chosen_matches"]]
+        return entry
+
+    def put(self, key, chosen_matches, solve_result=None, model=None):
+        """
+        Store a solved schedule under key, with the built model as MPS if export_model is set
+        """
+        entry_dir = self.entry_dir(key)
+        os.makedirs(entry_dir, exist_ok=True)
+        if self.export_model and model is not None:
+            model.write(os.path.join(entry_dir, MODEL_FILE), io_options={"symbolic_solver_labels": True})
+        entry = {
+            "chosen_matches": [list(match) for match in chosen_matches],
+            "status": solve_result.status if solve_result is not None else None,
+            "objective": solve_result.objective if solve_result is not None else None,
+            "gap": solve_result.gap if solve_result is not None else None,
+            "created": time.time(),
+        }
+        # write to a temporary file first so that readers never see a partial entry
+        entry_path = os.path.join(entry_dir, ENTRY_FILE)
+        with open(entry_path + ".tmp", "w") as entry_file:
+            json.dump(entry, entry_file)
+        os.replace(entry_path + ".tmp", entry_path)
+        self.evict()
+
+    def entries(self):
+        """
+        (key, size in bytes, last use) of every complete entry
+        """
+        if not os.path.isdir(self.cache_dir):
+            return []
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            entry_dir = self.entry_dir(key)
+            entry_path = os.path.join(entry_dir, ENTRY_FILE)
+            if not os.path.exists(entry_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(entry_dir, name)) for name in os.listdir(entry_dir))
+            entries.append((key, size, os.path.getmtime(entry_path)))
+        return entries
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache fits into max_bytes. Returns the removed keys
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        total_size = sum(size for _, size, _ in entries)
+        removed = []
+        for key, size, _ in entries:
+            if total_size <= self.max_bytes:
+                break
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total_size -= size
+            removed.append(key)
+        return removed
+
+    def invalidate(self, key=None):
+        """
+        Remove the entry of key, or every entry if no key is given. Returns the number of removed entries
+        """
+        keys = [key] if key is not None else [entry_key for entry_key, _, _ in self.entries()]
+        removed = 0
+        for entry_key in keys:
+            if os.path.isdir(self.entry_dir(entry_key)):
+                shutil.rmtree(self.entry_dir(entry_key))
+                removed += 1
+        return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the cache of solved schedules")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("list", help="list cached entries")
+    invalidate_parser = subparsers.add_parser("invalidate", help="remove one entry or the whole cache")
+    invalidate_parser.add_argument("key", nargs="?", help="entry to remove, all entries if omitted")
+    args = parser.parse_args()
+
+    cache = ScheduleCache(args.cache_dir)
+    if args.command == "list":
+        for key, size, last_used in sorted(cache.entries(), key=lambda entry: entry[2], reverse=True):
+            print(f"{key}  {size / 1024:.1f} KiB  last used {time.strftime('%Y-%m-%d %H:%M', time.localtime(last_used))}")
+    else:
+        print(f"Removed {cache.invalidate(args.key)} cache entries")
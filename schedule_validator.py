@@ -0,0 +1,290 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+
+# the scheduling schemes of SetsBuilder, repeated here so that checking a schedule does not import Pyomo
+SCHEDULING_SCHEMES = ("standard", "mirrored")
+
+
+class ScheduleValidator():
+    """
+    Checks and scores complete schedules given as (home team, away team, week) arrays with NumPy only, without
+    building a Pyomo model.
+
+    schedule[i, j, k] is 1 if the team at position i of teams_range hosts the team at position j in the week at
+    position k. All rules of ConstraintsBuilder are checked on the whole season: every ordered pairing played once,
+    at most one match per team and week, the two legs of a pairing in different halves, as many home as away matches,
+    at most two home and two away matches in any three consecutive weeks and no parallel home matches of a conflict
+    pair. Matches on forbidden_slots (as taken by SetsBuilder) are violations, and in the mirrored scheme every round
+    of the second half must repeat its first half round with home and away swapped. travel and attractiveness are
+    the two terms of ObjectiveBuilder, objective their weighted sum.
+
+    count_violations and score also take a stack of schedules with any leading axes, e.g. (schedules, team, team,
+    week), and return one value per schedule. Diagnostics name teams by their index in teams_range and weeks by
+    their number, like the chosen matches of the model
+    """
+
+    def __init__(self, team_distance_matrix, conflict_home_match_list=(), match_attractiveness=None, teams_range=None,
+                 weeks_range=None, travel_weight=1.0, attractiveness_weight=1.0, forbidden_slots=None,
+                 scheme="standard"):
+        if scheme not in SCHEDULING_SCHEMES:
+            raise ValueError(f"Unknown scheduling scheme '{scheme}', expected one of {list(SCHEDULING_SCHEMES)}")
+        self.travel_matrix = np.asarray(team_distance_matrix, dtype=float) ** 2
+        n_teams = len(self.travel_matrix)
+        self.teams_range = np.asarray(teams_range if teams_range is not None else range(1, n_teams + 1))
+        self.weeks_range = np.asarray(weeks_range if weeks_range is not None else range(1, 2 * n_teams - 1))
+        team_position = {team: position for position, team in enumerate(self.teams_range.tolist())}
+        # both orientations of a conflict pair describe the same rule, each pair is checked once
+        pairs = sorted(set((min(team_position[team_i], team_position[team_j]),
+                            max(team_position[team_i], team_position[team_j]))
+                           for team_i, team_j in conflict_home_match_list))
+        self.conflict_pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+        self.forbidden = self.forbidden_array(forbidden_slots or [])
+        self.is_mirrored = scheme == "mirrored"
+        if self.is_mirrored and len(self.weeks_range) % 2:
+            raise ValueError("Mirrored scheme needs an even number of weeks")
+        # MatchAttractiveness is scored through its factors, other values as a dense (team, team, week) array
+        if match_attractiveness is None:
+            self.pair_matrix, self.week_factors, self.attractiveness = None, None, None
+        elif hasattr(match_attractiveness, "pair_matrix"):
+            self.pair_matrix = match_attractiveness.pair_matrix
+            self.week_factors = match_attractiveness.week_factors
+            self.attractiveness = None
+        else:
+            self.pair_matrix, self.week_factors = None, None
+            self.attractiveness = np.asarray(match_attractiveness, dtype=float)
+        self.travel_weight = travel_weight
+        self.attractiveness_weight = attractiveness_weight
+        self.off_diagonal = ~np.eye(n_teams, dtype=bool)
+        self.upper = np.triu(self.off_diagonal)
+
+    @staticmethod
+    def from_preprocess(dp, **kwargs):
+        """
+        Validator of the league of a DataPreprocess, kwargs are passed on (e.g. travel_weight, forbidden_slots or
+        scheme)
+        """
+        return ScheduleValidator(dp.team_distance_matrix, dp.conflict_home_match_list, dp.match_attractiveness,
+                                 dp.teams_range, list(dp.weeks_range), **kwargs)
+
+    def to_array(self, chosen_matches):
+        """
+        Schedule array of (home team, away team, week) matches as returned by extract_schedule
+        """
+        chosen_matches = np.asarray(chosen_matches, dtype=np.int64).reshape(-1, 3)
+        schedule = np.zeros((len(self.teams_range), len(self.teams_range), len(self.weeks_range)), dtype=np.int8)
+        home, away, week = self.positions(chosen_matches[:, 0], chosen_matches[:, 1], chosen_matches[:, 2])
+        np.add.at(schedule, (home, away, week), 1)
+        return schedule
+
+    def positions(self, home_teams, away_teams, weeks):
+        """
+        Positions in teams_range and weeks_range of team and week ids, raises ValueError for ids of neither
+        """
+        unknown_teams = np.setdiff1d(np.concatenate([home_teams, away_teams]), self.teams_range)
+        if len(unknown_teams):
+            raise ValueError(f"Teams {unknown_teams.tolist()} are not in the league")
+        unknown_weeks = np.setdiff1d(weeks, self.weeks_range)
+        if len(unknown_weeks):
+            raise ValueError(f"Weeks {unknown_weeks.tolist()} are not in the season")
+        # teams_range and weeks_range need not be sorted
+        team_order, week_order = np.argsort(self.teams_range), np.argsort(self.weeks_range)
+        return team_order[np.searchsorted(self.teams_range, home_teams, sorter=team_order)], \
+            team_order[np.searchsorted(self.teams_range, away_teams, sorter=team_order)], \
+            week_order[np.searchsorted(self.weeks_range, weeks, sorter=week_order)]
+
+    def forbidden_array(self, forbidden_slots):
+        """
+        Boolean (home team, away team, week) array of the forbidden slots, a (home, None, week) slot forbids every
+        match hosted by the team in that week
+        """
+        forbidden = np.zeros((len(self.teams_range), len(self.teams_range), len(self.weeks_range)), dtype=bool)
+        if not forbidden_slots:
+            return forbidden
+        home_teams = np.array([team_i for team_i, _, _ in forbidden_slots], dtype=np.int64)
+        # a whole home week is marked against the home team itself first and spread over all opponents below
+        away_teams = np.array([team_i if team_j is None else team_j for team_i, team_j, _ in forbidden_slots],
+                              dtype=np.int64)
+        weeks = np.array([week_k for _, _, week_k in forbidden_slots], dtype=np.int64)
+        home, away, week = self.positions(home_teams, away_teams, weeks)
+        whole_week = np.array([team_j is None for _, team_j, _ in forbidden_slots])
+        forbidden[home[~whole_week], away[~whole_week], week[~whole_week]] = True
+        forbidden[home[whole_week], :, week[whole_week]] = True
+        return forbidden
+
+    @staticmethod
+    def read_schedule_table(schedule_file, teams_name_index_map):
+        """
+        (home team, away team, week) matches of a home x away table of "Week k" cells, the format
+        DataPostprocess writes to SCHEDULE_FILE
+        """
+        import pandas as pd
+
+        table = pd.read_excel(schedule_file, index_col=0)
+        unknown = sorted(set(table.index.astype(str)).union(table.columns.astype(str)) - set(teams_name_index_map))
+        if unknown:
+            raise ValueError(f"Teams {unknown} of {schedule_file} are not in the league")
+        cells = table.stack()
+        weeks = cells.astype(str).str.extract(r"(\d+)", expand=False)
+        if weeks.isna().any():
+            raise ValueError(f"Cells {cells[weeks.isna()].tolist()} of {schedule_file} are not weeks")
+        return [(teams_name_index_map[str(home)], teams_name_index_map[str(away)], int(week))
+                for (home, away), week in weeks.items()]
+
+    @staticmethod
+    def team_counts(schedule):
+        """
+        Matches of every ordered pairing in the first and the second half, home and away matches of every team and
+        week. Counts are int16, summing int8 schedules in their own type is considerably faster than in int64
+        """
+        half = schedule.shape[-1] // 2
+        return schedule[..., :half].sum(axis=-1, dtype=np.int16), schedule[..., half:].sum(axis=-1, dtype=np.int16), \
+            schedule.sum(axis=-2, dtype=np.int16), schedule.sum(axis=-3, dtype=np.int16)
+
+    def violation_masks(self, schedule):
+        """
+        Boolean array per rule marking its violated rows, with the leading axes of schedule in front
+        """
+        schedule = np.asarray(schedule)
+        first_half, second_half, home, away = ScheduleValidator.team_counts(schedule)
+        pair_count = first_half + second_half
+        # a team playing itself breaks the pairing rule as well
+        once = np.where(self.off_diagonal, pair_count != 1, pair_count > 0)
+        both_legs = np.stack([(first_half + np.swapaxes(first_half, -1, -2) > 1) & self.upper,
+                              (second_half + np.swapaxes(second_half, -1, -2) > 1) & self.upper], axis=-1)
+        consecutive = np.stack([home[..., :-2] + home[..., 1:-1] + home[..., 2:] > 2,
+                                away[..., :-2] + away[..., 1:-1] + away[..., 2:] > 2], axis=-1)
+        conflict = home[..., self.conflict_pairs[:, 0], :] + home[..., self.conflict_pairs[:, 1], :] > 1
+        half = schedule.shape[-1] // 2
+        # round k + half repeats round k with home and away swapped, an unmirrored scheme has no such rows
+        mirrored = schedule[..., :half] != np.swapaxes(schedule[..., half:], -2, -3) if self.is_mirrored else \
+            np.zeros(schedule.shape[:-1] + (0,), dtype=bool)
+        return {
+            "each_match_is_played_once": once,
+            "max_one_match_per_team_per_week": home + away > 1,
+            "no_both_matches_weeks_half": both_legs,
+            "balance_home_away_matches": home.sum(axis=-1) != away.sum(axis=-1),
+            "three_consecutive_rounds": consecutive,
+            "conflict_home_match": conflict,
+            "forbidden_slots": (schedule > 0) & self.forbidden,
+            "mirrored_rounds": mirrored,
+        }
+
+    def count_violations(self, schedule):
+        """
+        Number of violated rows per rule
+        """
+        return {rule: mask.reshape(mask.shape[:np.ndim(schedule) - 3] + (-1,)).sum(axis=-1)
+                for rule, mask in self.violation_masks(schedule).items()}
+
+    def is_feasible(self, schedule):
+        return not any(np.any(mask) for mask in self.violation_masks(schedule).values())
+
+    def score(self, schedule):
+        """
+        Squared travel distance, attractiveness and weighted objective of ObjectiveBuilder. Attractiveness is 0
+        without match_attractiveness
+        """
+        schedule = np.asarray(schedule)
+        travel = (schedule.sum(axis=-1, dtype=np.int16) * self.travel_matrix).sum(axis=(-2, -1))
+        if self.pair_matrix is not None:
+            attractiveness = ((schedule @ self.week_factors) * self.pair_matrix).sum(axis=(-2, -1))
+        elif self.attractiveness is not None:
+            attractiveness = (schedule * self.attractiveness).sum(axis=(-3, -2, -1))
+        else:
+            attractiveness = np.zeros_like(travel)
+        return travel, attractiveness, self.travel_weight * travel + self.attractiveness_weight * attractiveness
+
+    def away_trip_travel(self, schedule):
+        """
+        Squared travel of the away matches every team plays in two consecutive weeks, the away_trip_travel_expr
+        term of ObjectiveBuilder
+        """
+        schedule = np.asarray(schedule)
+        # travel of the away team of every match, summed over the hosts
+        away_travel = (schedule * self.travel_matrix[:, :, None]).sum(axis=-3)
+        away = schedule.sum(axis=-3, dtype=np.int16)
+        both_away = away[..., :-1] * away[..., 1:]
+        return ((away_travel[..., :-1] + away_travel[..., 1:]) * both_away).sum(axis=(-2, -1))
+
+    def diagnose(self, schedule):
+        """
+        One dict per violated row of a single schedule: the rule, the teams and weeks involved and what was found
+        """
+        schedule = np.asarray(schedule)
+        first_half, second_half, home, away = ScheduleValidator.team_counts(schedule)
+        pair_count = first_half + second_half
+        teams, weeks = self.teams_range.tolist(), self.weeks_range.tolist()
+        half = len(weeks) // 2
+        masks = self.violation_masks(schedule)
+        violations = []
+        for i, j in np.argwhere(masks["each_match_is_played_once"]).tolist():
+            violations.append({"rule": "each_match_is_played_once", "teams": [teams[i], teams[j]],
+                               "weeks": [weeks[k] for k in np.flatnonzero(schedule[i, j])],
+                               "detail": f"{teams[i]} hosts {teams[j]} {pair_count[i, j]} times"})
+        for i, k in np.argwhere(masks["max_one_match_per_team_per_week"]).tolist():
+            opponents = np.flatnonzero(schedule[i, :, k]).tolist() + np.flatnonzero(schedule[:, i, k]).tolist()
+            violations.append({"rule": "max_one_match_per_team_per_week", "teams": [teams[i]], "weeks": [weeks[k]],
+                               "detail": f"{teams[i]} plays {len(opponents)} matches, against "
+                                         f"{[teams[opponent] for opponent in opponents]}"})
+        for i, j, second in np.argwhere(masks["no_both_matches_weeks_half"]).tolist():
+            half_weeks = slice(half, None) if second else slice(None, half)
+            legs = np.flatnonzero(schedule[i, j, half_weeks] + schedule[j, i, half_weeks]) + (half if second else 0)
+            violations.append({"rule": "no_both_matches_weeks_half", "teams": [teams[i], teams[j]],
+                               "weeks": [weeks[k] for k in legs],
+                               "detail": f"both legs in the {'second' if second else 'first'} half"})
+        for i in np.flatnonzero(masks["balance_home_away_matches"]).tolist():
+            violations.append({"rule": "balance_home_away_matches", "teams": [teams[i]], "weeks": [],
+                               "detail": f"{home[i].sum()} home and {away[i].sum()} away matches"})
+        for i, k, is_away in np.argwhere(masks["three_consecutive_rounds"]).tolist():
+            violations.append({"rule": "three_consecutive_rounds", "teams": [teams[i]], "weeks": weeks[k:k + 3],
+                               "detail": f"{(away if is_away else home)[i, k:k + 3].sum()} "
+                                         f"{'away' if is_away else 'home'} matches in three consecutive weeks"})
+        for pair, k in np.argwhere(masks["conflict_home_match"]).tolist():
+            i, j = self.conflict_pairs[pair].tolist()
+            violations.append({"rule": "conflict_home_match", "teams": [teams[i], teams[j]], "weeks": [weeks[k]],
+                               "detail": "both teams of a conflict pair play at home"})
+        for i, j, k in np.argwhere(masks["forbidden_slots"]).tolist():
+            violations.append({"rule": "forbidden_slots", "teams": [teams[i], teams[j]], "weeks": [weeks[k]],
+                               "detail": f"{teams[i]} hosts {teams[j]} on a forbidden slot"})
+        for i, j, k in np.argwhere(masks["mirrored_rounds"]).tolist():
+            violations.append({"rule": "mirrored_rounds", "teams": [teams[i], teams[j]],
+                               "weeks": [weeks[k], weeks[k + half]],
+                               "detail": f"{teams[i]} hosting {teams[j]} in week {weeks[k]} is "
+                                         f"{'' if schedule[i, j, k] else 'not '}mirrored by {teams[j]} hosting "
+                                         f"{teams[i]} in week {weeks[k + half]}"})
+        return violations
+
+    def validate(self, schedule):
+        """
+        Feasibility, violations and objective terms of a single schedule, as array or list of matches
+        """
+        schedule = np.asarray(schedule)
+        if schedule.ndim != 3:
+            schedule = self.to_array(schedule)
+        violations = self.diagnose(schedule)
+        travel, attractiveness, objective = self.score(schedule)
+        return {"feasible": not violations, "violations": violations, "travel": float(travel),
+                "attractiveness": float(attractiveness), "objective": float(objective)}
+
+
+if __name__ == "__main__":
+    from data_postprocess import SCHEDULE_FILE
+    from data_preprocesser import DataPreprocess
+
+    parser = argparse.ArgumentParser(description="Check and score a schedule table against the league's rules")
+    parser.add_argument("schedule_file", nargs="?", default=SCHEDULE_FILE)
+    parser.add_argument("--travel-weight", type=float, default=1.0)
+    parser.add_argument("--attractiveness-weight", type=float, default=1.0)
+    parser.add_argument("--scheme", choices=SCHEDULING_SCHEMES, default="standard")
+    args = parser.parse_args()
+
+    dp = DataPreprocess()
+    validator = ScheduleValidator.from_preprocess(dp, travel_weight=args.travel_weight,
+                                                  attractiveness_weight=args.attractiveness_weight,
+                                                  scheme=args.scheme)
+    report = validator.validate(ScheduleValidator.read_schedule_table(args.schedule_file, dp.teams_name_index_map))
+    print(json.dumps(report, indent=2))
+    sys.exit(0 if report["feasible"] else 1)
@@ -0,0 +1,295 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+from dataclasses import dataclass, field, replace
+
+from data_preprocesser import DataPreprocess
+from main import build_model, extract_schedule
+from model.annealing import AnnealingScheduler
+from model.mip import Model
+from model.solver import SolverConfig, SolveListener
+from schedule_cache import ScheduleCache
+
+# seconds between two progress messages of a job, the solvers report much more often
+PROGRESS_INTERVAL = 0.5
+# HiGHS only checks for interrupts once branching started, a stopped job still solving its root after this many
+# seconds is ended with its latest incumbent
+STOP_GRACE_PERIOD = 5.0
+# seconds a job that is no longer active is kept for polling before the service drops it, callers that keep the
+# result themselves forget it right away
+FINISHED_JOB_TTL = 900.0
+
+
+class QueueListener(SolveListener):
+    """
+    Forwards solver progress and incumbent schedules of a job process to the service. The search is stopped once
+    stop_event is set or the gap reaches target_gap (0 disables the target), stopped then tells that the listener
+    ended the solve rather than the solver
+    """
+
+    def __init__(self, messages, stop_event, target_gap, phase):
+        self.messages = messages
+        self.stop_event = stop_event
+        self.target_gap = target_gap
+        self.phase = phase
+        self.last_progress = -PROGRESS_INTERVAL
+        self.stopped = False
+
+    def on_progress(self, elapsed, objective, bound, gap):
+        if elapsed - self.last_progress >= PROGRESS_INTERVAL:
+            self.last_progress = elapsed
+            self.messages.put(("progress", {"phase": self.phase, "objective": objective, "bound": bound,
+                                            "gap": gap}))
+        target_gap = self.target_gap.value
+        if self.stop_event.is_set() or (target_gap > 0 and gap is not None and gap <= target_gap):
+            self.stopped = True
+        return self.stopped
+
+    def on_incumbent(self, elapsed, objective, chosen_matches):
+        self.messages.put(("incumbent", {"phase": self.phase, "objective": objective,
+                                         "chosen_matches": chosen_matches}))
+
+
+def run_solve_job(settings, messages, stop_event, target_gap):
+    """
+    Body of a job process: preprocess, build, anneal for a warm start and solve, reporting through messages
+    """
+    try:
+        dp = DataPreprocess(**settings["preprocess_kwargs"])
+        solver_config = settings["solver_config"]
+        cache, cache_key = settings["cache"], None
+        if cache is not None:
+            cache_key = ScheduleCache.cache_key(dp.input_files(), settings["preprocess_kwargs"],
+                                                settings["model_kwargs"], solver_config)
+            entry = cache.get(cache_key)
+            if entry is not None:
+                messages.put(("done", {"status": entry["status"], "objective": entry["objective"],
+                                       "gap": entry["gap"], "chosen_matches": entry["chosen_matches"],
+                                       "cached": True}))
+                return
+
+        messages.put(("phase", "build"))
+        model = build_model(dp, **settings["model_kwargs"])
+        status, objective, gap, chosen_matches = None, None, None, None
+        if settings["warm_start_time"] and solver_config.name != "annealing":
+            # a quick annealing run gives the UI schedules to show right away and the MIP its start
+            messages.put(("phase", "warm start"))
+            scheduler = AnnealingScheduler(model.m, seed=solver_config.seed or 0,
+                                           listener=QueueListener(messages, stop_event, target_gap, "warm start"))
+            status, objective, _, _ = scheduler.solve(settings["warm_start_time"])
+            if status == "feasible":
+                chosen_matches = extract_schedule(model.m)
+                solver_config = replace(solver_config, warm_start=True)
+
+        if not stop_event.is_set():
+            messages.put(("phase", "solve"))
+            listener = QueueListener(messages, stop_event, target_gap, "solve")
+            solve_result = Model.solve_model(model.m, solver_config, listener)
+            if solve_result.has_solution:
+                status, objective, gap = solve_result.status, solve_result.objective, solve_result.gap
+                chosen_matches = extract_schedule(solve_result.model)
+                # neither the stop nor the target gap are part of the cache key, only complete solves are stored
+                if cache is not None and not listener.stopped:
+                    cache.put(cache_key, chosen_matches, solve_result)
+            elif chosen_matches is None:
+                status = solve_result.status
+        messages.put(("done", {"status": status, "objective": objective, "gap": gap,
+                               "chosen_matches": chosen_matches, "cached": False}))
+    except Exception:
+        messages.put(("failed", traceback.format_exc()))
+
+
+@dataclass
+class SolveJob:
+    """
+    State of a submitted solve as seen by the service. incumbent holds the latest schedule as (home, away, week)
+    matches and incumbent_version counts its updates
+    """
+    job_id: str
+    settings: dict
+    state: str = "queued"
+    phase: str = None
+    submitted: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    objective: float = None
+    bound: float = None
+    gap: float = None
+    incumbent: list = None
+    incumbent_version: int = 0
+    result: dict = None
+    error: str = None
+    stop_requested: float = None
+    process: object = field(default=None, repr=False)
+    messages: object = field(default=None, repr=False)
+    stop_event: object = field(default=None, repr=False)
+    target_gap: object = field(default=None, repr=False)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def is_active(self):
+        return self.state in ("queued", "running")
+
+
+class SolveService():
+    """
+    Runs solves as background jobs so that callers, e.g. the sessions of the Streamlit app, never block on a solver.
+
+    Every job runs in its own process, at most max_running at a time, the rest wait in submission order. Callers
+    poll a job for its phase, incumbent objective, bound, gap, elapsed time and latest incumbent schedule. stop()
+    and stop_at_gap() end the search early and keep the best schedule found, cancel() kills the job. Jobs that are
+    no longer active are dropped by forget() or FINISHED_JOB_TTL seconds after they ended
+    """
+
+    def __init__(self, max_running=None):
+        self.context = multiprocessing.get_context("spawn")
+        self.max_running = max_running if max_running is not None else (os.cpu_count() or 1)
+        self.jobs = {}
+        # sessions of the app poll from different threads, stop() cancels queued jobs while holding the lock
+        self.lock = threading.RLock()
+
+    def submit(self, solver_config=None, target_gap=None, warm_start_time=5.0, preprocess_kwargs=None, cache=None,
+               **model_kwargs):
+        """
+        Queue a solve and return its job id. warm_start_time seconds of annealing precede the MIP solve (0 to skip),
+        cache is an optional ScheduleCache consulted before and filled after the solve
+        """
+        solver_config = solver_config if solver_config is not None else \
+            SolverConfig(name="highs", time_limit=600, tee=False, logfile=None)
+        settings = {"solver_config": solver_config, "warm_start_time": warm_start_time,
+                    "preprocess_kwargs": preprocess_kwargs or {}, "model_kwargs": model_kwargs, "cache": cache}
+        job = SolveJob(job_id=uuid.uuid4().hex, settings=settings)
+        job.messages = self.context.Queue()
+        job.stop_event = self.context.Event()
+        job.target_gap = self.context.Value("d", target_gap or 0.0)
+        with self.lock:
+            self.jobs[job.job_id] = job
+            self._start_queued()
+        return job.job_id
+
+    def _start_queued(self):
+        running = sum(1 for job in self.jobs.values() if job.state == "running")
+        for job in sorted(self.jobs.values(), key=lambda job: job.submitted):
+            if running >= self.max_running:
+                break
+            if job.state != "queued":
+                continue
+            job.process = self.context.Process(target=run_solve_job, daemon=True,
+                                               args=(job.settings, job.messages, job.stop_event, job.target_gap))
+            job.process.start()
+            job.state, job.started = "running", time.time()
+            running += 1
+
+    def _drain(self, job):
+        while True:
+            try:
+                kind, payload = job.messages.get_nowait()
+            except queue.Empty:
+                return
+            if kind == "phase":
+                job.phase = payload
+            elif kind == "progress":
+                job.objective, job.bound, job.gap = payload["objective"], payload["bound"], payload["gap"]
+            elif kind == "incumbent":
+                job.objective = payload["objective"]
+                job.incumbent = payload["chosen_matches"]
+                job.incumbent_version += 1
+            elif kind == "done":
+                job.result = payload
+                job.objective, job.gap = payload["objective"], payload["gap"]
+                if payload["chosen_matches"] is not None:
+                    job.incumbent = payload["chosen_matches"]
+                    job.incumbent_version += 1
+                job.state, job.finished = "finished", time.time()
+            elif kind == "failed":
+                job.error = payload
+                job.state, job.finished = "failed", time.time()
+
+    def update(self):
+        """
+        Collect messages of running jobs, detect ended processes, drop jobs that ended more than FINISHED_JOB_TTL
+        seconds ago and start queued jobs
+        """
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items()
+                       if not job.is_active and time.time() - job.finished > FINISHED_JOB_TTL]
+            for job_id in expired:
+                del self.jobs[job_id]
+            for job in self.jobs.values():
+                if job.state != "running":
+                    continue
+                self._drain(job)
+                if job.state == "running" and not job.process.is_alive():
+                    # the last messages can arrive after the process ended
+                    self._drain(job)
+                    if job.state == "running":
+                        job.error = f"Job process exited with code {job.process.exitcode}"
+                        job.state, job.finished = "failed", time.time()
+                if job.state == "running" and job.stop_requested is not None and job.incumbent is not None \
+                        and time.time() - job.stop_requested > STOP_GRACE_PERIOD:
+                    job.process.terminate()
+                    job.result = {"status": "stopped", "objective": job.objective, "gap": job.gap,
+                                  "chosen_matches": job.incumbent, "cached": False}
+                    job.state, job.finished = "finished", time.time()
+            self._start_queued()
+
+    def poll(self, job_id):
+        """
+        Current state of a job, None if the service no longer knows it
+        """
+        self.update()
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def stop(self, job_id):
+        """
+        End the search of a job, it finishes with the best schedule found so far
+        """
+        with self.lock:
+            job = self.jobs[job_id]
+            job.stop_event.set()
+            job.stop_requested = time.time()
+            if job.state == "queued":
+                self.cancel(job_id)
+
+    def stop_at_gap(self, job_id, target_gap):
+        """
+        Let a job finish as soon as its gap reaches target_gap
+        """
+        with self.lock:
+            self.jobs[job_id].target_gap.value = target_gap
+
+    def cancel(self, job_id):
+        """
+        Kill a job without waiting for a schedule
+        """
+        with self.lock:
+            job = self.jobs[job_id]
+            if not job.is_active:
+                return
+            if job.process is not None and job.process.is_alive():
+                job.process.terminate()
+            job.state, job.finished = "cancelled", time.time()
+            self._start_queued()
+
+    def forget(self, job_id):
+        """
+        Drop a job from the service, an active job is cancelled first. Unknown jobs are ignored
+        """
+        with self.lock:
+            if job_id in self.jobs:
+                self.cancel(job_id)
+                del self.jobs[job_id]
+
+    def shutdown(self):
+        for job_id in list(self.jobs):
+            self.cancel(job_id)
@@ -0,0 +1,189 @@
+import logging
+import multiprocessing
+import queue
+import time
+import traceback
+from dataclasses import replace
+
+from data_preprocesser import DataPreprocess
+from main import build_model, extract_schedule, load_warm_start
+from model.mip import Model
+from model.solver import SolverConfig, objective_offset, relative_gap
+from solve_service import STOP_GRACE_PERIOD, QueueListener
+
+# members of the default portfolio: a label and the fields of the base SolverConfig they change
+DEFAULT_PORTFOLIO = [
+    {"label": "seed 0", "seed": 0},
+    {"label": "seed 1", "seed": 1},
+    {"label": "seed 2", "seed": 2},
+    {"label": "heuristics", "seed": 0, "options": {"mip_heuristic_effort": 0.3}},
+    {"label": "no symmetry detection", "seed": 0, "options": {"mip_detect_symmetry": False}},
+    {"label": "annealing", "name": "annealing", "seed": 0},
+]
+# seconds between two checks of the portfolio gap
+POLL_INTERVAL = 0.2
+
+
+def run_portfolio_member(label, dp, model_kwargs, solver_config, warm_start, start_event, deadline, messages,
+                         stop_event, target_gap):
+    """
+    Body of a member process: build the model and warm start, report ready and wait for start_event, then solve until
+    deadline (a shared time.time() value set before the start), reporting progress under the member's label
+    """
+    try:
+        model = build_model(dp, **model_kwargs)
+        if warm_start and solver_config.name != "annealing":
+            solver_config = replace(solver_config, warm_start=load_warm_start(dp, model))
+        messages.put(("ready", {"phase": label, "objective_offset": objective_offset(model.m)}))
+        start_event.wait()
+        solver_config = replace(solver_config, time_limit=max(deadline.value - time.time(), 1.0))
+        solve_result = Model.solve_model(model.m, solver_config,
+                                         QueueListener(messages, stop_event, target_gap, label))
+        messages.put(("done", {"phase": label, "status": solve_result.status, "objective": solve_result.objective,
+                               "bound": solve_result.bound, "gap": solve_result.gap,
+                               "wall_time": solve_result.wall_time,
+                               "time_to_first_feasible": solve_result.time_to_first_feasible,
+                               "chosen_matches": extract_schedule(solve_result.model)
+                               if solve_result.has_solution else None}))
+    except Exception:
+        messages.put(("failed", {"phase": label, "error": traceback.format_exc()}))
+
+
+def run_portfolio(members=None, solver_config=None, target_gap=0.01, time_budget=600.0, warm_start=True,
+                  preprocess_kwargs=None, **model_kwargs):
+    """
+    Solve the same model with several differently configured solver runs at once and stop all of them as soon as
+    the portfolio reaches target_gap or time_budget seconds have passed.
+
+    members are dicts of a label and the SolverConfig fields they change in solver_config (DEFAULT_PORTFOLIO by
+    default). Every member runs in its own process on the same preprocessed data and warm start and reports its
+    incumbent objective and bound. The portfolio gap is taken between the best incumbent and the best bound over all
+    members, so a member proving a bound can end the search for the member holding the incumbent. Like the gap of a
+    single solve it leaves out the travel term every schedule shares (see relative_gap). HiGHS does not
+    accept a new incumbent during a run, so incumbents are shared for the termination test and the final pick only.
+
+    Every process builds its own model, a built model costs more to send to a process than to build there. The time
+    budget starts once all members have built their model and warm start, members solve from the same start.
+    Members stop on their own once the time budget is used up, a stopped member that does not react within
+    STOP_GRACE_PERIOD seconds (HiGHS only checks in between nodes) is terminated. Returns a dict with the schedule,
+    objective, bound and gap of the portfolio, the label of the winning member (the best schedule, the earliest on
+    ties), the member that first reached the target gap, the stop reason, the time spent building and the outcome of
+    every member
+    """
+    logger = logging.getLogger()
+    solver_config = solver_config if solver_config is not None else \
+        SolverConfig(name="highs", threads=1, tee=False, logfile=None)
+    members = members if members is not None else DEFAULT_PORTFOLIO
+    start = time.perf_counter()
+    dp = DataPreprocess(**(preprocess_kwargs or {}))
+
+    context = multiprocessing.get_context("spawn")
+    messages, stop_event = context.Queue(), context.Event()
+    # members stop at the portfolio target themselves, the portfolio checks the shared gap on top
+    member_target_gap = context.Value("d", target_gap)
+    # the budget starts once every member is ready, the deadline is set then
+    start_event, deadline = context.Event(), context.Value("d", 0.0)
+    runs, processes = {}, {}
+    for member in members:
+        settings = {key: value for key, value in member.items() if key != "label"}
+        config = replace(solver_config, time_limit=time_budget, **settings)
+        runs[member["label"]] = {"label": member["label"], "config": config, "status": "building",
+                                 "objective": None, "bound": None, "gap": None, "time_to_best": None,
+                                 "wall_time": None, "chosen_matches": None, "schedule_objective": None,
+                                 "error": None}
+        processes[member["label"]] = context.Process(
+            target=run_portfolio_member, daemon=True,
+            args=(member["label"], dp, model_kwargs, config, warm_start, start_event, deadline, messages,
+                  stop_event, member_target_gap))
+    for process in processes.values():
+        process.start()
+
+    stop_reason, stop_time, first_to_target = None, None, None
+    solve_start, offset = None, 0.0
+    while any(run["status"] in ("building", "running") for run in runs.values()):
+        try:
+            kind, payload = messages.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            kind, payload = None, None
+        # time since the members started solving
+        elapsed = time.perf_counter() - solve_start if solve_start is not None else 0.0
+        if payload is not None:
+            run = runs[payload["phase"]]
+            if kind == "failed":
+                run["status"], run["error"] = "failed", payload["error"]
+            elif kind == "ready":
+                # every member builds the same model and shares its offset
+                run["status"], offset = "running", payload["objective_offset"]
+            else:
+                objective = payload.get("objective")
+                if objective is not None and (run["objective"] is None or objective < run["objective"] - 1e-6):
+                    run["objective"], run["time_to_best"] = objective, elapsed
+                if payload.get("bound") is not None:
+                    run["bound"] = max(run["bound"], payload["bound"]) if run["bound"] is not None \
+                        else payload["bound"]
+                # the schedule is kept together with its own objective, progress may report a newer incumbent
+                if payload.get("chosen_matches") is not None:
+                    run["chosen_matches"], run["schedule_objective"] = payload["chosen_matches"], objective
+                if kind == "done":
+                    run["status"], run["gap"], run["wall_time"] = payload["status"], payload["gap"], \
+                        payload["wall_time"]
+        if solve_start is None and not any(run["status"] == "building" for run in runs.values()):
+            solve_start, elapsed = time.perf_counter(), 0.0
+            deadline.value = time.time() + time_budget
+            start_event.set()
+            logger.info(f"Portfolio members ready after {solve_start - start:.1f}s")
+
+        if solve_start is not None:
+            objective, bound = portfolio_bounds(runs)
+            gap = relative_gap(objective, bound, offset)
+            if stop_reason is None and gap is not None and gap <= target_gap:
+                stop_reason = "target gap"
+                first_to_target = min((run for run in runs.values()
+                                       if run["objective"] is not None and run["objective"] <= objective + 1e-6),
+                                      key=lambda run: run["time_to_best"])["label"]
+            elif stop_reason is None and elapsed >= time_budget:
+                stop_reason = "time budget"
+            if stop_reason is not None and stop_time is None:
+                stop_time = elapsed
+                stop_event.set()
+                logger.info(f"Portfolio stopped by {stop_reason} after {elapsed:.1f}s, objective {objective}, "
+                            f"gap {gap}")
+            if stop_time is not None and elapsed - stop_time > STOP_GRACE_PERIOD:
+                for label, process in processes.items():
+                    if runs[label]["status"] == "running":
+                        process.terminate()
+                        runs[label]["status"] = "terminated"
+        for label, process in processes.items():
+            # a member that died without a message, e.g. killed by the OS
+            if runs[label]["status"] in ("building", "running") and not process.is_alive() and messages.empty():
+                runs[label]["status"] = "failed"
+                runs[label]["error"] = f"Member process exited with code {process.exitcode}"
+
+    objective, bound = portfolio_bounds(runs)
+    with_schedule = [run for run in runs.values() if run["chosen_matches"] is not None]
+    winner = min(with_schedule, key=lambda run: (run["schedule_objective"], run["time_to_best"])) \
+        if with_schedule else None
+    for run in runs.values():
+        logger.info(f"Portfolio member {run['label']}: {run['status']}, objective {run['objective']}, "
+                    f"bound {run['bound']}, best after {run['time_to_best']}s")
+    return {
+        "winner": winner["label"] if winner is not None else None,
+        "first_to_target": first_to_target,
+        "stop_reason": stop_reason or "all members finished",
+        "objective": winner["schedule_objective"] if winner is not None else None,
+        "bound": bound,
+        "gap": relative_gap(winner["schedule_objective"], bound, offset) if winner is not None else None,
+        "build_time": (solve_start if solve_start is not None else time.perf_counter()) - start,
+        "wall_time": time.perf_counter() - start,
+        "chosen_matches": winner["chosen_matches"] if winner is not None else None,
+        "runs": [{key: value for key, value in run.items() if key != "chosen_matches"} for run in runs.values()],
+    }
+
+
+def portfolio_bounds(runs):
+    """
+    Best incumbent objective and best bound over all members, the objective is minimized
+    """
+    objectives = [run["objective"] for run in runs.values() if run["objective"] is not None]
+    bounds = [run["bound"] for run in runs.values() if run["bound"] is not None]
+    return min(objectives) if objectives else None, max(bounds) if bounds else None
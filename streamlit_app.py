@@ -1,11 +1,63 @@
 import streamlit as st
 import pandas as pd
-from main import run_pipeline
+from data_preprocesser import DataPreprocess
+from data_postprocess import DataPostprocess
+from model.solver import SolverConfig
+from schedule_cache import ScheduleCache
+from solve_service import SolveService
 import io
+import time
 from PIL import Image
-import base64
 
-schedule_df = pd.read_excel("output/bundesliga_schedule.xlsx")
+# seconds between two refreshes of the page while a solve is running
+POLL_INTERVAL = 1.0
+
+
+@st.cache_resource
+def get_solve_service():
+    # one service for the whole app, so that concurrent sessions share the worker processes
+    return SolveService()
+
+
+@st.cache_resource
+def load_league():
+    dp = DataPreprocess()
+    return dp, DataPostprocess.teams_map(dp.all_teams_coords_df)
+
+
+def submit_solve(service, solver_name, time_limit, target_gap, warm_start_time):
+    # a new solve replaces the one the session showed
+    if "job_id" in st.session_state:
+        service.forget(st.session_state.job_id)
+    st.session_state.pop("finished_job", None)
+    solver_config = SolverConfig(name=solver_name, time_limit=time_limit, tee=False, logfile=None)
+    st.session_state.job_id = service.submit(solver_config, target_gap=target_gap, warm_start_time=warm_start_time,
+                                             cache=ScheduleCache())
+
+
+def session_job(service):
+    """
+    Job of this session: the running one from the service or the finished one the session kept, None before the
+    first solve
+    """
+    if "job_id" in st.session_state:
+        job = service.poll(st.session_state.job_id)
+        if job is not None and job.is_active:
+            return job
+        # the session keeps the outcome, the service can drop the job
+        del st.session_state.job_id
+        if job is not None:
+            service.forget(job.job_id)
+            st.session_state.finished_job = job
+    return st.session_state.get("finished_job")
+
+
+def format_value(value, pattern="{:,.0f}"):
+    return pattern.format(value) if value is not None else "-"
+
+
+service = get_solve_service()
+dp, teams_map = load_league()
 
 # Streamlit app
 logo_col, title_col = st.columns([0.2, 0.8])
@@ -15,38 +67,82 @@ logo_col.image(logo)
 
 title_col.title("Bundesliga Schedule App")
 
+# Solver settings
+st.sidebar.header("Solver")
+solver_name = st.sidebar.selectbox("Solver", ["highs", "annealing", "gurobi"])
+time_limit = st.sidebar.number_input("Time limit (s)", min_value=5, value=600, step=30)
+target_gap = st.sidebar.number_input("Stop at gap", min_value=0.0, max_value=1.0, value=0.0, step=0.001,
+                                     format="%.3f")
+warm_start_time = st.sidebar.number_input("Annealing warm start (s)", min_value=0, value=5)
+if st.sidebar.button("Solve"):
+    submit_solve(service, solver_name, time_limit, target_gap, warm_start_time)
 
-@st.cache_resource
-def run_optimizer():
-    return run_pipeline()
-
-
-schedule = run_optimizer()
+job = session_job(service)
 
 # Display teams map
 st.header("Bundesliga teams map")
-st.plotly_chart(schedule.fig)
+st.plotly_chart(teams_map)
+
+if job is None:
+    st.info("Choose the solver settings and press Solve to compute a schedule")
+    st.stop()
 
-# Display the schedule_results table
-st.header("Optimized Schedule:")
-st.dataframe(schedule_df, use_container_width=True)
+# Solve progress
+st.header("Solver progress")
+state_col, phase_col, elapsed_col = st.columns(3)
+state_col.metric("State", job.state)
+phase_col.metric("Phase", job.phase or "-")
+elapsed_col.metric("Elapsed", f"{job.elapsed:.0f} s")
+objective_col, bound_col, gap_col = st.columns(3)
+objective_col.metric("Incumbent objective", format_value(job.objective))
+bound_col.metric("Bound", format_value(job.bound))
+gap_col.metric("Gap", format_value(job.gap, "{:.2%}"))
+if job.is_active:
+    stop_col, cancel_col, gap_input_col, apply_gap_col = st.columns(4)
+    if stop_col.button("Stop, keep incumbent"):
+        service.stop(job.job_id)
+    if cancel_col.button("Cancel"):
+        service.cancel(job.job_id)
+    new_target_gap = gap_input_col.number_input("Target gap", min_value=0.0, max_value=1.0, value=0.01,
+                                                step=0.001, format="%.3f", label_visibility="collapsed")
+    if apply_gap_col.button("Stop at gap"):
+        service.stop_at_gap(job.job_id, new_target_gap)
+if job.error:
+    st.error(job.error)
 
-# Dropdown to select a team
-selected_team = str(st.selectbox("Select a Team", schedule.filtered_schedule_per_team_dict.keys()))
+if job.incumbent is not None:
+    league_schedule_table = DataPostprocess.build_schedule_table(job.incumbent, dp.teams_name_index_map)
+    team_schedules = DataPostprocess.build_team_schedules(job.incumbent, dp.teams_name_index_map)
 
-# Filter the schedule for the selected team
-st.table(schedule.filtered_schedule_per_team_dict[selected_team])
+    # Display the schedule_results table
+    st.header("Optimized Schedule:" if job.state == "finished" else "Best schedule so far:")
+    if job.is_active:
+        st.caption("Schedules shown during a solve come from the annealing search only, HiGHS hands out its "
+                   "schedule when it finishes or is stopped")
+    if job.result is not None and job.result.get("cached"):
+        st.caption("Loaded from the schedule cache")
+    st.dataframe(league_schedule_table, use_container_width=True)
 
-# Button to export schedule to XLSX
+    # Dropdown to select a team
+    selected_team = str(st.selectbox("Select a Team", team_schedules.keys()))
 
-# download button 2 to download dataframe as xlsx
-buffer = io.BytesIO()
-with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
-    schedule.league_schedule_table.to_excel(writer, sheet_name='Schedule', index=False)
+    # Filter the schedule for the selected team
+    st.table(team_schedules[selected_team])
 
-    download2 = st.download_button(
+    # download button to download the shown schedule as xlsx
+    buffer = io.BytesIO()
+    with pd.ExcelWriter(buffer, engine='xlsxwriter') as writer:
+        league_schedule_table.to_excel(writer, sheet_name='Schedule')
+
+    st.download_button(
         label="Download schedule as Excel",
         data=buffer,
         file_name='bundesliga_schedule.xlsx',
         mime='application/vnd.ms-excel'
     )
+else:
+    st.info("Waiting for the first schedule")
+
+if job.is_active:
+    time.sleep(POLL_INTERVAL)
+    st.rerun()
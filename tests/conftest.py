@@ -0,0 +1,19 @@
+import os
+
+import pytest
+
+from data_preprocesser import DataPreprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(autouse=True)
+def repo_root(monkeypatch):
+    # input files are addressed relative to the repository root
+    monkeypatch.chdir(ROOT)
+
+
+@pytest.fixture(scope="session")
+def dp():
+    os.chdir(ROOT)
+    return DataPreprocess()
@@ -0,0 +1,49 @@
+import pytest
+
+from main import build_model
+from model.annealing import AnnealingScheduler
+
+
+@pytest.fixture
+def model(dp):
+    return build_model(dp, builder_mode="matrix")
+
+
+def test_move_deltas_match_full_evaluation(model):
+    scheduler = AnnealingScheduler(model.m, seed=3)
+    all_cells = [(team, week) for team in range(scheduler.n_teams) for week in range(scheduler.n_weeks)]
+    for _ in range(300):
+        cost_delta, violations_delta, _ = scheduler.try_move(scheduler.random_changes())
+        scheduler.total_cost += cost_delta
+        scheduler.total_violations += violations_delta
+    cost, violations = scheduler.evaluate(all_cells)
+    assert scheduler.total_cost == pytest.approx(cost)
+    assert scheduler.total_violations == violations + scheduler.fixed_matches
+
+
+def test_infeasible_search_leaves_model_untouched(model):
+    # two home matches of the same team in one week can never both be played
+    var = model.m.is_match_this_week_var
+    week = list(model.m.weeks_first_half_set)[0]
+    var[1, 2, week].fix(1)
+    var[1, 3, week].fix(1)
+    values = {slot: var[slot].value for slot in model.m.match_index_set}
+    status, objective, _, _ = AnnealingScheduler(model.m, seed=0).solve(time_limit=0.5)
+    assert status == "infeasible"
+    assert objective is None
+    assert {slot: var[slot].value for slot in model.m.match_index_set} == values
+
+
+def test_move_deltas_include_away_trip_travel(dp):
+    model = build_model(dp, builder_mode="matrix", away_trip_weight=0.01)
+    scheduler = AnnealingScheduler(model.m, seed=5)
+    assert scheduler.away_trip_weight == pytest.approx(0.01)
+    all_cells = [(team, week) for team in range(scheduler.n_teams) for week in range(scheduler.n_weeks)]
+    for _ in range(300):
+        cost_delta, _, _ = scheduler.try_move(scheduler.random_changes())
+        scheduler.total_cost += cost_delta
+    assert scheduler.total_cost == pytest.approx(scheduler.evaluate(all_cells)[0])
+    status, objective, _, incumbent_trace = scheduler.solve(time_limit=1.0)
+    # the objective of the loaded schedule agrees with the cost the search kept track of
+    assert status == "feasible"
+    assert objective == pytest.approx(incumbent_trace[-1][1])
@@ -0,0 +1,18 @@
+from benchmark import compare_with_baseline
+
+
+def results(status, solve, time_to_gap):
+    return {"records": [{"n_teams": 16, "status": status, "build": 1.0, "solve": solve,
+                         "time_to_gap": time_to_gap}]}
+
+
+def test_slower_solve_is_a_regression():
+    assert compare_with_baseline(results("interrupted", 9.0, 9.0), results("interrupted", 6.0, 6.0)) == \
+        [(16, "solve", 6.0, 9.0), (16, "time_to_gap", 6.0, 9.0)]
+
+
+def test_time_limited_solve_is_not_compared():
+    assert compare_with_baseline(results("maxTimeLimit", 120.0, None), results("maxTimeLimit", 60.0, None)) == []
+    # reaching the target gap is still checked
+    assert compare_with_baseline(results("maxTimeLimit", 120.0, None), results("interrupted", 6.0, 6.0)) == \
+        [(16, "time_to_gap", 6.0, None)]
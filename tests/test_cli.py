@@ -0,0 +1,39 @@
+import json
+import logging
+import os
+import subprocess
+import sys
+
+from cli import IMPORT_TIME_BUDGET, measure_startup
+from tests.conftest import ROOT
+
+
+def test_import_stays_within_budget_without_heavy_modules():
+    import_time, heavy_modules = measure_startup()
+    assert heavy_modules == []
+    assert import_time <= IMPORT_TIME_BUDGET, f"import cli took {import_time * 1000:.1f} ms"
+
+
+def test_startup_measurement_sees_heavy_modules():
+    # the measurement itself must notice a heavy import, e.g. by the validator
+    _, heavy_modules = measure_startup("schedule_validator", repeats=1)
+    assert "numpy" in heavy_modules
+
+
+def test_solve_prints_only_json_on_stdout(tmp_path):
+    # input files are read relative to the working directory, outputs stay in tmp_path
+    os.symlink(os.path.join(ROOT, "data"), tmp_path / "data")
+    os.makedirs(tmp_path / "output")
+    process = subprocess.run([sys.executable, os.path.join(ROOT, "cli.py"), "solve", "--solver", "annealing",
+                              "--time-limit", "2", "--no-metrics"], cwd=tmp_path, capture_output=True, text=True,
+                             env={**os.environ, "PYTHONPATH": ROOT}, check=True)
+    assert json.loads(process.stdout)["status"] is not None
+    assert "Start of solving model" in process.stderr
+
+
+def test_pipeline_log_handler_is_added_once():
+    from main import LOG_HANDLER, configure_logging
+
+    configure_logging()
+    configure_logging()
+    assert logging.getLogger().handlers.count(LOG_HANDLER) == 1
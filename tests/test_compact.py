@@ -0,0 +1,26 @@
+import pytest
+
+from benchmark import SyntheticLeague
+from data_preprocesser import DataPreprocess
+from main import build_model
+from model.mip import Model
+from model.solver import SolverConfig
+
+
+@pytest.mark.parametrize("away_trip_weight", [0.0, 0.001])
+def test_compact_mode_reaches_the_rule_optimum(tmp_path, away_trip_weight):
+    dp = DataPreprocess(**SyntheticLeague(4, str(tmp_path)).preprocess_kwargs())
+    objectives = {}
+    for builder_mode in ("rule", "compact"):
+        model = build_model(dp, builder_mode=builder_mode, away_trip_weight=away_trip_weight)
+        solve_result = Model.solve_model(model.m, SolverConfig(name="highs", time_limit=60, mip_gap=0.0,
+                                                               logfile=None))
+        assert solve_result.status == "optimal"
+        objectives[builder_mode] = solve_result.objective
+    assert objectives["compact"] == pytest.approx(objectives["rule"])
+
+
+def test_symmetry_breaking_only_without_away_trip_term(dp):
+    assert build_model(dp, builder_mode="compact").m.symmetry_breaking_constr.active
+    # the home/away swap of a schedule changes its back-to-back away travel
+    assert not hasattr(build_model(dp, builder_mode="compact", away_trip_weight=0.001).m, "symmetry_breaking_constr")
@@ -0,0 +1,19 @@
+from benchmark import SyntheticLeague
+from data_preprocesser import DataPreprocess
+from main import run_league_batch
+from schedule_validator import ScheduleValidator
+
+
+def test_batch_schedules_even_and_odd_leagues(tmp_path):
+    leagues = {f"L{n_teams}": SyntheticLeague(n_teams, str(tmp_path / str(n_teams))).preprocess_kwargs()
+               for n_teams in (4, 5, 6)}
+    results = run_league_batch(leagues, core_budget=1)
+    for league, preprocess_kwargs in leagues.items():
+        result = results[league]
+        assert result["status"] != "error", result.get("error")
+        dp = DataPreprocess(**preprocess_kwargs)
+        # an odd league needs a bye every week, 2 * teams weeks
+        assert result["weeks"] == 2 * (result["teams"] - 1 if result["teams"] % 2 == 0 else result["teams"])
+        schedule = [(dp.teams_name_index_map[home], dp.teams_name_index_map[away], week)
+                    for home, away, week in result["schedule"]]
+        assert ScheduleValidator.from_preprocess(dp).validate(schedule)["feasible"]
@@ -0,0 +1,52 @@
+import pyomo.environ as pe
+import pytest
+from pyomo.repn import generate_standard_repn
+
+from main import build_model
+
+
+def constraint_rows(m):
+    """
+    Every active constraint row as name -> index -> (lower, upper, {variable index: coefficient})
+    """
+    families = {}
+    for constraint in m.component_objects(pe.Constraint, active=True):
+        rows = {}
+        for index, constraint_data in constraint.items():
+            repn = generate_standard_repn(constraint_data.body)
+            coefs = {}
+            for var, coef in zip(repn.linear_vars, repn.linear_coefs):
+                coefs[var.index()] = coefs.get(var.index(), 0) + coef
+            rows[index] = (pe.value(constraint_data.lower), pe.value(constraint_data.upper),
+                           {key: coef for key, coef in coefs.items() if coef != 0})
+        families[constraint.name] = rows
+    return families
+
+
+def objective_coefs(m):
+    repn = generate_standard_repn(m.OBJ.expr)
+    return {var.index(): coef for var, coef in zip(repn.linear_vars, repn.linear_coefs)}
+
+
+@pytest.mark.parametrize("model_kwargs", [
+    {"scheme": "standard"},
+    {"scheme": "mirrored"},
+    {"scheme": "standard", "forbidden_slots": [(1, None, 3), (2, 5, 20)]},
+])
+def test_matrix_mode_builds_the_rule_model(dp, model_kwargs):
+    rule_model = build_model(dp, builder_mode="rule", **model_kwargs).m
+    matrix_model = build_model(dp, builder_mode="matrix", **model_kwargs).m
+
+    rule_rows, matrix_rows = constraint_rows(rule_model), constraint_rows(matrix_model)
+    assert rule_rows.keys() == matrix_rows.keys()
+    for name in rule_rows:
+        assert rule_rows[name].keys() == matrix_rows[name].keys(), name
+        for index, (lower, upper, coefs) in rule_rows[name].items():
+            matrix_lower, matrix_upper, matrix_coefs = matrix_rows[name][index]
+            assert (lower, upper) == (matrix_lower, matrix_upper), (name, index)
+            assert coefs.keys() == matrix_coefs.keys(), (name, index)
+            assert all(coefs[key] == pytest.approx(matrix_coefs[key]) for key in coefs), (name, index)
+
+    rule_objective, matrix_objective = objective_coefs(rule_model), objective_coefs(matrix_model)
+    assert rule_objective.keys() == matrix_objective.keys()
+    assert all(rule_objective[key] == pytest.approx(matrix_objective[key], rel=1e-12) for key in rule_objective)
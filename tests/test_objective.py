@@ -0,0 +1,30 @@
+import pyomo.environ as pe
+import pytest
+
+from main import build_model
+from model.mip import Model
+from model.solver import SolverConfig
+from model.warm_start import WarmStartBuilder
+from schedule_validator import ScheduleValidator
+
+
+@pytest.mark.parametrize("builder_mode", ["rule", "matrix"])
+def test_away_trip_travel_matches_validator(dp, builder_mode):
+    model = build_model(dp, builder_mode=builder_mode, away_trip_weight=1.0)
+    schedule = WarmStartBuilder(dp.teams_range, dp.weeks_range, dp.conflict_home_match_list).schedule
+    WarmStartBuilder.load_into_model(model.m, schedule)
+    model.m.is_match_this_week_var.fix()
+    # with the schedule fixed the solver only sets the away trip variables to their smallest value
+    solve_result = Model.solve_model(model.m, SolverConfig(name="highs", logfile=None))
+    assert solve_result.status == "optimal"
+    validator = ScheduleValidator.from_preprocess(dp)
+    assert pe.value(model.m.away_trip_travel_expr) == \
+        pytest.approx(validator.away_trip_travel(validator.to_array(schedule)))
+
+
+def test_away_trip_travel_depends_on_schedule(dp):
+    validator = ScheduleValidator.from_preprocess(dp)
+    values = [validator.away_trip_travel(validator.to_array(
+        WarmStartBuilder(dp.teams_range, dp.weeks_range, dp.conflict_home_match_list, seed=seed).schedule))
+        for seed in range(3)]
+    assert len(set(values)) > 1
@@ -0,0 +1,46 @@
+import pytest
+
+from main import build_model, extract_schedule
+from model.replan import Replanner
+from model.solver import SolverConfig
+from model.warm_start import WarmStartBuilder
+from schedule_validator import ScheduleValidator
+
+
+@pytest.fixture(scope="module")
+def schedule(dp):
+    warm_start = WarmStartBuilder(dp.teams_range, dp.weeks_range, dp.conflict_home_match_list)
+    assert warm_start.violations == 0
+    return warm_start.schedule
+
+
+def test_replan_keeps_frozen_weeks_and_pins(dp, schedule):
+    model = build_model(dp, builder_mode="compact")
+    weeks = list(dp.weeks_range)
+    frozen_weeks = weeks[:-4]
+    replanner = Replanner(model, SolverConfig(name="highs", time_limit=60, mip_gap=0.0, logfile=None),
+                          repair_time_limit=2.0)
+    # a match of the last weeks moved to another open week such that the re-plan has a feasible warm start
+    validator = ScheduleValidator.from_preprocess(dp)
+    pinned_match = next((home, away, other_week) for home, away, week in schedule if week in weeks[-4:]
+                        for other_week in weeks[-4:] if other_week != week and validator.validate(
+                            replanner.align_with_pins(schedule, frozen_weeks, [(home, away, other_week)]))["feasible"])
+    solve_result = replanner.replan(schedule, frozen_weeks=frozen_weeks, pinned_matches=[pinned_match])
+    assert solve_result.has_solution
+    replanned = set(extract_schedule(model.m))
+    assert pinned_match in replanned
+    assert {match for match in schedule if match[2] in frozen_weeks} <= replanned
+    # switched off for the re-solve only
+    assert model.m.symmetry_breaking_constr.active
+
+
+def test_contradicting_pins_raise(dp, schedule):
+    model = build_model(dp, builder_mode="matrix")
+    home, away, week = schedule[0]
+    other_away = next(team for team in dp.teams_range if team not in (home, away))
+    replanner = Replanner(model, SolverConfig(name="highs", time_limit=10, logfile=None), repair_time_limit=0)
+    with pytest.raises(ValueError, match="admit no schedule"):
+        replanner.replan(schedule, pinned_matches=[(home, away, week), (home, other_away, week)])
+    with pytest.raises(ValueError, match="admit no schedule"):
+        # the pinned match is already played in a frozen week
+        replanner.replan(schedule, frozen_weeks=[week], pinned_matches=[(home, away, week + 1)])
@@ -0,0 +1,51 @@
+import pytest
+
+from benchmark import SyntheticLeague
+from data_preprocesser import DataPreprocess
+from main import build_model, extract_schedule
+from model.rolling_horizon import RollingHorizonSolver
+from model.solver import SolverConfig
+from schedule_validator import ScheduleValidator
+
+
+def league(tmp_path, n_teams):
+    return DataPreprocess(**SyntheticLeague(n_teams, str(tmp_path / str(n_teams))).preprocess_kwargs())
+
+
+def rolling_horizon(model, **kwargs):
+    return RollingHorizonSolver(model, SolverConfig(name="highs", threads=1, seed=0, tee=False, logfile=None),
+                                window_size=4, overlap=2, window_time_limit=10.0, polish_time_limit=0,
+                                initial_time_limit=10.0, **kwargs)
+
+
+def test_windows_only_free_their_own_weeks(tmp_path):
+    dp = league(tmp_path, 6)
+    model = build_model(dp, builder_mode="matrix")
+    solver = rolling_horizon(model)
+    windows = solver.windows()
+    assert windows[0][0] == 1 and windows[-1][-1] == len(dp.weeks_range)
+    window_solve, free_weeks = solver.backend.solve, []
+
+    def recording_solve(m):
+        var = m.is_match_this_week_var
+        free_weeks.append({slot[2] for slot in m.match_index_set if not var[slot].fixed})
+        fixed = {slot: var[slot].value for slot in m.match_index_set if var[slot].fixed}
+        result = window_solve(m)
+        assert all(var[slot].value == value for slot, value in fixed.items())
+        return result
+
+    solver.backend.solve = recording_solve
+    solver.solve()
+    assert free_weeks == [set(weeks) for weeks in windows]
+
+
+@pytest.mark.parametrize("n_teams", [6, 5])
+def test_final_schedule_is_feasible_and_no_worse_than_the_start(tmp_path, n_teams):
+    # an odd league has no constructive warm start, the MIP gives the first schedule
+    dp = league(tmp_path, n_teams)
+    model = build_model(dp, builder_mode="matrix")
+    solve_result = rolling_horizon(model).solve()
+    assert solve_result.has_solution
+    assert ScheduleValidator.from_preprocess(dp).validate(extract_schedule(model.m))["feasible"]
+    start_objective = solve_result.incumbent_trace[0][1]
+    assert solve_result.objective <= start_objective + 1e-6
@@ -0,0 +1,42 @@
+import numpy as np
+
+import schedule_cache
+from model.solver import SolveResult, SolverConfig
+from schedule_cache import ScheduleCache
+
+DATA_FILES = ["data/D1_21-22.csv"]
+
+
+def key(**model_kwargs):
+    return ScheduleCache.cache_key(DATA_FILES, {}, model_kwargs, SolverConfig(name="highs"))
+
+
+def weight_formula(factor):
+    return lambda ranks, weeks: (factor * ranks, weeks)
+
+
+def test_lambdas_are_keyed_by_code_and_closure():
+    assert key(formula=lambda ranks, weeks: (ranks, weeks)) != key(formula=lambda ranks, weeks: (-ranks, weeks))
+    assert key(formula=weight_formula(1.0)) != key(formula=weight_formula(2.0))
+    assert key(formula=weight_formula(1.0)) == key(formula=weight_formula(1.0))
+    assert key(formula=weight_formula(np.zeros(2000))) != key(formula=weight_formula(np.eye(2000)[0]))
+
+
+def test_key_follows_solver_settings_and_sources(monkeypatch):
+    assert key() == ScheduleCache.cache_key(DATA_FILES, {}, {}, SolverConfig(name="highs", tee=True))
+    assert key() != ScheduleCache.cache_key(DATA_FILES, {}, {}, SolverConfig(name="highs", seed=1))
+    original = key()
+    monkeypatch.setattr(schedule_cache, "source_hash", lambda: "changed formulation")
+    assert key() != original
+
+
+def test_hit_and_invalidation(tmp_path):
+    cache = ScheduleCache(str(tmp_path))
+    entry_key = key()
+    assert cache.get(entry_key) is None
+    cache.put(entry_key, [(1, 2, 1), (2, 1, 3)], SolveResult(model=None, status="optimal", objective=5.0, gap=0.0))
+    entry = cache.get(entry_key)
+    assert entry["chosen_matches"] == [(1, 2, 1), (2, 1, 3)]
+    assert entry["objective"] == 5.0
+    assert cache.invalidate(entry_key) == 1
+    assert cache.get(entry_key) is None
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+
+from model.warm_start import WarmStartBuilder
+from schedule_validator import ScheduleValidator
+
+
+@pytest.fixture(scope="module")
+def schedule(dp):
+    warm_start = WarmStartBuilder(dp.teams_range, dp.weeks_range, dp.conflict_home_match_list)
+    assert warm_start.violations == 0
+    return warm_start.schedule
+
+
+def test_rule_masks_mark_broken_rows(dp, schedule):
+    validator = ScheduleValidator.from_preprocess(dp)
+    base = validator.to_array(schedule)
+    n_weeks = base.shape[2]
+    half = n_weeks // 2
+    i, j, k = (int(position) for position in np.argwhere(base)[0])
+    broken = {}
+
+    dropped = base.copy()
+    dropped[i, j, k] = 0
+    broken["each_match_is_played_once"] = (dropped, (i, j))
+
+    # i gets a second match in week k
+    other = next(team for team in range(base.shape[0]) if team not in (i, j) and not base[i, team, k])
+    doubled = base.copy()
+    doubled[i, other, k] = 1
+    broken["max_one_match_per_team_per_week"] = (doubled, (i, k))
+
+    # the leg i hosts moves into the half of the leg j hosts
+    return_week = int(np.flatnonzero(base[j, i])[0])
+    same_half = next(week for week in (range(half) if return_week < half else range(half, n_weeks))
+                     if week != return_week)
+    moved = base.copy()
+    moved[i, j, k], moved[i, j, same_half] = 0, 1
+    broken["no_both_matches_weeks_half"] = (moved, (min(i, j), max(i, j), int(return_week >= half)))
+
+    swapped = base.copy()
+    swapped[i, j, k], swapped[j, i, k] = 0, 1
+    broken["balance_home_away_matches"] = (swapped, (i,))
+
+    # team 0 at home in the first three weeks
+    home_streak = base.copy()
+    home_streak[0, 1:4, :3] = np.eye(3, dtype=home_streak.dtype)
+    broken["three_consecutive_rounds"] = (home_streak, (0, 0, 0))
+
+    team_p, team_q = validator.conflict_pairs[0].tolist()
+    guests = [team for team in range(base.shape[0]) if team not in (team_p, team_q)]
+    parallel = base.copy()
+    parallel[team_p, guests[0], 0], parallel[team_q, guests[1], 0] = 1, 1
+    broken["conflict_home_match"] = (parallel, (0, 0))
+
+    assert sum(validator.count_violations(base).values()) == 0
+    # one stacked call checks all broken schedules
+    stack = np.stack([array for array, _ in broken.values()])
+    masks = validator.violation_masks(stack)
+    for position, (rule, (_, row)) in enumerate(broken.items()):
+        assert masks[rule][(position,) + row], rule
+        assert validator.count_violations(stack)[rule][position] > 0
+
+
+def test_match_on_forbidden_slot_is_violation(dp, schedule):
+    home, away, week = schedule[0]
+    other_home, _, other_week = next(match for match in schedule if match[0] != home)
+    validator = ScheduleValidator.from_preprocess(dp, forbidden_slots=[(home, away, week),
+                                                                       (other_home, None, other_week)])
+    report = validator.validate(schedule)
+    assert not report["feasible"]
+    assert sorted((violation["teams"][0], violation["weeks"][0]) for violation in report["violations"]) == \
+        sorted([(home, week), (other_home, other_week)])
+    assert {violation["rule"] for violation in report["violations"]} == {"forbidden_slots"}
+    # slots the schedule does not use are no violation
+    unused_week = next(other for other in dp.weeks_range if other != week)
+    assert ScheduleValidator.from_preprocess(dp, forbidden_slots=[(home, away, unused_week)]).validate(
+        schedule)["feasible"]
+
+
+def test_mirrored_scheme_checks_second_half(dp, schedule):
+    weeks = list(dp.weeks_range)
+    validator = ScheduleValidator.from_preprocess(dp, scheme="mirrored")
+    # the constructive schedule mirrors the first half
+    assert validator.validate(schedule)["feasible"]
+    # the two first rounds of the second half swapped keep every other rule
+    first, second = weeks[len(weeks) // 2], weeks[len(weeks) // 2 + 1]
+    swapped = [(home, away, {first: second, second: first}.get(week, week)) for home, away, week in schedule]
+    violations = validator.validate(swapped)["violations"]
+    assert violations and {violation["rule"] for violation in violations} == {"mirrored_rounds"}
+    assert {week for violation in violations for week in violation["weeks"]} == {weeks[0], weeks[1], first, second}
+    # the standard scheme does not ask for mirrored rounds
+    assert ScheduleValidator.from_preprocess(dp).validate(swapped)["feasible"]
+
+
+def test_unknown_ids_raise(dp, schedule):
+    validator = ScheduleValidator.from_preprocess(dp)
+    home, away, week = schedule[0]
+    with pytest.raises(ValueError, match="Teams"):
+        validator.to_array(schedule[1:] + [(max(dp.teams_range) + 1, away, week)])
+    with pytest.raises(ValueError, match="Weeks"):
+        validator.to_array(schedule[1:] + [(home, away, max(dp.weeks_range) + 1)])
+    with pytest.raises(ValueError, match="Teams"):
+        ScheduleValidator.from_preprocess(dp, forbidden_slots=[(0, None, week)])
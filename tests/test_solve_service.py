@@ -0,0 +1,62 @@
+import multiprocessing
+import queue
+import threading
+
+import pytest
+
+import solve_service
+from benchmark import SyntheticLeague
+from data_preprocesser import DataPreprocess
+from model.mip import Model
+from model.solver import SolverConfig, SolveResult
+from model.warm_start import WarmStartBuilder
+from schedule_cache import ScheduleCache
+from solve_service import SolveService, run_solve_job
+
+
+def test_stop_cancels_queued_job_and_forget_drops_it():
+    # no job is started, every submission stays queued
+    service = SolveService(max_running=0)
+    job_id = service.submit()
+    assert service.poll(job_id).state == "queued"
+    service.stop(job_id)
+    assert service.poll(job_id).state == "cancelled"
+    service.forget(job_id)
+    assert service.poll(job_id) is None
+    service.forget(job_id)
+
+
+def test_ended_jobs_expire(monkeypatch):
+    service = SolveService(max_running=0)
+    ended, queued = service.submit(), service.submit()
+    service.cancel(ended)
+    monkeypatch.setattr(solve_service, "FINISHED_JOB_TTL", 0.0)
+    assert service.poll(ended) is None
+    assert service.poll(queued).state == "queued"
+    service.shutdown()
+
+
+@pytest.mark.parametrize("target_gap, cached", [(0.05, False), (0.0, True)])
+def test_only_complete_solves_are_cached(tmp_path, monkeypatch, target_gap, cached):
+    preprocess_kwargs = SyntheticLeague(6, str(tmp_path / "league")).preprocess_kwargs()
+    dp = DataPreprocess(**preprocess_kwargs)
+    schedule = WarmStartBuilder(dp.teams_range, dp.weeks_range, dp.conflict_home_match_list).schedule
+
+    def solve_model(m, solver_config, listener=None):
+        # a solve at 1 % gap that goes on unless the listener stops it
+        WarmStartBuilder.load_into_model(m, schedule)
+        stopped = listener.on_progress(1.0, 101.0, 100.0, 0.01)
+        return SolveResult(model=m, status="interrupted" if stopped else "optimal", objective=101.0, bound=100.0,
+                           gap=0.01)
+
+    monkeypatch.setattr(Model, "solve_model", staticmethod(solve_model))
+    cache = ScheduleCache(str(tmp_path / "cache"))
+    settings = {"solver_config": SolverConfig(name="highs", logfile=None), "warm_start_time": 0,
+                "preprocess_kwargs": preprocess_kwargs, "model_kwargs": {}, "cache": cache}
+    messages = queue.Queue()
+    run_solve_job(settings, messages, threading.Event(), multiprocessing.Value("d", target_gap))
+    kind, payload = messages.get_nowait()
+    while kind != "done":
+        kind, payload = messages.get_nowait()
+    assert payload["chosen_matches"] is not None
+    assert len(list(cache.entries())) == (1 if cached else 0)
@@ -0,0 +1,33 @@
+import pyomo.environ as pe
+import pytest
+
+from main import build_model
+from model.solver import SolveResult, relative_gap
+
+
+def test_relative_gap_without_offset():
+    assert relative_gap(1000.0, 990.0, offset=900.0) == pytest.approx(0.1)
+    assert relative_gap(None, 990.0) is None
+    assert relative_gap(1000.0, None) is None
+
+
+def test_time_to_gap_skips_incumbents_without_bound():
+    solve_result = SolveResult(model=None, status="maxTimeLimit", incumbent_trace=[(1.0, 5.0, None, None)])
+    assert solve_result.time_to_gap(0.01) is None
+
+
+def test_time_to_gap_uses_bound_known_at_incumbent():
+    # the first incumbent is within the gap of the final bound only, not of the bound known when it was found
+    solve_result = SolveResult(model=None, status="optimal", objective=1010.0, bound=1000.0, gap=0.01,
+                               wall_time=9.0, objective_offset=900.0,
+                               incumbent_trace=[(1.0, 1010.0, 800.0, None), (4.0, 1001.0, 1000.0, None)])
+    assert solve_result.time_to_gap(0.1) == 4.0
+    assert solve_result.time_to_gap(0.001) is None
+
+
+@pytest.mark.parametrize("builder_mode", ["rule", "matrix"])
+def test_objective_offset_is_travel_of_every_schedule(dp, builder_mode):
+    model = build_model(dp, builder_mode=builder_mode)
+    distances = dp.team_distance_matrix
+    travel = sum(distances[i][j] ** 2 for i in range(len(distances)) for j in range(len(distances)) if i != j)
+    assert pe.value(model.m.objective_offset_param) == pytest.approx(travel)
@@ -0,0 +1,23 @@
+import pytest
+
+from benchmark import SyntheticLeague
+from data_preprocesser import DataPreprocess
+from main import build_model
+from model.solver import objective_offset, relative_gap
+from schedule_validator import ScheduleValidator
+from solver_portfolio import run_portfolio
+
+
+def test_portfolio_reaches_target_gap_without_travel_term(tmp_path):
+    league = SyntheticLeague(6, str(tmp_path))
+    members = [{"label": "highs", "seed": 0}, {"label": "annealing", "name": "annealing", "seed": 0}]
+    result = run_portfolio(members, target_gap=0.01, time_budget=60, preprocess_kwargs=league.preprocess_kwargs())
+    assert result["stop_reason"] in ("target gap", "all members finished")
+    assert 0 < result["build_time"] < result["wall_time"]
+    dp = DataPreprocess(**league.preprocess_kwargs())
+    # the gap leaves out the travel term, with it any schedule is within the target right away
+    offset = objective_offset(build_model(dp).m)
+    assert result["gap"] == pytest.approx(relative_gap(result["objective"], result["bound"], offset))
+    assert result["gap"] <= 0.01
+    validator = ScheduleValidator.from_preprocess(dp)
+    assert validator.validate(result["chosen_matches"])["feasible"]
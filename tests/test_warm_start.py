@@ -0,0 +1,35 @@
+import pyomo.environ as pe
+import pytest
+
+from main import build_model
+from model.warm_start import WarmStartBuilder
+from schedule_validator import ScheduleValidator
+
+
+@pytest.fixture(scope="module")
+def warm_start(dp):
+    return WarmStartBuilder(dp.teams_range, dp.weeks_range, dp.conflict_home_match_list)
+
+
+def violated_rows(m, tolerance=1e-6):
+    return [constraint.name for constraint in m.component_data_objects(pe.Constraint, active=True)
+            if (constraint.has_lb() and pe.value(constraint.body) < pe.value(constraint.lower) - tolerance)
+            or (constraint.has_ub() and pe.value(constraint.body) > pe.value(constraint.upper) + tolerance)]
+
+
+def test_warm_start_keeps_every_rule(dp, warm_start):
+    assert warm_start.violations == 0
+    assert ScheduleValidator.from_preprocess(dp).validate(warm_start.schedule)["feasible"]
+
+
+@pytest.mark.parametrize("builder_mode", ["rule", "matrix"])
+def test_loaded_warm_start_is_feasible_for_the_model(dp, warm_start, builder_mode):
+    model = build_model(dp, builder_mode=builder_mode)
+    assert WarmStartBuilder.load_into_model(model.m, warm_start.schedule) == 0
+    assert violated_rows(model.m) == []
+
+
+def test_matches_on_forbidden_slots_are_counted(dp, warm_start):
+    forbidden_slots = warm_start.schedule[:2]
+    model = build_model(dp, builder_mode="matrix", forbidden_slots=forbidden_slots)
+    assert WarmStartBuilder.load_into_model(model.m, warm_start.schedule) == len(forbidden_slots)
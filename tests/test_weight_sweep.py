@@ -0,0 +1,32 @@
+from benchmark import SyntheticLeague
+from main import pareto_front, run_weight_sweep
+from model.solver import SolverConfig
+
+
+def scenario(away_trip_travel, attractiveness, label):
+    return {"label": label, "away_trip_travel": away_trip_travel, "attractiveness": attractiveness,
+            "schedule": [] if away_trip_travel is not None else None}
+
+
+def test_pareto_front_keeps_undominated_scenarios():
+    scenarios = [scenario(10.0, -5.0, "best attractiveness"), scenario(4.0, -3.0, "balanced"),
+                 scenario(6.0, -2.0, "dominated"), scenario(2.0, -1.0, "least travel"),
+                 scenario(4.0, -3.0, "duplicate"), scenario(None, None, "unsolved"), scenario(12.0, -5.0, "tie")]
+    assert [scenario["label"] for scenario in pareto_front(scenarios)] == \
+        ["least travel", "balanced", "best attractiveness"]
+
+
+def test_weight_sweep_trades_attractiveness_for_away_trip_travel(tmp_path):
+    preprocess_kwargs = SyntheticLeague(4, str(tmp_path)).preprocess_kwargs()
+    grid = [(0.0, 1.0), (0.001, 1.0), (0.001, 0.0)]
+    scenarios, front = run_weight_sweep(grid, SolverConfig(name="highs", time_limit=60, mip_gap=0.0, threads=1,
+                                                           logfile=None, warm_start=True),
+                                        max_workers=1, preprocess_kwargs=preprocess_kwargs, builder_mode="compact")
+    assert [(scenario["away_trip_weight"], scenario["attractiveness_weight"]) for scenario in scenarios] == grid
+    assert all(scenario["status"] == "optimal" for scenario in scenarios)
+    attractiveness_only, weighted, away_trips_only = scenarios
+    # every optimum is best in the term it weights most
+    assert weighted["away_trip_travel"] <= attractiveness_only["away_trip_travel"] + 1e-6
+    assert away_trips_only["away_trip_travel"] <= weighted["away_trip_travel"] + 1e-6
+    assert attractiveness_only["attractiveness"] <= weighted["attractiveness"] + 1e-6
+    assert front and set(map(id, front)) <= set(map(id, scenarios))